@@ -0,0 +1,83 @@
+"""Latency from a call state change in pjsua to the PJSua callback.
+
+Runs the scripted fake pjsua from the tests with both call state tracking
+modes and reports how long the incoming call and hang up notifications take,
+and how long it takes from accepting a call until it is reported connected.
+
+    python -m benchmarks.bench_call_state_latency
+"""
+import os
+import queue
+import signal
+import statistics
+import time
+from os import path
+
+from fetap import pjsua
+
+FAKE_PJSUA = path.join(path.dirname(path.dirname(__file__)), "tests", "fake_pjsua.py")
+ROUNDS = 20
+
+
+def measure(
+    tracking: pjsua.CallStateTracking,
+) -> tuple[list[float], list[float], list[float]]:
+    events: queue.Queue[tuple[str, float]] = queue.Queue()
+
+    def record(name: str):
+        return lambda: events.put_nowait((name, time.monotonic()))
+
+    client = pjsua.PJSua(
+        on_incoming_call=record("incoming"),
+        on_call_hangup=record("hangup"),
+        on_call_connected=record("connected"),
+        call_state_tracking=tracking,
+        executable=FAKE_PJSUA,
+    )
+    client.start()
+    pid = client._process.pid
+    incoming_latencies = []
+    accept_latencies = []
+    hangup_latencies = []
+    try:
+        for _ in range(ROUNDS):
+            start = time.monotonic()
+            os.kill(pid, signal.SIGUSR1)
+            name, end = events.get(timeout=5)
+            assert name == "incoming", name
+            incoming_latencies.append(end - start)
+
+            start = time.monotonic()
+            client.accept_call()
+            name, end = events.get(timeout=5)
+            assert name == "connected", name
+            accept_latencies.append(end - start)
+
+            start = time.monotonic()
+            os.kill(pid, signal.SIGUSR2)
+            name, end = events.get(timeout=5)
+            assert name == "hangup", name
+            hangup_latencies.append(end - start)
+    finally:
+        client.stop()
+    return incoming_latencies, accept_latencies, hangup_latencies
+
+
+def report(label: str, latencies: list[float]) -> None:
+    print(
+        f"  {label:<10} median {statistics.median(latencies) * 1000:8.2f} ms"
+        f"   max {max(latencies) * 1000:8.2f} ms"
+    )
+
+
+def main() -> None:
+    for tracking in pjsua.CallStateTracking:
+        incoming, accept, hangup = measure(tracking)
+        print(f"{tracking.value}:")
+        report("incoming", incoming)
+        report("accept", accept)
+        report("hangup", hangup)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Mis-dial correction on large directories: find_closest_phone_numbers vs
+PulseIndex (top 5) and BKTree (all numbers within MIN_DISTANCE).
+
+    python -m benchmarks.bench_nearest_number
+"""
+from __future__ import annotations
+import random
+import time
+from typing import Callable
+
+from fetap import error_correction
+
+SIZES = [1_000, 10_000, 100_000]
+QUERIES = 50
+
+
+def random_numbers(size: int) -> list[error_correction.PhoneNumber]:
+    rng = random.Random(size)
+    numbers = {
+        tuple(rng.randrange(10) for _ in range(error_correction.NUMBER_LENGTH))
+        for _ in range(size)
+    }
+    return [error_correction.as_phone_number(n) for n in sorted(numbers)]
+
+
+def misdial(
+    number: error_correction.PhoneNumber, rng: random.Random
+) -> error_correction.PulseCounts:
+    pulses = list(error_correction.to_pulse_counts(number))
+    position = rng.randrange(len(pulses))
+    pulses[position] = max(1, pulses[position] + rng.choice([-1, 1]))
+    return error_correction.as_pulse_counts(pulses)
+
+
+def timed(search: Callable[[error_correction.PulseCounts], object], queries) -> float:
+    start = time.perf_counter()
+    for query in queries:
+        search(query)
+    return (time.perf_counter() - start) / len(queries)
+
+
+def main() -> None:
+    implementations = [("python", False)]
+    if error_correction._np is not None:
+        implementations.append(("numpy", True))
+    else:
+        print("numpy is not installed, only the list based index is measured")
+
+    for size in SIZES:
+        numbers = random_numbers(size)
+        rng = random.Random(0)
+        queries = [misdial(rng.choice(numbers), rng) for _ in range(QUERIES)]
+        print(f"{len(numbers)} numbers:")
+        seconds = timed(
+            lambda q: error_correction.find_closest_phone_numbers(q, numbers), queries
+        )
+        print(f"  {'find_closest_phone_numbers':<28} {seconds * 1000:10.3f} ms")
+        for name, use_numpy in implementations:
+            start = time.perf_counter()
+            index = error_correction.PulseIndex(numbers, use_numpy=use_numpy)
+            build = time.perf_counter() - start
+            seconds = timed(lambda q: index.closest(q, k=5), queries)
+            print(
+                f"  {'PulseIndex ' + name:<28} {seconds * 1000:10.3f} ms"
+                f"   (build {build * 1000:.1f} ms)"
+            )
+        start = time.perf_counter()
+        tree = error_correction.BKTree(numbers)
+        build = time.perf_counter() - start
+        seconds = timed(tree.within, queries)
+        print(
+            f"  {'BKTree':<28} {seconds * 1000:10.3f} ms"
+            f"   (build {build * 1000:.1f} ms)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Lookups and edits on large phone books, JSON vs SQLite.
+
+    python -m benchmarks.bench_phone_book
+"""
+from __future__ import annotations
+import json
+import random
+import tempfile
+import time
+from os import path
+from typing import Callable
+
+from fetap import storage
+
+SIZES = [10_000, 100_000]
+LOOKUPS = 1000
+EDITS = 20
+
+
+def make_entries(size: int) -> dict[str, str]:
+    return {f"{i:07d}": f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(size)}
+
+
+def create_json(directory: str, entries: dict[str, str]) -> storage.PhoneBook:
+    file_path = path.join(directory, "phone_book.json")
+    with open(file_path, "w") as f:
+        json.dump(entries, f, indent=2)
+    return storage.PhoneBook(file_path)
+
+
+def create_sqlite(directory: str, entries: dict[str, str]) -> storage.SqlitePhoneBook:
+    file_path = path.join(directory, "phone_book.sqlite")
+    phone_book = storage.SqlitePhoneBook(file_path)
+    with phone_book._connection as connection:
+        connection.executemany(
+            "INSERT INTO phone_book (number, address) VALUES (?, ?)", entries.items()
+        )
+    return phone_book
+
+
+def timed(function: Callable[[], None], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def measure(phone_book, entries: dict[str, str]) -> dict[str, float]:
+    numbers = list(entries)
+    phone_book.get_address(numbers[0])  # Initial load
+
+    def lookup() -> None:
+        phone_book.get_address(random.choice(numbers))
+
+    new_numbers = iter(range(10_000_000, 20_000_000))
+
+    def insert() -> None:
+        number = str(next(new_numbers))
+        phone_book.insert(number, number)
+
+    def insert_then_lookup() -> None:
+        insert()
+        lookup()
+
+    return {
+        "lookup": timed(lookup, LOOKUPS),
+        "insert": timed(insert, EDITS),
+        "insert+lookup": timed(insert_then_lookup, EDITS),
+    }
+
+
+def main() -> None:
+    for size in SIZES:
+        entries = make_entries(size)
+        for name, create in [("json", create_json), ("sqlite", create_sqlite)]:
+            with tempfile.TemporaryDirectory() as directory:
+                results = measure(create(directory, entries), entries)
+            print(f"{name} {size} entries:")
+            for label, seconds in results.items():
+                print(f"  {label:<14} {seconds * 1000:10.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
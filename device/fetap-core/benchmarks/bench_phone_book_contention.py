@@ -0,0 +1,69 @@
+"""Lookup latency while another process keeps inserting into the phone book.
+
+This is what the phone sees while the config server saves. "locked" takes the
+file lock around every lookup like PhoneBook used to, "lock-free" is the
+current read path.
+
+    python -m benchmarks.bench_phone_book_contention
+"""
+from __future__ import annotations
+import json
+import multiprocessing
+import statistics
+import tempfile
+import time
+from os import path
+
+from fetap import storage
+
+ENTRIES = 2_000
+LOOKUPS = 2_000
+
+
+def hammer_inserts(file_path: str, stop: multiprocessing.Event) -> None:
+    phone_book = storage.PhoneBook(file_path)
+    number = 10_000_000
+    while not stop.is_set():
+        phone_book.insert(str(number), str(number))
+        number += 1
+
+
+def lookup_latencies(phone_book: storage.PhoneBook, locked: bool) -> list[float]:
+    latencies = []
+    for i in range(LOOKUPS):
+        number = f"{i % ENTRIES:07d}"
+        start = time.perf_counter()
+        if locked:
+            with phone_book._file_lock:
+                phone_book.get_address(number)
+        else:
+            phone_book.get_address(number)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = path.join(directory, "phone_book.json")
+        with open(file_path, "w") as f:
+            json.dump({f"{i:07d}": f"address-{i}" for i in range(ENTRIES)}, f)
+
+        stop = multiprocessing.Event()
+        writer = multiprocessing.Process(target=hammer_inserts, args=(file_path, stop))
+        writer.start()
+        try:
+            phone_book = storage.PhoneBook(file_path)
+            for label, locked in [("locked", True), ("lock-free", False)]:
+                latencies = sorted(lookup_latencies(phone_book, locked))
+                p99 = latencies[int(len(latencies) * 0.99)]
+                print(
+                    f"{label:<10} median {statistics.median(latencies) * 1000:8.3f} ms"
+                    f"   p99 {p99 * 1000:8.3f} ms   max {latencies[-1] * 1000:8.3f} ms"
+                )
+        finally:
+            stop.set()
+            writer.join()
+
+
+if __name__ == "__main__":
+    main()
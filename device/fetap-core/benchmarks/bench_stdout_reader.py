@@ -0,0 +1,96 @@
+"""Throughput of the pjsua stdout reader.
+
+Feeds a synthetic multi-megabyte pjsua transcript through the original
+character-by-character reader and through `pjsua._StdoutSplitter`.
+
+    python -m benchmarks.bench_stdout_reader
+"""
+from __future__ import annotations
+import io
+import time
+from typing import Callable
+
+from fetap import pjsua
+
+CHUNK_SIZE = 64 * 1024
+CALL_LIST = (
+    "You have 2 active call(s)\n"
+    "  [0] sip:1234567@192.168.0.17 [CONFIRMED]\n"
+    "  [1] sip:7654321@192.168.0.23 [INCOMING]\n"
+    ">>> "
+)
+LOG_LINE = "12:00:00.000   pjsua_app.c  .......Call 0 state changed to CONFIRMED\n"
+
+
+def make_transcript(size: int) -> str:
+    parts = [">>> "]
+    length = 0
+    while length < size:
+        parts.append(CALL_LIST)
+        parts.append(LOG_LINE)
+        length += len(CALL_LIST) + len(LOG_LINE)
+    return "".join(parts)
+
+
+def old_reader(
+    transcript: str,
+    on_response: Callable[[str], None],
+    on_log_line: Callable[[str], bool] | None = None,
+) -> None:
+    """The reader loop as it was before the splitter, minus the threading"""
+    stdout = io.StringIO(transcript)
+    buffer: list[str] = []
+    line_start = 0
+    while True:
+        char = stdout.read(1)
+        if not char:
+            return
+        buffer.append(char)
+        if on_log_line is not None and char == "\n":
+            if on_log_line("".join(buffer[line_start:])):
+                del buffer[line_start:]
+            line_start = len(buffer)
+            continue
+        if "".join(buffer[-3:]) != ">>>":
+            continue
+        output = "".join(buffer[:-3]).strip()
+        buffer = []
+        line_start = 0
+        on_response(output)
+
+
+def new_reader(
+    transcript: str,
+    on_response: Callable[[str], None],
+    on_log_line: Callable[[str], bool] | None = None,
+) -> None:
+    splitter = pjsua._StdoutSplitter(on_response=on_response, on_log_line=on_log_line)
+    for i in range(0, len(transcript), CHUNK_SIZE):
+        splitter.feed(transcript[i : i + CHUNK_SIZE])
+
+
+def is_log_line(line: str) -> bool:
+    return pjsua._LOG_LINE.match(line) is not None
+
+
+def measure(reader, transcript: str, on_log_line) -> tuple[float, list[str]]:
+    responses: list[str] = []
+    start = time.perf_counter()
+    reader(transcript, responses.append, on_log_line)
+    return time.perf_counter() - start, responses
+
+
+def main() -> None:
+    transcript = make_transcript(4 * 1024 * 1024)
+    megabytes = len(transcript) / 1024 / 1024
+    for label, on_log_line in [("poll", None), ("events", is_log_line)]:
+        old_time, old_responses = measure(old_reader, transcript, on_log_line)
+        new_time, new_responses = measure(new_reader, transcript, on_log_line)
+        assert old_responses == new_responses
+        print(f"{label} ({megabytes:.1f} MiB, {len(new_responses)} responses):")
+        print(f"  old {old_time:8.3f} s  {megabytes / old_time:8.1f} MiB/s")
+        print(f"  new {new_time:8.3f} s  {megabytes / new_time:8.1f} MiB/s")
+
+
+if __name__ == "__main__":
+    main()
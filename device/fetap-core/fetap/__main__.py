@@ -1,3 +1,5 @@
+from typing import Optional
+
 import click
 
 
@@ -8,10 +10,86 @@ def cli() -> None:
 
 
 @cli.command
-def run() -> None:
-    from fetap import main
-
-    main.run()
+@click.option(
+    "--sip-backend",
+    type=click.Choice(["cli", "pjsua2"]),
+    default="cli",
+    envvar="FETAP_SIP_BACKEND",
+)
+@click.option(
+    "--call-state-tracking",
+    type=click.Choice(["events", "poll"]),
+    default="events",
+    envvar="FETAP_CALL_STATE_TRACKING",
+)
+@click.option(
+    "--runtime",
+    type=click.Choice(["threads", "asyncio"]),
+    default="threads",
+    envvar="FETAP_RUNTIME",
+)
+@click.option(
+    "--ring-cadence",
+    default="1,1,3,2",
+    envvar="FETAP_RING_CADENCE",
+    help="Seconds of ringing, seconds of pause, rings per group, extra pause after a group",
+)
+@click.option(
+    "--journal",
+    type=click.Path(dir_okay=False),
+    default=None,
+    envvar="FETAP_JOURNAL",
+    help=(
+        "Keep a journal of handled events in this file, for replay-journal. The"
+        " journal of the previous run is kept with .previous appended"
+    ),
+)
+@click.option(
+    "--latency-port",
+    type=int,
+    default=None,
+    envvar="FETAP_LATENCY_PORT",
+    help="Collect latency histograms and serve them on this localhost port",
+)
+@click.option(
+    "--config-server",
+    type=click.Choice(["thread", "process", "off"]),
+    default="thread",
+    envvar="FETAP_CONFIG_SERVER",
+    help="Serve the settings from a thread of the phone, a separate process or not at all",
+)
+@click.option(
+    "--directory-url",
+    default=None,
+    envvar="FETAP_DIRECTORY_URL",
+    help="Keep the phone book in sync with this fetap_server directory",
+)
+def run(
+    sip_backend: str,
+    call_state_tracking: str,
+    runtime: str,
+    ring_cadence: str,
+    journal: Optional[str],
+    latency_port: Optional[int],
+    config_server: str,
+    directory_url: Optional[str],
+) -> None:
+    from fetap import main, pjsua, ringer
+
+    try:
+        cadence = ringer.RingCadence.parse(ring_cadence)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--ring-cadence")
+    main.run(
+        sip_backend=pjsua.SipBackend(sip_backend),
+        call_state_tracking=pjsua.CallStateTracking(call_state_tracking),
+        runtime=main.Runtime(runtime),
+        ring_cadence=cadence,
+        journal_path=journal,
+        latency_port=latency_port,
+        config_server_mode=main.ConfigServerMode(config_server),
+        directory_url=directory_url,
+    )
 
 
 @cli.command
@@ -64,6 +142,34 @@ def state_graph() -> None:
     dot.write_png("phone.png")
 
 
+@cli.command
+@click.argument("json_path", type=click.Path(exists=True, dir_okay=False))
+@click.argument("sqlite_path", type=click.Path(dir_okay=False))
+def migrate_phone_book(json_path: str, sqlite_path: str) -> None:
+    from fetap import storage
+
+    count = storage.migrate_to_sqlite(json_path, sqlite_path)
+    click.echo(f"Copied {count} entries to {sqlite_path}")
+
+
+@cli.command
+@click.argument("url", envvar="FETAP_DIRECTORY_URL")
+@click.option(
+    "--phone-book",
+    type=click.Path(dir_okay=False),
+    default="phone_book.json",
+    envvar="PHONE_BOOK",
+)
+def sync(url: str, phone_book: str) -> None:
+    """Pull the changes of a fetap_server directory into the phone book once"""
+    from fetap import storage, sync as fetap_sync
+
+    directory_sync = fetap_sync.DirectorySync(
+        storage.open_phone_book(phone_book), url, phone_book + ".sync"
+    )
+    click.echo(f"Applied {directory_sync.sync()} changes")
+
+
 @cli.command
 def hardware_test() -> None:
     from fetap import main
@@ -71,4 +177,41 @@ def hardware_test() -> None:
     main.hardware_test()
 
 
+@cli.command
+@click.argument("output", type=click.Path(dir_okay=False))
+def record_dial(output: str) -> None:
+    """Record the raw dial edges until Ctrl-C, for replaying with fetap.edges.decode"""
+    from fetap import main
+
+    main.record_dial(output)
+
+
+@cli.command
+@click.argument("journal", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--phone-book",
+    type=click.Path(exists=True, dir_okay=False),
+    default="phone_book.json",
+    envvar="PHONE_BOOK",
+)
+def replay_journal(journal: str, phone_book: str) -> None:
+    """Replay a journal copied from a phone and show the event latencies"""
+    from fetap import replay
+
+    if not replay.replay_journal(journal, phone_book):
+        raise SystemExit(1)
+
+
+@cli.command
+@click.option("--port", type=int, default=8001, envvar="FETAP_LATENCY_PORT")
+@click.option("--json", "as_json", is_flag=True, default=False)
+def latency(port: int, as_json: bool) -> None:
+    """Print the latency histograms of a running phone, in microseconds"""
+    import json
+    from fetap import latency as fetap_latency
+
+    summary = fetap_latency.fetch(port)
+    click.echo(json.dumps(summary, indent=2) if as_json else fetap_latency.format_summary(summary))
+
+
 cli()
@@ -0,0 +1,169 @@
+"""Runs the phone on a single asyncio event loop.
+
+GPIO callbacks and the SIP client hand their events to the loop, ringing is a
+task and every state machine transition happens on the loop. The Phone and the
+Events are the same as with the threaded App in fetap.main.
+"""
+from __future__ import annotations
+import asyncio
+import contextlib
+from typing import TYPE_CHECKING, AsyncIterator, Callable, ContextManager, Optional
+
+import logging
+
+from fetap import journal, pjsua, ringer, storage
+from fetap.main import (
+    App,
+    ConfigServerMode,
+    Event,
+    Hardware,
+    Phone,
+    create_config_server,
+    create_directory_sync,
+    log_startup_time,
+)
+
+if TYPE_CHECKING:
+    from fetap import latency
+
+log = logging.getLogger(__name__)
+
+
+def make_callback_for(
+    event: Event, loop: asyncio.AbstractEventLoop, event_queue: asyncio.Queue[Event]
+) -> Callable[..., None]:
+    """Like Event.make_callback_for, but safe to call from any thread"""
+
+    def _callback(*args: object) -> None:
+        loop.call_soon_threadsafe(event_queue.put_nowait, event)
+
+    return _callback
+
+
+class AsyncHardware(Hardware):
+    """Hardware that rings with a task on the event loop instead of a thread"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._ring_task: asyncio.Task | None = None
+
+    def start_ringing(self) -> None:
+        if self._ring_task is not None:
+            return
+        self._ring_task = asyncio.get_running_loop().create_task(ringer.ring_async(self.ringer))
+
+    def stop_ringing(self) -> None:
+        if self._ring_task is None:
+            return
+        self._ring_task.cancel()
+        self._ring_task = None
+
+
+class AsyncApp(App):
+    event_queue: asyncio.Queue[Event]
+
+    _is_hardware_started = False
+    _is_sip_started = False
+
+    async def start_async(self) -> None:
+        loop = asyncio.get_running_loop()
+        hardware, sip = await asyncio.gather(
+            loop.run_in_executor(None, self.hardware.setup),
+            self.pjsua.start_async(),
+            return_exceptions=True,
+        )
+        # One failing leaves the other started, stop needs to know
+        self._is_hardware_started = not isinstance(hardware, BaseException)
+        self._is_sip_started = not isinstance(sip, BaseException)
+        for result in (hardware, sip):
+            if isinstance(result, BaseException):
+                raise result
+
+    def stop(self) -> None:
+        if self._is_hardware_started:
+            self.hardware.cleanup()
+        if self._is_sip_started:
+            self.pjsua.stop()
+
+    async def run_forever_async(self) -> None:
+        while True:
+            await self.handle_next_event_async()
+
+    async def handle_next_event_async(self) -> None:
+        self.handle_event(await self.event_queue.get())
+
+
+@contextlib.asynccontextmanager
+async def create_app(
+    phone_book_path: str = "phone_book.json",
+    sip_backend: pjsua.SipBackend = pjsua.SipBackend.CLI,
+    call_state_tracking: pjsua.CallStateTracking = pjsua.CallStateTracking.EVENTS,
+    ring_cadence: ringer.RingCadence = ringer.RingCadence(),
+    journal_path: Optional[str] = None,
+    latency_port: Optional[int] = None,
+    config_server_mode: ConfigServerMode = ConfigServerMode.THREAD,
+    directory_url: Optional[str] = None,
+) -> AsyncIterator[AsyncApp]:
+    log.debug("Creating AsyncApp")
+    loop = asyncio.get_running_loop()
+    latency_recorder: Optional[latency.Recorder] = None
+    latency_server: ContextManager[None] = contextlib.nullcontext()
+    event_queue: asyncio.Queue[Event] = asyncio.Queue()
+    if latency_port is not None:
+        from fetap import latency
+
+        latency_recorder = latency.Recorder()
+        latency_server = latency.serving(latency_recorder, latency_port)
+        event_queue = latency.AsyncStampedQueue(latency_recorder)
+    pjsua_ = pjsua.create_client(
+        sip_backend,
+        on_incoming_call=make_callback_for(Event.INCOMING_CALL, loop, event_queue),
+        on_call_connected=make_callback_for(Event.CALL_CONNECTED, loop, event_queue),
+        on_call_hangup=make_callback_for(Event.COUNTER_PARTY_HANG_UP, loop, event_queue),
+        call_state_tracking=call_state_tracking,
+    )
+    if latency_recorder is not None:
+        pjsua_ = latency.TimedSipClient(pjsua_, latency_recorder)
+    hardware = AsyncHardware(
+        on_dial_activate=make_callback_for(Event.DIAL_ACTIVATE, loop, event_queue),
+        on_dial_deactivate=make_callback_for(Event.DIAL_DEACTIVATE, loop, event_queue),
+        on_dial_pulse=make_callback_for(Event.DIAL_PULSE, loop, event_queue),
+        on_receiver_down=make_callback_for(Event.RECEIVER_DOWN, loop, event_queue),
+        on_receiver_up=make_callback_for(Event.RECEIVER_UP, loop, event_queue),
+        cadence=ring_cadence,
+    )
+    phone_book = storage.open_phone_book(phone_book_path, watch=True)
+    phone = Phone(pjsua_=pjsua_, phone_book=phone_book, hardware=hardware)
+    config_server = create_config_server(config_server_mode, phone_book_path, phone)
+    directory_sync = create_directory_sync(directory_url, phone_book_path, phone_book)
+
+    with latency_server, journal.open_journal(journal_path) as event_journal:
+        app = AsyncApp(
+            event_queue=event_queue,
+            phone=phone,
+            pjsua_=pjsua_,
+            hardware=hardware,
+            event_journal=event_journal,
+            latency_recorder=latency_recorder,
+        )
+        if config_server is not None:
+            config_server.start()
+        if directory_sync is not None:
+            directory_sync.start()
+        try:
+            try:
+                await app.start_async()
+                yield app
+            finally:
+                app.stop()
+        finally:
+            if config_server is not None:
+                config_server.stop()
+            if directory_sync is not None:
+                directory_sync.stop()
+
+
+async def run_forever(**kwargs) -> None:
+    async with create_app(**kwargs) as app:
+        log_startup_time()
+        await app.run_forever_async()
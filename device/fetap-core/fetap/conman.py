@@ -1,11 +1,21 @@
+import os
 from typing import TYPE_CHECKING
 
 import logging
 
 log = logging.getLogger(__name__)
 
+# "rpi", "gpiod" or "fake", by default RPi.GPIO if it is installed
+GPIO_BACKEND = os.environ.get("FETAP_GPIO_BACKEND", "auto")
+
 if TYPE_CHECKING:
     import fetap.fake_gpio as _gpio
+elif GPIO_BACKEND == "gpiod":
+    import fetap.gpiod_gpio as _gpio
+elif GPIO_BACKEND == "fake":
+    import fetap.fake_gpio as _gpio
+elif GPIO_BACKEND == "rpi":
+    import RPi.GPIO as _gpio
 else:
     try:
         import RPi.GPIO as _gpio
@@ -0,0 +1,289 @@
+"""Capture raw GPIO edges with timestamps and decode the rotary dial from them.
+
+GPIO callbacks only append the time and channel of each edge to a ring buffer,
+so they are done before the next edge can arrive. A decoder thread then
+debounces the edges in software and turns them into dial events. Because the
+decoder only looks at timestamps, recorded sessions can be replayed through it
+offline.
+"""
+from __future__ import annotations
+import enum
+import math
+import threading
+import time
+from typing import Callable, Iterable, NamedTuple, Optional
+
+import logging
+
+from fetap.conman import gpio
+
+log = logging.getLogger(__name__)
+
+# Contacts bounce for a few milliseconds, a pulse lasts about 60 ms
+DEBOUNCE_NS = 10_000_000
+# Rotary dials pulse at about 10 per second, noise is much faster
+MIN_PULSE_PERIOD_NS = 50_000_000
+_CAPACITY = 4096
+# How long the decoder sleeps when nothing is bouncing, only limits stopping
+_IDLE_TIMEOUT = 0.5
+
+
+class Edge(NamedTuple):
+    # time.monotonic_ns() when the edge was seen
+    time_ns: int
+    channel: int
+    # The level read right after the edge, can be off if the pin bounced
+    level: bool
+
+
+class DialEvent(enum.Enum):
+    ACTIVATE = "activate"
+    PULSE = "pulse"
+    DEACTIVATE = "deactivate"
+
+
+class EdgeBuffer:
+    """A fixed size ring buffer of edges, the oldest are overwritten when full"""
+
+    def __init__(self, capacity: int = _CAPACITY) -> None:
+        self.capacity = capacity
+        self._edges: list[Optional[Edge]] = [None] * capacity
+        # Edges ever appended, the next one goes to _written % capacity
+        self._written = 0
+        self._condition = threading.Condition()
+
+    def append(self, edge: Edge) -> None:
+        self.extend([edge])
+
+    def extend(self, edges: Iterable[Edge]) -> None:
+        with self._condition:
+            for edge in edges:
+                self._edges[self._written % self.capacity] = edge
+                self._written += 1
+            self._condition.notify_all()
+
+    def read(
+        self, position: int, timeout: Optional[float] = None
+    ) -> tuple[list[Edge], int, int]:
+        """Edges appended since position, waiting up to timeout for the first.
+
+        Returns the edges, the position to read from next and how many edges
+        were overwritten before they could be read.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._written > position, timeout)
+            oldest = max(position, self._written - self.capacity)
+            edges = [
+                self._edges[i % self.capacity] for i in range(oldest, self._written)
+            ]
+            return edges, self._written, oldest - position  # type: ignore[return-value]
+
+    def contents(self) -> list[Edge]:
+        """Every edge still in the buffer, oldest first"""
+        with self._condition:
+            oldest = max(0, self._written - self.capacity)
+            return [self._edges[i % self.capacity] for i in range(oldest, self._written)]  # type: ignore[misc]
+
+
+class _Cluster(NamedTuple):
+    """Edges on one channel with less than the debounce time between them"""
+    start_ns: int
+    last_ns: int
+    level: bool
+    edges: int
+
+
+class DialDecoder:
+    """Turns edges of the dial pins into DialEvents and pulse counts.
+
+    Edges closer together than debounce_ns are one bouncing transition. The
+    dial active pin changes slowly, so its level after a transition settled can
+    be trusted. The pulse pin changes too fast for that, there every second
+    transition starts a pulse. An even number of edges ends at the level it
+    started from, so that is a spike rather than a transition. A pulse sooner
+    than min_pulse_period_ns after the previous one is noise as well.
+    """
+
+    def __init__(
+        self,
+        active_channel: int,
+        pulse_channel: int,
+        debounce_ns: int = DEBOUNCE_NS,
+        min_pulse_period_ns: int = MIN_PULSE_PERIOD_NS,
+    ) -> None:
+        self.active_channel = active_channel
+        self.pulse_channel = pulse_channel
+        self.debounce_ns = debounce_ns
+        self.min_pulse_period_ns = min_pulse_period_ns
+        # Pulse count of the last time the dial was active
+        self.last_pulses = 0
+        self._pending: dict[int, _Cluster] = {}
+        self._is_active = False
+        self._pulses = 0
+        self._pulse_transitions = 0
+        self._last_pulse_ns = -math.inf
+
+    def feed(self, edge: Edge) -> list[DialEvent]:
+        events = self.settle(edge.time_ns)
+        pending = self._pending.get(edge.channel)
+        if pending is None:
+            self._pending[edge.channel] = _Cluster(edge.time_ns, edge.time_ns, edge.level, 1)
+        else:
+            self._pending[edge.channel] = _Cluster(
+                pending.start_ns, edge.time_ns, edge.level, pending.edges + 1
+            )
+        return events
+
+    def next_settle_ns(self) -> Optional[int]:
+        """When the earliest pending transition settles, if no edge comes first"""
+        if not self._pending:
+            return None
+        return min(cluster.last_ns for cluster in self._pending.values()) + self.debounce_ns
+
+    def settle(self, now_ns: float) -> list[DialEvent]:
+        """Handle the transitions that stopped bouncing before now_ns"""
+        settled = sorted(
+            (cluster.start_ns, channel, cluster)
+            for channel, cluster in self._pending.items()
+            if now_ns - cluster.last_ns >= self.debounce_ns
+        )
+        events = []
+        for _, channel, cluster in settled:
+            del self._pending[channel]
+            event = self._transition(channel, cluster)
+            if event is not None:
+                events.append(event)
+        return events
+
+    def _transition(self, channel: int, cluster: _Cluster) -> Optional[DialEvent]:
+        if channel == self.active_channel:
+            if cluster.level and not self._is_active:
+                self._is_active = True
+                self._pulses = 0
+                self._pulse_transitions = 0
+                return DialEvent.ACTIVATE
+            if not cluster.level and self._is_active:
+                self._is_active = False
+                self.last_pulses = self._pulses
+                return DialEvent.DEACTIVATE
+            return None
+        if channel != self.pulse_channel or not self._is_active:
+            return None
+        if cluster.edges % 2 == 0:
+            return None
+        self._pulse_transitions += 1
+        if self._pulse_transitions % 2 == 0:
+            return None
+        if cluster.start_ns - self._last_pulse_ns < self.min_pulse_period_ns:
+            return None
+        self._last_pulse_ns = cluster.start_ns
+        self._pulses += 1
+        return DialEvent.PULSE
+
+
+def decode(
+    edges: Iterable[Edge], active_channel: int, pulse_channel: int, **kwargs: int
+) -> list[int]:
+    """The pulse counts of the digits dialed in a recorded session"""
+    decoder = DialDecoder(active_channel, pulse_channel, **kwargs)
+    digits = []
+
+    def _collect(events: list[DialEvent]) -> None:
+        if DialEvent.DEACTIVATE in events and decoder.last_pulses:
+            digits.append(decoder.last_pulses)
+
+    for edge in edges:
+        _collect(decoder.feed(edge))
+    _collect(decoder.settle(math.inf))
+    return digits
+
+
+def save_edges(file_path: str, edges: Iterable[Edge]) -> None:
+    with open(file_path, "w") as f:
+        for edge in edges:
+            f.write(f"{edge.time_ns} {edge.channel} {int(edge.level)}\n")
+
+
+def load_edges(file_path: str) -> list[Edge]:
+    with open(file_path) as f:
+        return [
+            Edge(int(time_ns), int(channel), level == "1")
+            for time_ns, channel, level in (line.split() for line in f if line.strip())
+        ]
+
+
+class DialCapture:
+    """Captures the dial pins and calls back with the decoded dial events"""
+
+    def __init__(
+        self,
+        active_channel: int,
+        pulse_channel: int,
+        on_activate: Callable[[], None],
+        on_pulse: Callable[[], None],
+        on_deactivate: Callable[[], None],
+        buffer: Optional[EdgeBuffer] = None,
+    ) -> None:
+        self.buffer = buffer or EdgeBuffer()
+        self.decoder = DialDecoder(active_channel, pulse_channel)
+        self._callbacks = {
+            DialEvent.ACTIVATE: on_activate,
+            DialEvent.PULSE: on_pulse,
+            DialEvent.DEACTIVATE: on_deactivate,
+        }
+        self._should_stop = threading.Event()
+        self._thread = threading.Thread(target=self._decode_loop, daemon=True, name="dial")
+
+    def setup(self) -> None:
+        channels = (self.decoder.active_channel, self.decoder.pulse_channel)
+        # The gpiod backend hands over kernel timestamps, a batch at a time
+        batched = hasattr(gpio, "add_edge_batch_callback")
+        for channel in channels:
+            gpio.setup(channel, gpio.IN, pull_up_down=gpio.PUD_DOWN)
+            if batched:
+                gpio.add_event_detect(channel, gpio.BOTH)
+            else:
+                gpio.add_event_detect(channel, gpio.BOTH, callback=self._on_edge)
+        if batched:
+            gpio.add_edge_batch_callback(self._on_edge_batch)
+        self.start()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._should_stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _on_edge(self, channel: int) -> None:
+        # Take the time first, reading the level can be delayed
+        time_ns = time.monotonic_ns()
+        self.buffer.append(Edge(time_ns, channel, gpio.input(channel) == gpio.HIGH))
+
+    def _on_edge_batch(self, batch: list[tuple[int, int, bool]]) -> None:
+        channels = (self.decoder.active_channel, self.decoder.pulse_channel)
+        self.buffer.extend(
+            Edge(time_ns, channel, rising)
+            for time_ns, channel, rising in batch
+            if channel in channels
+        )
+
+    def _decode_loop(self) -> None:
+        """dial mainloop"""
+        position = 0
+        while not self._should_stop.is_set():
+            settle_ns = self.decoder.next_settle_ns()
+            if settle_ns is None:
+                timeout = _IDLE_TIMEOUT
+            else:
+                timeout = max(0, settle_ns - time.monotonic_ns()) / 1e9
+            edges, position, dropped = self.buffer.read(position, timeout)
+            if dropped:
+                log.warning("Lost %s dial edges, the decoder fell behind", dropped)
+            events = []
+            for edge in edges:
+                events.extend(self.decoder.feed(edge))
+            events.extend(self.decoder.settle(time.monotonic_ns()))
+            for event in events:
+                self._callbacks[event]()
@@ -1,8 +1,14 @@
-from typing import Iterable, NewType, Union
-
+import heapq
+import threading
+from typing import Callable, Collection, Iterable, Iterator, NewType, Optional, Protocol, Sequence, Union
 
 MIN_DISTANCE = 7
 NUMBER_LENGTH = 7
+# Distances per digit stay below 20, so all of them fit in a byte
+_MAX_PULSES = 20
+# Below this a search takes less than a millisecond without numpy, which isn't
+# worth the 75ms of importing it
+NUMPY_MIN_NUMBERS = 1000
 _7_tuple = tuple[int, int, int, int, int, int, int]
 PhoneNumber = NewType("PhoneNumber", _7_tuple)
 PulseCounts = NewType("PulseCounts", _7_tuple)
@@ -60,6 +66,15 @@ def find_closest_phone_numbers(
     ]
 
 
+def _import_numpy():
+    """numpy, or None if it isn't installed"""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
 def _signal_distance(left: PulseCounts, right: PulseCounts) -> int:
     """A measure for how different two pulse counts are.
     
@@ -67,3 +82,281 @@ def _signal_distance(left: PulseCounts, right: PulseCounts) -> int:
     been in the signal.
     """
     return sum(abs(l - r) for l, r in zip(left, right))
+
+
+class PulseIndex:
+    """Finds the phone numbers closest to dialed pulse counts.
+
+    The pulse counts of all numbers are stored once as a matrix with a row per
+    digit position, and a search computes the distances to every number in one
+    batch. With numpy this is a few vector operations on small integers,
+    without it the same is done with plain lists. By default numpy is only
+    used, and imported, for at least NUMPY_MIN_NUMBERS numbers.
+    """
+
+    def __init__(
+        self, numbers: Iterable[PhoneNumber], use_numpy: Optional[bool] = None
+    ) -> None:
+        self.numbers = list(numbers)
+        if use_numpy is None:
+            use_numpy = (
+                len(self.numbers) >= NUMPY_MIN_NUMBERS and _import_numpy() is not None
+            )
+        self._np = _import_numpy() if use_numpy else None
+        if use_numpy and self._np is None:
+            raise RuntimeError("numpy is not installed")
+        self._use_numpy = use_numpy
+        rows = [
+            [number[position] or 10 for number in self.numbers]
+            for position in range(NUMBER_LENGTH)
+        ]
+        if use_numpy:
+            np = self._np
+            self._matrix = np.array(rows, dtype=np.int8).reshape(
+                NUMBER_LENGTH, len(self.numbers)
+            )
+        else:
+            self._rows = rows
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def _distances(self, pulse_counts: PulseCounts) -> tuple[Sequence[int], int]:
+        """Distances to every number, minus an offset that is the same for all.
+
+        Pulse counts above _MAX_PULSES are clipped so the numpy distances fit in
+        a byte. Every number is at most 10 pulses per digit, so clipping adds
+        the same amount to all distances and doesn't change their order.
+
+        Fewer pulse counts than NUMBER_LENGTH are a prefix, only the first
+        digits of the numbers are compared then.
+        """
+        clipped = [min(pulses, _MAX_PULSES) for pulses in pulse_counts]
+        offset = sum(pulses - c for pulses, c in zip(pulse_counts, clipped))
+        if self._use_numpy:
+            np = self._np
+            query = np.array(clipped, dtype=np.int8)[:, None]
+            differences = np.subtract(self._matrix[: len(clipped)], query)
+            np.abs(differences, out=differences)
+            return differences.view(np.uint8).sum(axis=0, dtype=np.uint8), offset
+        tables = [[abs(pulses - count) for count in range(11)] for pulses in clipped]
+        distances = [
+            sum(row)
+            for row in zip(
+                *(
+                    [table[count] for count in row]
+                    for table, row in zip(tables, self._rows)
+                )
+            )
+        ]
+        return distances, offset
+
+    def closest(
+        self,
+        pulse_counts: PulseCounts,
+        k: int = 1,
+        max_distance: Optional[int] = None,
+    ) -> list[tuple[PhoneNumber, int]]:
+        """The k closest numbers with their distance, closest first.
+
+        Numbers at the same distance are in the order they were indexed. Like
+        all searches, this accepts a prefix of pulse counts too.
+        """
+        if k <= 0 or not self.numbers:
+            return []
+        distances, offset = self._distances(pulse_counts)
+        if self._use_numpy:
+            np = self._np
+            # Distances are small integers, so raising a threshold until
+            # enough numbers are below it is cheaper than a partial sort
+            threshold = int(distances.min())
+            candidates = np.flatnonzero(distances <= threshold)
+            while len(candidates) < k and len(candidates) < len(self.numbers):
+                threshold += 1
+                candidates = np.flatnonzero(distances <= threshold)
+            order = np.lexsort((candidates, distances[candidates]))
+            best = [int(i) for i in candidates[order[:k]]]
+        else:
+            best = heapq.nsmallest(k, range(len(distances)), key=distances.__getitem__)
+        return [
+            (self.numbers[i], int(distances[i]) + offset)
+            for i in best
+            if max_distance is None or distances[i] + offset <= max_distance
+        ]
+
+    def within(
+        self, pulse_counts: PulseCounts, max_distance: int = MIN_DISTANCE
+    ) -> list[tuple[PhoneNumber, int]]:
+        """All numbers at most max_distance away, in the order they were indexed"""
+        distances, offset = self._distances(pulse_counts)
+        if self._use_numpy:
+            np = self._np
+            matches = np.flatnonzero(distances <= max_distance - offset)
+            return [(self.numbers[i], int(distances[i]) + offset) for i in matches]
+        return [
+            (number, distance + offset)
+            for number, distance in zip(self.numbers, distances)
+            if distance + offset <= max_distance
+        ]
+
+
+class _BKNode:
+    __slots__ = ("number", "pulse_counts", "children", "is_removed")
+
+    def __init__(self, number: PhoneNumber) -> None:
+        self.number = number
+        self.pulse_counts = to_pulse_counts(number)
+        self.children: dict[int, _BKNode] = {}
+        self.is_removed = False
+
+
+class BKTree:
+    """A metric tree over the pulse counts of phone numbers.
+
+    Every child is filed under its distance to the parent, so by the triangle
+    inequality a radius search only has to descend into children whose
+    distance is within the radius of the query's distance to the parent.
+    Removed numbers stay in the tree as tombstones until they outnumber the
+    live ones, then the tree is rebuilt.
+    """
+
+    def __init__(self, numbers: Iterable[PhoneNumber] = ()) -> None:
+        self._root: Optional[_BKNode] = None
+        self._nodes: dict[PhoneNumber, _BKNode] = {}
+        self._removed = 0
+        for number in numbers:
+            self.insert(number)
+
+    def __len__(self) -> int:
+        return len(self._nodes) - self._removed
+
+    def __contains__(self, number: object) -> bool:
+        node = self._nodes.get(number)  # type: ignore[arg-type]
+        return node is not None and not node.is_removed
+
+    def __iter__(self) -> Iterator[PhoneNumber]:
+        return (number for number, node in self._nodes.items() if not node.is_removed)
+
+    def insert(self, number: PhoneNumber) -> None:
+        node = self._nodes.get(number)
+        if node is not None:
+            if node.is_removed:
+                node.is_removed = False
+                self._removed -= 1
+            return
+        new_node = _BKNode(number)
+        self._nodes[number] = new_node
+        if self._root is None:
+            self._root = new_node
+            return
+        node = self._root
+        while True:
+            distance = _signal_distance(new_node.pulse_counts, node.pulse_counts)
+            child = node.children.get(distance)
+            if child is None:
+                node.children[distance] = new_node
+                return
+            node = child
+
+    def remove(self, number: PhoneNumber) -> None:
+        node = self._nodes.get(number)
+        if node is None or node.is_removed:
+            raise KeyError(number)
+        node.is_removed = True
+        self._removed += 1
+        if self._removed > len(self):
+            self._rebuild()
+
+    def _rebuild(self) -> None:
+        numbers = [number for number, node in self._nodes.items() if not node.is_removed]
+        self._root = None
+        self._nodes = {}
+        self._removed = 0
+        for number in numbers:
+            self.insert(number)
+
+    def within(
+        self, pulse_counts: PulseCounts, max_distance: int = MIN_DISTANCE
+    ) -> list[tuple[PhoneNumber, int]]:
+        """All numbers at most max_distance away, closest first"""
+        matches = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = _signal_distance(pulse_counts, node.pulse_counts)
+            if distance <= max_distance and not node.is_removed:
+                matches.append((node.number, distance))
+            for child_distance, child in node.children.items():
+                if abs(child_distance - distance) <= max_distance:
+                    stack.append(child)
+        matches.sort(key=lambda match: (match[1], match[0]))
+        return matches
+
+    def find_similar_numbers(
+        self, new_number: PhoneNumber, min_distance: int = MIN_DISTANCE
+    ) -> list[tuple[PhoneNumber, int]]:
+        """Like find_similar_numbers, for the numbers in the tree"""
+        return self.within(to_pulse_counts(new_number), 2 * min_distance)
+
+
+class _ObservablePhoneBook(Protocol):
+    def add_change_listener(
+        self, listener: Callable[[Collection[str], Collection[str]], None]
+    ) -> None: ...
+
+
+class NumberIndex:
+    """A BKTree and a PulseIndex over the numbers of a phone book, kept in sync.
+
+    The tree takes every change as it comes, the PulseIndex is rebuilt after
+    each batch of changes, outside of dialing. Numbers in the phone book that
+    aren't valid phone numbers are left out.
+    """
+
+    def __init__(self, phone_book: _ObservablePhoneBook) -> None:
+        self._lock = threading.Lock()
+        self._tree = BKTree()
+        self._pulse_index = PulseIndex([])
+        phone_book.add_change_listener(self._apply_changes)
+
+    def _apply_changes(self, added: Collection[str], removed: Collection[str]) -> None:
+        with self._lock:
+            for number in _valid_numbers(removed):
+                if number in self._tree:
+                    self._tree.remove(number)
+            for number in _valid_numbers(added):
+                self._tree.insert(number)
+            self._pulse_index = PulseIndex(sorted(self._tree))
+
+    def __len__(self) -> int:
+        return len(self._tree)
+
+    def within(
+        self, pulse_counts: PulseCounts, max_distance: int = MIN_DISTANCE
+    ) -> list[tuple[PhoneNumber, int]]:
+        with self._lock:
+            return self._tree.within(pulse_counts, max_distance)
+
+    def find_similar_numbers(
+        self, new_number: PhoneNumber, min_distance: int = MIN_DISTANCE
+    ) -> list[tuple[PhoneNumber, int]]:
+        with self._lock:
+            return self._tree.find_similar_numbers(new_number, min_distance)
+
+    def closest(
+        self,
+        pulse_counts: PulseCounts,
+        k: int = 1,
+        max_distance: Optional[int] = None,
+    ) -> list[tuple[PhoneNumber, int]]:
+        """See PulseIndex.closest, pulse_counts can be a prefix"""
+        # Swapped as a whole on changes, so no lock is needed
+        return self._pulse_index.closest(pulse_counts, k, max_distance)
+
+
+def _valid_numbers(numbers: Iterable[str]) -> Iterable[PhoneNumber]:
+    for number in numbers:
+        try:
+            yield as_phone_number(number)
+        except ValueError:
+            continue
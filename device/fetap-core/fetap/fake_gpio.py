@@ -1,4 +1,6 @@
-from typing import Callable, Literal, NewType, Union
+import collections
+import time
+from typing import Callable, Deque, Literal, NamedTuple, NewType, Optional, Union
 
 
 _BOART_T = NewType("_BOART_T", object)
@@ -63,7 +65,48 @@ def add_event_detect(
 def add_event_callback(channel: int, callback: Callable[[int], None], bouncetime: int) -> None: ...
 
 
-def output(channel: int, value: Union[_HIGH_T, _LOW_T]) -> None: ...
+WAVEFORM_LENGTH = 10_000
+
+
+class WaveformChange(NamedTuple):
+    """An output channel changed at time (time.monotonic)"""
+    time: float
+    channel: int
+    # 0 to 100, outputs are 0 or 100
+    duty_cycle: float
+    # Of the PWM, None for plain outputs
+    frequency: Optional[float]
+
+
+# The latest changes of the outputs, so tests can check the timing. Capped,
+# the fake runs for as long as the phone does without hardware.
+waveform: Deque[WaveformChange] = collections.deque(maxlen=WAVEFORM_LENGTH)
+
+
+def _record(channel: int, duty_cycle: float, frequency: Optional[float]) -> None:
+    waveform.append(WaveformChange(time.monotonic(), channel, duty_cycle, frequency))
+
+
+def output(channel: int, value: Union[_HIGH_T, _LOW_T]) -> None:
+    _record(channel, 100 if value is HIGH else 0, None)
+
+
+class PWM:
+    def __init__(self, channel: int, frequency: float) -> None:
+        self.channel = channel
+        self.frequency = frequency
+
+    def start(self, duty_cycle: float) -> None:
+        _record(self.channel, duty_cycle, self.frequency)
+
+    def ChangeDutyCycle(self, duty_cycle: float) -> None:
+        _record(self.channel, duty_cycle, self.frequency)
+
+    def ChangeFrequency(self, frequency: float) -> None:
+        self.frequency = frequency
+
+    def stop(self) -> None:
+        _record(self.channel, 0, self.frequency)
 
 
 def cleanup() -> None: ...
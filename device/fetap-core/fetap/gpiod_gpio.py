@@ -0,0 +1,252 @@
+"""The part of RPi.GPIO that fetap uses, on the Linux GPIO character device.
+
+Uses libgpiod v2, which works on current Raspberry Pi OS where RPi.GPIO is
+deprecated. Every line is requested on its own. One thread waits on all lines
+with edge detection and reads their events in batches, each with the kernel's
+CLOCK_MONOTONIC timestamp, so it lines up with time.monotonic_ns(). A
+bouncetime is handed to the kernel as the line's debounce period.
+
+There is no PWM, fetap.ringer falls back to ringing in software.
+"""
+from __future__ import annotations
+import datetime
+import os
+import select
+import threading
+from typing import Callable, Optional, Union
+
+import logging
+
+import gpiod
+from gpiod.exception import RequestReleasedError
+from gpiod.line import Bias, Direction, Edge, Value
+
+log = logging.getLogger(__name__)
+
+CHIP_PATH = os.environ.get("FETAP_GPIO_CHIP", "/dev/gpiochip0")
+_CONSUMER = "fetap"
+# Events read from a line at once
+_EVENT_BATCH = 64
+
+BCM = "BCM"
+BOARD = "BOARD"
+IN = "IN"
+OUT = "OUT"
+HIGH = 1
+LOW = 0
+PUD_OFF = "PUD_OFF"
+PUD_UP = "PUD_UP"
+PUD_DOWN = "PUD_DOWN"
+RISING = "RISING"
+FALLING = "FALLING"
+BOTH = "BOTH"
+
+_BIASES = {None: Bias.AS_IS, PUD_OFF: Bias.DISABLED, PUD_UP: Bias.PULL_UP, PUD_DOWN: Bias.PULL_DOWN}
+_EDGES = {RISING: Edge.RISING, FALLING: Edge.FALLING, BOTH: Edge.BOTH}
+
+# The kernel timestamp, the channel and whether the edge was rising
+KernelEdge = tuple[int, int, bool]
+
+
+class _Lines:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.requests: dict[int, gpiod.LineRequest] = {}
+        self.settings: dict[int, gpiod.LineSettings] = {}
+        self.callbacks: dict[int, list[Callable[[int], None]]] = {}
+        self.batch_callbacks: list[Callable[[list[KernelEdge]], None]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._wake_read, self._wake_write = os.pipe()
+
+    def request(self, channel: int, settings: gpiod.LineSettings) -> None:
+        with self._lock:
+            old_request = self.requests.pop(channel, None)
+            if old_request is not None:
+                old_request.release()
+            self.requests[channel] = gpiod.request_lines(
+                CHIP_PATH, consumer=_CONSUMER, config={channel: settings}
+            )
+            self.settings[channel] = settings
+        self._wake()
+
+    def reconfigure(self, channel: int, settings: gpiod.LineSettings) -> None:
+        with self._lock:
+            self.requests[channel].reconfigure_lines({channel: settings})
+            self.settings[channel] = settings
+        self._wake()
+
+    def add_callback(self, channel: int, callback: Callable[[int], None]) -> None:
+        with self._lock:
+            self.callbacks.setdefault(channel, []).append(callback)
+
+    def add_batch_callback(self, callback: Callable[[list[KernelEdge]], None]) -> None:
+        with self._lock:
+            self.batch_callbacks.append(callback)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._event_loop, daemon=True, name="gpiod")
+        self._thread.start()
+
+    def _wake(self) -> None:
+        """Make the event thread pick up changed lines"""
+        os.write(self._wake_write, b"x")
+
+    def _event_loop(self) -> None:
+        """gpiod mainloop"""
+        while True:
+            with self._lock:
+                watched = {
+                    request.fd: (channel, request)
+                    for channel, request in self.requests.items()
+                    if self.settings[channel].edge_detection != Edge.NONE
+                }
+            ready, _, _ = select.select([self._wake_read, *watched], [], [])
+            if self._wake_read in ready:
+                if os.read(self._wake_read, 4096).endswith(b"q"):
+                    return
+            batch = []
+            for fd in ready:
+                if fd not in watched:
+                    continue
+                _, request = watched[fd]
+                try:
+                    events = request.read_edge_events(_EVENT_BATCH)
+                except RequestReleasedError:
+                    # Set up again since the select, the wake up is pending
+                    continue
+                batch.extend(
+                    (
+                        event.timestamp_ns,
+                        event.line_offset,
+                        event.event_type is gpiod.EdgeEvent.Type.RISING_EDGE,
+                    )
+                    for event in events
+                )
+            if batch:
+                self._dispatch(sorted(batch))
+
+    def _dispatch(self, batch: list[KernelEdge]) -> None:
+        with self._lock:
+            batch_callbacks = list(self.batch_callbacks)
+            callbacks = {channel: list(c) for channel, c in self.callbacks.items()}
+        for batch_callback in batch_callbacks:
+            batch_callback(batch)
+        for _, channel, _ in batch:
+            for callback in callbacks.get(channel, []):
+                callback(channel)
+
+    def release(self) -> None:
+        if self._thread is not None:
+            os.write(self._wake_write, b"q")
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            for request in self.requests.values():
+                request.release()
+            self.requests.clear()
+            self.settings.clear()
+            self.callbacks.clear()
+            self.batch_callbacks.clear()
+
+
+_lines = _Lines()
+
+
+def setmode(mode: str) -> None:
+    # Line offsets on the Raspberry Pi's GPIO chip are the BCM numbers
+    if mode != BCM:
+        raise ValueError("Only BCM numbering is supported")
+
+
+def setup(
+    channel: Union[int, list[int]],
+    mode: str,
+    *,
+    initial: Optional[int] = None,
+    pull_up_down: Optional[str] = None,
+) -> None:
+    if isinstance(channel, list):
+        for c in channel:
+            setup(c, mode, initial=initial, pull_up_down=pull_up_down)
+        return
+    if mode == OUT:
+        settings = gpiod.LineSettings(
+            direction=Direction.OUTPUT,
+            output_value=Value.ACTIVE if initial else Value.INACTIVE,
+        )
+    else:
+        settings = gpiod.LineSettings(
+            direction=Direction.INPUT, bias=_BIASES[pull_up_down]
+        )
+    _lines.request(channel, settings)
+
+
+def input(channel: int) -> int:
+    value = _lines.requests[channel].get_value(channel)
+    return HIGH if value == Value.ACTIVE else LOW
+
+
+def output(channel: int, value: int) -> None:
+    _lines.requests[channel].set_value(
+        channel, Value.ACTIVE if value else Value.INACTIVE
+    )
+
+
+def add_event_detect(
+    channel: int,
+    edge: str,
+    callback: Optional[Callable[[int], None]] = None,
+    bouncetime: Optional[int] = None,
+) -> None:
+    settings = _lines.settings[channel]
+    _lines.reconfigure(
+        channel,
+        gpiod.LineSettings(
+            direction=Direction.INPUT,
+            bias=settings.bias,
+            edge_detection=_EDGES[edge],
+            debounce_period=datetime.timedelta(milliseconds=bouncetime or 0),
+        ),
+    )
+    if callback is not None:
+        _lines.add_callback(channel, callback)
+    _lines.start()
+
+
+def add_event_callback(channel: int, callback: Callable[[int], None]) -> None:
+    _lines.add_callback(channel, callback)
+
+
+def add_edge_batch_callback(callback: Callable[[list[KernelEdge]], None]) -> None:
+    """Get the edges of all lines with event detection, a batch at a time.
+
+    Not part of RPi.GPIO. Unlike the per channel callbacks this gives the
+    kernel's timestamp and direction of every edge.
+    """
+    _lines.add_batch_callback(callback)
+
+
+def wait_for_edge(channel: int, edge: str, *, timeout: int = -1) -> Optional[int]:
+    """Wait for an edge on a line without event detection, timeout in ms"""
+    settings = _lines.settings[channel]
+    request = _lines.requests[channel]
+    request.reconfigure_lines(
+        {
+            channel: gpiod.LineSettings(
+                direction=Direction.INPUT, bias=settings.bias, edge_detection=_EDGES[edge]
+            )
+        }
+    )
+    try:
+        if request.wait_edge_events(None if timeout < 0 else timeout / 1000):
+            request.read_edge_events(_EVENT_BATCH)
+            return channel
+        return None
+    finally:
+        request.reconfigure_lines({channel: settings})
+
+
+def cleanup() -> None:
+    _lines.release()
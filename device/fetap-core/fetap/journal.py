@@ -0,0 +1,121 @@
+"""A binary journal of the events the App handled, in a memory mapped file.
+
+The file is a fixed size ring buffer, once it is full the oldest records are
+overwritten. Writing a record only packs a few integers into the mapping, the
+kernel writes it back to the file, so it survives the process crashing. Events
+and states are stored as codes, see fetap.main.JOURNAL_EVENTS and
+fetap.main.JOURNAL_STATES, and fetap.replay turns a journal back into steps.
+
+Timestamps are only comparable within one run of the phone, so every run
+starts a new journal and keeps the one of the previous run next to it, with
+PREVIOUS_SUFFIX appended.
+"""
+from __future__ import annotations
+import contextlib
+import mmap
+import os
+import struct
+from typing import Iterator, NamedTuple, Optional
+
+import logging
+
+log = logging.getLogger(__name__)
+
+CAPACITY = 4096
+PREVIOUS_SUFFIX = ".previous"
+_MAGIC = b"FTJR"
+_VERSION = 1
+# Magic, version, capacity and the number of records ever written
+_HEADER = struct.Struct("<4sB3xIQ")
+# Time, duration, event code, state code
+_RECORD = struct.Struct("<QIBB2x")
+_MAX_DURATION_NS = 2**32 - 1
+
+
+class Record(NamedTuple):
+    # time.monotonic_ns() when handling the event started
+    time_ns: int
+    # How long handling the event took
+    duration_ns: int
+    event: int
+    # The state of the Phone after the event
+    state: int
+
+
+class Journal:
+    def __init__(self, file_path: str, capacity: int = CAPACITY) -> None:
+        self.file_path = file_path
+        self.capacity = capacity
+        size = _HEADER.size + capacity * _RECORD.size
+        fd = os.open(file_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            is_same_size = os.fstat(fd).st_size == size
+            if not is_same_size:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+            self._mmap = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        magic, version, file_capacity, written = _HEADER.unpack_from(self._mmap)
+        if is_same_size and (magic, version, file_capacity) == (_MAGIC, _VERSION, capacity):
+            self._written = written
+        else:
+            if is_same_size:
+                log.warning("Overwriting incompatible journal %s", file_path)
+            self._written = 0
+            _HEADER.pack_into(self._mmap, 0, _MAGIC, _VERSION, capacity, 0)
+
+    @property
+    def dropped(self) -> int:
+        """How many records were overwritten"""
+        return max(0, self._written - self.capacity)
+
+    def append(self, time_ns: int, duration_ns: int, event: int, state: int) -> None:
+        offset = _HEADER.size + (self._written % self.capacity) * _RECORD.size
+        _RECORD.pack_into(
+            self._mmap, offset, time_ns, min(duration_ns, _MAX_DURATION_NS), event, state
+        )
+        self._written += 1
+        # After the record, so a crash in between loses it rather than reading garbage
+        _HEADER.pack_into(self._mmap, 0, _MAGIC, _VERSION, self.capacity, self._written)
+
+    def records(self) -> list[Record]:
+        """Every record still in the journal, oldest first"""
+        return [
+            Record(*_RECORD.unpack_from(self._mmap, _HEADER.size + (i % self.capacity) * _RECORD.size))
+            for i in range(self.dropped, self._written)
+        ]
+
+    def close(self) -> None:
+        self._mmap.close()
+
+
+@contextlib.contextmanager
+def open_journal(file_path: Optional[str]) -> Iterator[Optional[Journal]]:
+    """A new journal at file_path, or None to keep no journal"""
+    if file_path is None:
+        yield None
+        return
+    with contextlib.suppress(FileNotFoundError):
+        # Most likely what's needed after a crash
+        os.replace(file_path, file_path + PREVIOUS_SUFFIX)
+    journal = Journal(file_path)
+    try:
+        yield journal
+    finally:
+        journal.close()
+
+
+def read_journal(file_path: str) -> tuple[list[Record], int]:
+    """The records of a journal file and how many were overwritten before them"""
+    with open(file_path, "rb") as f:
+        data = f.read()
+    magic, version, capacity, written = _HEADER.unpack_from(data)
+    if (magic, version) != (_MAGIC, _VERSION):
+        raise ValueError(f"{file_path} is not a version {_VERSION} journal")
+    dropped = max(0, written - capacity)
+    records = [
+        Record(*_RECORD.unpack_from(data, _HEADER.size + (i % capacity) * _RECORD.size))
+        for i in range(dropped, written)
+    ]
+    return records, dropped
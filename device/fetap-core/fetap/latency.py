@@ -0,0 +1,209 @@
+"""Histograms of how long events take on their way through the App.
+
+Only collected when `fetap run` gets a --latency-port. Then the event queue
+stamps every event when it is put and when it is taken out, the App times the
+state machine callbacks and the SIP client's commands are timed until their
+response. Events are stamped when they are put on the queue, which is right in
+the GPIO or pjsua callback. Dial events are only put once the edges settled,
+see fetap.edges.
+
+The histograms are served as JSON on localhost and `fetap latency` prints them.
+"""
+from __future__ import annotations
+import asyncio
+import contextlib
+import http.server
+import json
+import queue
+import threading
+import time
+import urllib.request
+from concurrent.futures import Future
+from typing import Any, Iterator
+
+import logging
+
+log = logging.getLogger(__name__)
+
+# Values are kept in 32 buckets per power of two, so they are off by at most 3%
+_SUB_BUCKET_BITS = 5
+# About 18 minutes, longer values are counted as this
+_MAX_VALUE_NS = 2**40 - 1
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def _bucket(value_ns: int) -> int:
+    shift = max(0, value_ns.bit_length() - _SUB_BUCKET_BITS - 1)
+    return (shift << _SUB_BUCKET_BITS) + (value_ns >> shift)
+
+
+def _lowest_value(bucket: int) -> int:
+    shift = max(0, (bucket >> _SUB_BUCKET_BITS) - 1)
+    return (bucket - (shift << _SUB_BUCKET_BITS)) << shift
+
+
+class Histogram:
+    """Counts values in logarithmic buckets, like an HdrHistogram"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counts = [0] * (_bucket(_MAX_VALUE_NS) + 1)
+        self.count = 0
+        self.min = _MAX_VALUE_NS
+        self.max = 0
+
+    def record(self, value_ns: int) -> None:
+        value_ns = min(max(0, value_ns), _MAX_VALUE_NS)
+        with self._lock:
+            self._counts[_bucket(value_ns)] += 1
+            self.count += 1
+            self.min = min(self.min, value_ns)
+            self.max = max(self.max, value_ns)
+
+    def percentile(self, percentile: float) -> int:
+        """The value that percentile percent of the values are at or below"""
+        with self._lock:
+            threshold = percentile / 100 * self.count
+            seen = 0
+            for bucket, count in enumerate(self._counts):
+                seen += count
+                if count and seen >= threshold:
+                    return min(_lowest_value(bucket + 1) - 1, self.max)
+            return self.max
+
+    def summary(self) -> dict[str, int]:
+        summary = {"count": self.count, "min": self.min if self.count else 0, "max": self.max}
+        for percentile in PERCENTILES:
+            summary[f"p{percentile:g}"] = self.percentile(percentile)
+        return summary
+
+
+class Recorder:
+    """Histograms by name, created when something is first recorded"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._histograms: dict[str, Histogram] = {}
+
+    def record(self, name: str, value_ns: int) -> None:
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram())
+        histogram.record(value_ns)
+
+    def summary(self) -> dict[str, dict[str, int]]:
+        with self._lock:
+            histograms = dict(self._histograms)
+        return {name: histograms[name].summary() for name in sorted(histograms)}
+
+
+class _StampedQueueMixin:
+    """Keeps the time each item was put alongside it.
+
+    Only one consumer may take items out, it finds the time the last item was
+    put in last_put_ns.
+    """
+
+    recorder: Recorder
+    last_put_ns = 0
+
+    def _put(self, item: Any) -> None:
+        super()._put((item, time.monotonic_ns()))  # type: ignore[misc]
+
+    def _get(self) -> Any:
+        item, put_ns = super()._get()  # type: ignore[misc]
+        self.last_put_ns = put_ns
+        self.recorder.record(f"queue {item.name}", time.monotonic_ns() - put_ns)
+        return item
+
+
+class StampedQueue(_StampedQueueMixin, queue.Queue):
+    def __init__(self, recorder: Recorder) -> None:
+        super().__init__()
+        self.recorder = recorder
+
+
+class AsyncStampedQueue(_StampedQueueMixin, asyncio.Queue):
+    def __init__(self, recorder: Recorder) -> None:
+        super().__init__()
+        self.recorder = recorder
+
+
+class TimedSipClient:
+    """Wraps a SipClient and times its commands until they are answered"""
+
+    def __init__(self, client: Any, recorder: Recorder) -> None:
+        self._client = client
+        self._recorder = recorder
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+    def _timed(self, name: str, future: Future) -> Future:
+        start_ns = time.monotonic_ns()
+        future.add_done_callback(
+            lambda _: self._recorder.record(f"sip {name}", time.monotonic_ns() - start_ns)
+        )
+        return future
+
+    def call(self, address: str) -> Future:
+        return self._timed("call", self._client.call(address))
+
+    def accept_call(self) -> Future:
+        return self._timed("accept_call", self._client.accept_call())
+
+    def hangup_all(self) -> Future:
+        return self._timed("hangup_all", self._client.hangup_all())
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    recorder: Recorder
+
+    def do_GET(self) -> None:
+        if self.path != "/latency":
+            self.send_error(404)
+            return
+        body = json.dumps(self.recorder.summary()).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        log.debug(format, *args)
+
+
+@contextlib.contextmanager
+def serving(recorder: Recorder, port: int) -> Iterator[None]:
+    """Serve the histograms on localhost"""
+    handler = type("Handler", (_Handler,), {"recorder": recorder})
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True, name="latency")
+    thread.start()
+    log.info("Serving latency histograms on http://127.0.0.1:%s/latency", port)
+    try:
+        yield
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def fetch(port: int) -> dict[str, dict[str, int]]:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/latency", timeout=5) as response:
+        return json.load(response)
+
+
+def format_summary(summary: dict[str, dict[str, int]]) -> str:
+    """A table of the histograms, in microseconds"""
+    columns = ["count", "min", *(f"p{p:g}" for p in PERCENTILES), "max"]
+    width = max([len(name) for name in summary] + [5])
+    lines = [f"{'stage':<{width}}" + "".join(f"{c:>10}" for c in columns)]
+    for name, histogram in summary.items():
+        values = [
+            str(histogram[c]) if c == "count" else f"{histogram[c] / 1e3:.0f}"
+            for c in columns
+        ]
+        lines.append(f"{name:<{width}}" + "".join(f"{v:>10}" for v in values))
+    return "\n".join(lines)
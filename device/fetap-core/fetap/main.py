@@ -3,19 +3,22 @@ import contextlib
 
 import enum
 import os
-import signal
 import subprocess
 import sys
 import threading
 import time
-from typing import Callable, Iterable, Protocol
+from typing import TYPE_CHECKING, Callable, ContextManager, Iterable, Optional, Protocol
 from statemachine import StateMachine, State
 from statemachine.exceptions import TransitionNotAllowed
 import queue
 
 import logging
 
-from fetap import storage
+from fetap import edges, error_correction, journal, process_table, ringer, startup, storage
+
+if TYPE_CHECKING:
+    from werkzeug.serving import BaseWSGIServer
+    from fetap import latency, sync
 
 log = logging.getLogger(__name__)
 
@@ -23,44 +26,93 @@ from fetap.conman import gpio
 from fetap import pjsua
 
 
-def run() -> None:
+class Runtime(enum.Enum):
+    # Hardware, pjsua and the App each run on their own threads
+    THREADS = "threads"
+    # Everything feeds into one asyncio event loop, see fetap.async_app
+    ASYNCIO = "asyncio"
+
+
+class ConfigServerMode(enum.Enum):
+    # On a thread of the phone's process, sharing its phone book
+    THREAD = "thread"
+    # A separate flask process with its own instance of the phone book
+    PROCESS = "process"
+    OFF = "off"
+
+
+CONFIG_SERVER_PORT = 8000
+# How long stopping waits for steps that are still starting, in seconds
+STOP_TIMEOUT = 10
+
+
+def run(
+    sip_backend: pjsua.SipBackend = pjsua.SipBackend.CLI,
+    call_state_tracking: pjsua.CallStateTracking = pjsua.CallStateTracking.EVENTS,
+    runtime: Runtime = Runtime.THREADS,
+    ring_cadence: ringer.RingCadence = ringer.RingCadence(),
+    journal_path: Optional[str] = None,
+    latency_port: Optional[int] = None,
+    config_server_mode: ConfigServerMode = ConfigServerMode.THREAD,
+    directory_url: Optional[str] = None,
+) -> None:
     from fetap import logging as fetap_logging
 
     fetap_logging.configure()
 
-    kill_zombies()
-
     os.environ["ALSA_CARD"] = "Device"
-    with create_app() as app:
+    if runtime is Runtime.ASYNCIO:
+        import asyncio
+        from fetap import async_app
+
+        kill_zombies()
+        asyncio.run(
+            async_app.run_forever(
+                sip_backend=sip_backend,
+                call_state_tracking=call_state_tracking,
+                ring_cadence=ring_cadence,
+                journal_path=journal_path,
+                latency_port=latency_port,
+                config_server_mode=config_server_mode,
+                directory_url=directory_url,
+            )
+        )
+        return
+    with create_app(
+        sip_backend=sip_backend,
+        call_state_tracking=call_state_tracking,
+        ring_cadence=ring_cadence,
+        journal_path=journal_path,
+        latency_port=latency_port,
+        config_server_mode=config_server_mode,
+        directory_url=directory_url,
+    ) as app:
+        log_startup_time()
         app.run_forever()
 
 
-def kill_zombies(attempts: int = 3, delay: float = 3) -> bool:
-    my_pid = os.getpid()
-    parent_pid = os.getppid()
+def log_startup_time() -> None:
+    """Log how long it took from starting the process until the phone is ready"""
+    try:
+        with open("/proc/self/stat") as f:
+            # The process name in parentheses can contain spaces, start after it
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except OSError:
+        return
+    log.info("Ready %.2fs after the process started", uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+
+
+def kill_zombies(timeout: float = 3) -> bool:
+    """Stop other instances of fetap, returns whether they all exited"""
     install_dir = os.path.dirname(os.path.dirname(os.path.dirname(sys.executable)))
-    for i in reversed(range(attempts)):
-        result = subprocess.run(
-            ["ps", "-eo", "pid,args"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-        )
-        found_zombie = False
-        for line in result.stdout.splitlines():
-            pid_s, command = line.strip().split(" ", 1)
-            if not command.strip().startswith(install_dir):
-                continue
-            pid = int(pid_s.strip())
-            if pid in (parent_pid, my_pid):
-                continue
-            log.info("Killing zombie (%s)", pid)
-            os.kill(pid, signal.SIGTERM if i > 0 else signal.SIGKILL)
-            found_zombie = True
-        if not found_zombie:
-            log.info("Killed all zombies!")
-            return
-        time.sleep(delay)
+    if process_table.terminate(
+        install_dir, exclude=(os.getpid(), os.getppid()), timeout=timeout
+    ):
+        log.info("Killed all zombies!")
+        return True
+    return False
 
 
 def noop() -> None:
@@ -87,33 +139,48 @@ class Phone(StateMachine):
     counter_party_hang_up = in_call.to(disconnected) | ringing.to(idle) | connecting.to(disconnected)
     activate_dial = awaiting_dial_input.to(dial_active)
     deactivate_dial = dial_active.to(
-        awaiting_dial_input, unless="is_last_digit"
-    ) | dial_active.to(connecting, cond="is_last_digit")
+        awaiting_dial_input, unless="is_number_complete"
+    ) | dial_active.to(connecting, cond="is_number_complete")
     call_connected = connecting.to(in_call)
     dial_pulse = dial_active.to(dial_active, internal=True)
     call_received = idle.to(ringing)
 
     def __init__(
-        self, pjsua_: pjsua.PJSua, phone_book: storage.PhoneBook, hardware: Hardware, number_length: int = 6,
+        self,
+        pjsua_: pjsua.SipClient,
+        phone_book: storage.PhoneBook,
+        hardware: Hardware,
+        number_length: int = error_correction.NUMBER_LENGTH,
     ):
         self.current_dial_digit = 10
+        self.current_pulses = 0
         self.dialed_number = ""
+        # What was actually dialed, for correcting miscounted pulses
+        self.dialed_pulses: list[int] = []
         self.number_length = number_length
         self.pjsua = pjsua_
         self.phone_book = phone_book
+        self.number_index = error_correction.NumberIndex(phone_book)
         self.hardware = hardware
         self._is_initial = True
         super().__init__()
 
     def on_enter_dial_active(self) -> None:
         self.current_dial_digit = 10
+        self.current_pulses = 0
 
     def on_enter_in_call(self) -> None:
         self.pjsua.accept_call()
 
     def on_enter_connecting(self) -> None:
+        number = self._find_number(self.dialed_number, self.dialed_pulses)
+        if number is None:
+            log.info("No number matches %s", self.dialed_number)
+            return
+        if number != self.dialed_number:
+            log.info("Correcting %s to %s", self.dialed_number, number)
         try:
-            address = self.phone_book.get_address(self.dialed_number)
+            address = self.phone_book.get_address(number)
         except storage.NumberDoesNotExist:
             return
         log.info("Placing call to %s", address)
@@ -122,14 +189,58 @@ class Phone(StateMachine):
     def after_dial_pulse(self) -> None:
         self.current_dial_digit += 1
         self.current_dial_digit %= 10
+        self.current_pulses += 1
 
     def on_exit_dial_active(self) -> None:
-        if self.current_dial_digit == 10:
+        if self.current_pulses == 0:
             return
         self.dialed_number += str(self.current_dial_digit)
+        self.dialed_pulses.append(self.current_pulses)
 
     def after_receiver_down(self) -> None:
         self.dialed_number = ""
+        self.dialed_pulses = []
+
+    def _find_number(self, number: str, pulses: list[int]) -> str | None:
+        """The number in the phone book that was meant, if it is clear which.
+
+        A prefix is enough if it is a number and no other number starts with
+        it. A number that was dialed completely is corrected to the closest
+        number within MIN_DISTANCE, a prefix never is, a few pulses are within
+        MIN_DISTANCE of too many numbers.
+        """
+        starting_with = self.phone_book.numbers_with_prefix(number, limit=2)
+        if starting_with == [number]:
+            return number
+        if len(number) < self.number_length:
+            return None
+        if number in starting_with:
+            return number
+        if len(pulses) != self.number_length:
+            return None
+        matches = self.number_index.closest(
+            error_correction.PulseCounts(tuple(pulses)),
+            k=2,
+            max_distance=error_correction.MIN_DISTANCE,
+        )
+        # Numbers are further apart than that, unless added before the config
+        # server checked, so don't guess between them
+        is_clear = len(matches) == 1 or (
+            len(matches) == 2 and matches[0][1] < matches[1][1]
+        )
+        if not is_clear:
+            return None
+        return "".join(str(digit) for digit in matches[0][0])
+
+    def is_number_complete(self) -> bool:
+        # Conditions are checked before on_exit_dial_active, so the digit that
+        # was just dialed isn't part of dialed_number yet
+        if self.current_pulses == 0:
+            return False
+        number = self.dialed_number + str(self.current_dial_digit)
+        if len(number) >= self.number_length:
+            return True
+        return self._find_number(number, self.dialed_pulses + [self.current_pulses]) is not None
 
     def on_exit_in_call(self) -> None:
         self.pjsua.hangup_all()
@@ -140,9 +251,6 @@ class Phone(StateMachine):
             return
         self.pjsua.hangup_all()
 
-    def is_last_digit(self) -> bool:
-        return len(self.dialed_number) == self.number_length
-    
     def on_enter_ringing(self) -> None:
         self.hardware.start_ringing()
 
@@ -176,6 +284,13 @@ class Event(_Event, enum.Enum):
         return _callback
 
 
+# The codes of events and states in a journal
+JOURNAL_EVENTS = list(Event)
+JOURNAL_STATES = [state.id for state in Phone.states]
+_EVENT_CODES = {event: code for code, event in enumerate(JOURNAL_EVENTS)}
+_STATE_CODES = {state: code for code, state in enumerate(JOURNAL_STATES)}
+
+
 class HardwareProtocol(Protocol):
     def setup(self) -> None: ...
     def cleanup(self) -> None: ...
@@ -195,12 +310,21 @@ class Hardware:
         on_dial_activate: Callable[[], None] = noop,
         on_dial_deactivate: Callable[[], None] = noop,
         on_dial_pulse: Callable[[], None] = noop,
+        cadence: ringer.RingCadence = ringer.RingCadence(),
     ) -> None:
         self.on_receiver_down = on_receiver_down
         self.on_receiver_up = on_receiver_up
         self.on_dial_activate = on_dial_activate
         self.on_dial_deactivate = on_dial_deactivate
         self.on_dial_pulse = on_dial_pulse
+        self.ringer = ringer.create_ringer(self.PIN_RING, cadence)
+        self.dial_capture = edges.DialCapture(
+            self.PIN_DIAL_ACTIVE,
+            self.PIN_DIAL_PULSE,
+            on_activate=on_dial_activate,
+            on_pulse=on_dial_pulse,
+            on_deactivate=on_dial_deactivate,
+        )
         self._stop_ringing_event = threading.Event()
         self._ring_thread: threading.Thread | None = None
 
@@ -211,65 +335,36 @@ class Hardware:
         gpio.add_event_detect(self.PIN_RECEIVER, gpio.BOTH, bouncetime=50)
         gpio.add_event_callback(self.PIN_RECEIVER, self.on_receiver_toggle)
 
-        gpio.setup(self.PIN_DIAL_ACTIVE, gpio.IN, pull_up_down=gpio.PUD_DOWN)
-        gpio.add_event_detect(self.PIN_DIAL_ACTIVE, gpio.BOTH, bouncetime=100)
-        gpio.add_event_callback(self.PIN_DIAL_ACTIVE, self.on_dial_active_toggle)
-
-        gpio.setup(self.PIN_DIAL_PULSE, gpio.IN, pull_up_down=gpio.PUD_DOWN)
-        gpio.add_event_detect(self.PIN_DIAL_PULSE, gpio.FALLING, bouncetime=40)
-        gpio.add_event_callback(self.PIN_DIAL_PULSE, self.on_dial_pulse)
+        # No bouncetime, the dial is debounced from the edge timestamps
+        self.dial_capture.setup()
 
         gpio.setup(self.PIN_RING, gpio.OUT, initial=gpio.LOW)
+        self.ringer.setup()
 
     def cleanup(self) -> None:
+        self.dial_capture.stop()
         gpio.cleanup()
 
-    def on_dial_active_toggle(self, chanel: int) -> None:
+    def on_receiver_toggle(self, chanel: int) -> None:
         # This is error prone, because the is executed slightly
         # after the edge was detected. This means that at this point
         # the event may have re-triggered. This most likely doesn't matter
         # because the timings aren't super tight on those old phones.
-        if gpio.input(chanel) == gpio.HIGH:
-            self.on_dial_activate()
-        else:
-            self.on_dial_deactivate()
-
-    def on_dial_pulse(self, chanel: int) -> None:
-        self.on_dial_pulse()
-
-    def on_receiver_toggle(self, chanel: int) -> None:
-        # See comment on on_dial_active_toggle
         if gpio.input(chanel) == gpio.HIGH:
             self.on_receiver_up()
         else:
             self.on_receiver_down()
 
-    def _ring(
-        self,
-        on_time: float = 0.01,
-        off_time: float = 0.01,
-        ring_time: float = 1,
-        pause_time: float = 1,
-        n: int = 3,
-        long_pause_time: float = 2,
-    ) -> None:
-        while not self._stop_ringing_event.is_set():
-            for _ in range(n):
-                for _ in range(int(ring_time / (on_time + off_time))):
-                    gpio.output(self.PIN_RING, gpio.HIGH)
-                    time.sleep(on_time)
-                    gpio.output(self.PIN_RING, gpio.LOW)
-                    time.sleep(off_time)
-                    if self._stop_ringing_event.is_set():
-                        return
-                time.sleep(pause_time * (not self._stop_ringing_event.is_set()))
-            time.sleep(long_pause_time * (not self._stop_ringing_event.is_set()))
-
     def start_ringing(self) -> None:
         if self._ring_thread is not None:
             return
         self._stop_ringing_event = threading.Event()
-        self._ring_thread = threading.Thread(target=self._ring, name="ring", daemon=True)
+        self._ring_thread = threading.Thread(
+            target=ringer.ring,
+            args=(self.ringer, self._stop_ringing_event),
+            name="ring",
+            daemon=True,
+        )
         self._ring_thread.start()
 
     def stop_ringing(self) -> None:
@@ -285,101 +380,261 @@ class App:
         self,
         event_queue: queue.Queue[Event],
         phone: Phone,
-        pjsua_: pjsua.PJSua,
+        pjsua_: pjsua.SipClient,
         hardware: Hardware,
+        event_journal: Optional[journal.Journal] = None,
+        latency_recorder: Optional[latency.Recorder] = None,
+        startup_: Optional[startup.Startup] = None,
     ) -> None:
         self.event_queue = event_queue
         self.phone = phone
         self.pjsua = pjsua_
         self.hardware = hardware
+        self.event_journal = event_journal
+        # Needs a stamped event_queue
+        self.latency_recorder = latency_recorder
+        if startup_ is None:
+            startup_ = startup.Startup()
+            startup_.add("hardware", hardware.setup)
+            startup_.add("sip", pjsua_.start)
+        # Needs at least the steps "hardware" and "sip"
+        self.startup = startup_
 
     def start(self) -> None:
-        self.hardware.setup()
-        self.pjsua.start()
+        """Start everything, return once events from the hardware can be handled"""
+        self.startup.start()
+        self.startup.wait("hardware")
 
     def stop(self) -> None:
-        self.hardware.cleanup()
-        self.pjsua.stop()
+        # A step that is still starting would be left running
+        if not self.startup.wait_finished(STOP_TIMEOUT):
+            log.warning("Stopping before all steps finished starting")
+        if self.startup.is_ready("hardware"):
+            self.hardware.cleanup()
+        if self.startup.is_ready("sip"):
+            self.pjsua.stop()
 
     def run_forever(self) -> None:
         while True:
             self.handle_next_event()
 
     def handle_next_event(self) -> None:
-        event = self.event_queue.get()
-        log.debug(f"Hardware event: {event.name}")
+        self.handle_event(self.event_queue.get())
+
+    def handle_event(self, event: Event) -> None:
+        start_ns = time.monotonic_ns()
+        log.debug("Hardware event: %s", event.name)
         try:
             event.callback(self.phone)
         except TransitionNotAllowed:
             log.debug(
-                f"Transition {event.name} is not allowed in {self.phone.current_state.name}, skipping"
+                "Transition %s is not allowed in %s, skipping",
+                event.name,
+                self.phone.current_state.name,
+            )
+        except startup.StepFailed:
+            log.exception("Can't handle %s, SIP failed to start", event.name)
+            # As if the call ended, so hanging up gets the phone back to idle
+            try:
+                self.phone.counter_party_hang_up()
+            except TransitionNotAllowed:
+                pass
+        end_ns = time.monotonic_ns()
+        if self.event_journal is not None:
+            self.event_journal.append(
+                start_ns,
+                end_ns - start_ns,
+                _EVENT_CODES[event],
+                _STATE_CODES[self.phone.current_state.id],
+            )
+        if self.latency_recorder is not None:
+            transition = f"{event.name} -> {self.phone.current_state.id}"
+            self.latency_recorder.record(f"handle {transition}", end_ns - start_ns)
+            self.latency_recorder.record(
+                f"total {transition}", end_ns - self.event_queue.last_put_ns
             )
 
 
-@contextlib.contextmanager
-def config_server(phone_book_path: str) -> Iterable[None]:
-    command = [
-        sys.executable,
-        "-m",
-        "flask",
-        "--app",
-        "fetap.web_server",
-        "run",
-        "--host=0.0.0.0",
-        "--port=8000",
-    ]
-    log.info("Starting settings server with '%s'", " ".join(command))
-    subprocess.Popen(command, env={"PHONE_BOOK": phone_book_path})
-    try:
-        yield
-    finally:
-        pass
+class ConfigServer(Protocol):
+    def start(self) -> None: ...
+    def stop(self) -> None: ...
+
+
+class ProcessConfigServer:
+    def __init__(self, phone_book_path: str, port: int = CONFIG_SERVER_PORT) -> None:
+        self.phone_book_path = phone_book_path
+        self.port = port
+        self._process: subprocess.Popen | None = None
+
+    def start(self) -> None:
+        command = [
+            sys.executable,
+            "-m",
+            "flask",
+            "--app",
+            "fetap.web_server",
+            "run",
+            "--host=0.0.0.0",
+            f"--port={self.port}",
+        ]
+        log.info("Starting settings server with '%s'", " ".join(command))
+        self._process = subprocess.Popen(command, env={"PHONE_BOOK": self.phone_book_path})
+
+    def stop(self) -> None:
+        if self._process is not None:
+            self._process.terminate()
+
+
+class ThreadedConfigServer:
+    """Serves the settings from a thread, on the phone's own phone book"""
+
+    def __init__(
+        self,
+        phone_book: storage.PhoneBook,
+        number_index: error_correction.NumberIndex,
+        port: int = CONFIG_SERVER_PORT,
+    ) -> None:
+        self.phone_book = phone_book
+        self.number_index = number_index
+        self.port = port
+        self._server: BaseWSGIServer | None = None
+
+    def start(self) -> None:
+        # Only import flask when the server is used
+        from werkzeug.serving import make_server
+        from fetap import web_server
+
+        app = web_server.create_app(self.phone_book, self.number_index)
+        self._server = make_server("0.0.0.0", self.port, app, threaded=True)
+        log.info("Serving settings on port %s", self.port)
+        threading.Thread(
+            target=self._server.serve_forever, daemon=True, name="config-server"
+        ).start()
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def create_config_server(
+    mode: ConfigServerMode, phone_book_path: str, phone: Phone
+) -> Optional[ConfigServer]:
+    if mode is ConfigServerMode.THREAD:
+        return ThreadedConfigServer(phone.phone_book, phone.number_index)
+    if mode is ConfigServerMode.PROCESS:
+        return ProcessConfigServer(phone_book_path)
+    return None
 
 
 @contextlib.contextmanager
 def phone_app(
     event_queue: queue.Queue[Event],
     phone: Phone,
-    pjsua_: pjsua.PJSua,
+    pjsua_: pjsua.SipClient,
     hardware: Hardware,
+    event_journal: Optional[journal.Journal] = None,
+    latency_recorder: Optional[latency.Recorder] = None,
+    startup_: Optional[startup.Startup] = None,
 ) -> Iterable[App]:
     app = App(
         event_queue=event_queue,
         phone=phone,
         pjsua_=pjsua_,
         hardware=hardware,
+        event_journal=event_journal,
+        latency_recorder=latency_recorder,
+        startup_=startup_,
     )
-    app.start()
-
     try:
+        app.start()
         yield app
     finally:
         app.stop()
 
 
+def create_directory_sync(
+    url: Optional[str], phone_book_path: str, phone_book: storage.PhoneBook
+) -> Optional[sync.DirectorySync]:
+    if url is None:
+        return None
+    # Only import urllib.request when syncing
+    from fetap import sync
+
+    return sync.DirectorySync(phone_book, url, phone_book_path + ".sync")
+
+
 @contextlib.contextmanager
-def create_app(phone_book_path: str = "phone_book.json") -> Iterable[App]:
+def create_app(
+    phone_book_path: str = "phone_book.json",
+    sip_backend: pjsua.SipBackend = pjsua.SipBackend.CLI,
+    call_state_tracking: pjsua.CallStateTracking = pjsua.CallStateTracking.EVENTS,
+    ring_cadence: ringer.RingCadence = ringer.RingCadence(),
+    journal_path: Optional[str] = None,
+    latency_port: Optional[int] = None,
+    config_server_mode: ConfigServerMode = ConfigServerMode.THREAD,
+    directory_url: Optional[str] = None,
+) -> Iterable[App]:
     log.debug("Creating App")
+    latency_recorder: Optional[latency.Recorder] = None
+    latency_server: ContextManager[None] = contextlib.nullcontext()
     event_queue: queue.Queue[Event] = queue.Queue()
-    pjsua_ = pjsua.PJSua(
+    if latency_port is not None:
+        from fetap import latency
+
+        latency_recorder = latency.Recorder()
+        latency_server = latency.serving(latency_recorder, latency_port)
+        event_queue = latency.StampedQueue(latency_recorder)
+    pjsua_ = pjsua.create_client(
+        sip_backend,
         on_incoming_call=Event.INCOMING_CALL.make_callback_for(event_queue),
         on_call_connected=Event.CALL_CONNECTED.make_callback_for(event_queue),
         on_call_hangup=Event.COUNTER_PARTY_HANG_UP.make_callback_for(event_queue),
+        call_state_tracking=call_state_tracking,
     )
+    if latency_recorder is not None:
+        pjsua_ = latency.TimedSipClient(pjsua_, latency_recorder)
     hardware = Hardware(
         on_dial_activate=Event.DIAL_ACTIVATE.make_callback_for(event_queue),
         on_dial_deactivate=Event.DIAL_DEACTIVATE.make_callback_for(event_queue),
         on_dial_pulse=Event.DIAL_PULSE.make_callback_for(event_queue),
         on_receiver_down=Event.RECEIVER_DOWN.make_callback_for(event_queue),
         on_receiver_up=Event.RECEIVER_UP.make_callback_for(event_queue),
+        cadence=ring_cadence,
+    )
+    startup_ = startup.Startup()
+    phone_book = storage.open_phone_book(phone_book_path, watch=True)
+    phone: Phone = Phone(
+        pjsua_=startup.DeferredSipClient(pjsua_, startup_),
+        phone_book=phone_book,
+        hardware=hardware,
     )
-    phone_book = storage.PhoneBook(file_path=phone_book_path)
-    phone: Phone = Phone(pjsua_=pjsua_, phone_book=phone_book, hardware=hardware)
+    config_server = create_config_server(config_server_mode, phone_book_path, phone)
+    directory_sync = create_directory_sync(directory_url, phone_book_path, phone_book)
+
+    # Old instances hold on to the GPIO pins and the ports
+    startup_.add("zombies", kill_zombies)
+    startup_.add("hardware", hardware.setup, after=["zombies"])
+    if sip_backend is pjsua.SipBackend.CLI:
+        startup_.add("pjsua_binary", pjsua.ensure_pjsua)
+        startup_.add("sip", pjsua_.start, after=["zombies", "pjsua_binary"])
+    else:
+        startup_.add("sip", pjsua_.start, after=["zombies"])
+    if config_server is not None:
+        startup_.add("config_server", config_server.start, after=["zombies"])
+    if directory_sync is not None:
+        startup_.add("directory_sync", directory_sync.start)
 
-    with config_server(phone_book_path), phone_app(
-        event_queue, phone, pjsua_, hardware
-    ) as app:
-        yield app
+    try:
+        with latency_server, journal.open_journal(journal_path) as event_journal, phone_app(
+            event_queue, phone, pjsua_, hardware, event_journal, latency_recorder, startup_
+        ) as app:
+            yield app
+    finally:
+        if config_server is not None:
+            config_server.stop()
+        if directory_sync is not None:
+            directory_sync.stop()
 
 
 def hardware_test() -> None:
@@ -395,3 +650,22 @@ def hardware_test() -> None:
         time.sleep(9999)
     finally:
         hardware.cleanup()
+
+
+def record_dial(file_path: str) -> None:
+    """Print the decoded dial events and save the raw edges on exit"""
+    hardware = Hardware(
+        on_dial_activate=lambda: print("dial_activate"),
+        on_dial_deactivate=lambda: print("dial_deactivate"),
+        on_dial_pulse=lambda: print("dial_pulse"),
+    )
+    hardware.setup()
+    try:
+        time.sleep(9999)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        hardware.cleanup()
+        recorded = hardware.dial_capture.buffer.contents()
+        edges.save_edges(file_path, recorded)
+        log.info("Saved %s edges to %s", len(recorded), file_path)
@@ -1,12 +1,18 @@
 from __future__ import annotations
+import asyncio
+import codecs
+import collections
 import contextlib
 import enum
-import queue
+import io
+import itertools
+import os
+import re
 import subprocess
 import threading
 import time
-from typing import Callable, Iterable
-import requests
+from concurrent.futures import Future
+from typing import Callable, Iterable, Protocol
 from os import path
 import logging
 
@@ -20,6 +26,25 @@ DOWNLOAD_URL_TEMPLATE = (
 )
 PJSUA_PATH = path.join(path.dirname(__file__), "pjsua")
 _STDOUT_TIMEOUT = 10
+_STDOUT_READ_SIZE = 64 * 1024
+_PROMPT = ">>>"
+_POLL_INTERVAL = 0.5
+# In event mode the supervisor only has to notice a dead process, so it can
+# sleep much longer between checks.
+_PROCESS_CHECK_INTERVAL = 5
+
+_LOG_LINE = re.compile(r"^\s*\d\d:\d\d:\d\d\.\d{3}\s")
+_INCOMING_CALL_LINE = re.compile(r"Incoming call for account \d+")
+_CALL_STATE_LINE = re.compile(r"Call (\d+) state changed to (\w+)")
+_CALL_DISCONNECTED_LINE = re.compile(r"Call (\d+) is DISCONNECTED")
+# The lines after "Incoming call for account" belong to the same log message,
+# but they have no timestamp
+_INCOMING_CALL_DETAIL_LINE = re.compile(
+    r"^\a?(Media count: |From: |To: |Press .* to answer or .* to reject call)"
+)
+# pjsua does not tell us the call id in the "Incoming call" line, so the call
+# is tracked under this key until its first state change is logged.
+_PENDING_INCOMING_CALL = -1
 
 
 def ensure_pjsua() -> None:
@@ -39,6 +64,8 @@ def download_pjsua() -> None:
     # something is broken here:
     # When I wget the file and run it it works, the file downloaded here causes
     # segmentation fault error
+    import requests
+
     download_url = DOWNLOAD_URL_TEMPLATE.format(machine=platform.machine())
     with requests.get(download_url, stream=True) as response:
         response.raise_for_status()
@@ -76,7 +103,94 @@ class CallState(enum.Enum):
     IDLE = enum.auto()
 
 
-class PJSua:
+class SipBackend(enum.Enum):
+    # Drive the pjsua CLI binary through its stdin and stdout
+    CLI = "cli"
+    # Use the pjsua2 python bindings in process, see fetap.pjsua2_backend
+    PJSUA2 = "pjsua2"
+
+
+class CallStateTracking(enum.Enum):
+    # Periodically send `call list` and infer the state from the response
+    POLL = "poll"
+    # Parse the call state changes pjsua logs to stdout
+    EVENTS = "events"
+
+
+# Order matters: When several calls exist the first matching state wins
+_CALL_STATE_PRIORITY = (
+    CallState.IN_CALL,
+    CallState.CALLING,
+    CallState.INCOMING,
+)
+
+
+def _next_call_state(previous: CallState | None, pjsip_state: str) -> CallState:
+    if pjsip_state == "CALLING":
+        return CallState.CALLING
+    if pjsip_state == "CONFIRMED":
+        return CallState.IN_CALL
+    if pjsip_state in ("DISCONNCTD", "DISCONNECTED", "NULL"):
+        return CallState.IDLE
+    # EARLY and CONNECTING happen for both directions. Outgoing calls are
+    # always logged as CALLING first, so a call we have not seen yet is incoming.
+    if previous is None:
+        return CallState.INCOMING
+    return previous
+
+
+def _update_call_states(
+    call_states: dict[int, CallState], call_id: int, pjsip_state: str
+) -> CallState:
+    """Track the state of one call and return the resulting overall state"""
+    new_state = _next_call_state(call_states.get(call_id), pjsip_state)
+    if new_state is CallState.IDLE:
+        call_states.pop(call_id, None)
+    else:
+        call_states[call_id] = new_state
+    return next(
+        (state for state in _CALL_STATE_PRIORITY if state in call_states.values()),
+        CallState.IDLE,
+    )
+
+
+class SipClient(Protocol):
+    @property
+    def call_state(self) -> CallState: ...
+    def start(self) -> None: ...
+    async def start_async(self) -> None: ...
+    def stop(self) -> None: ...
+    def call(self, address: str) -> Future: ...
+    def accept_call(self) -> Future: ...
+    def hangup_all(self) -> Future: ...
+
+
+def create_client(
+    backend: SipBackend,
+    on_incoming_call: Callable[[], None],
+    on_call_hangup: Callable[[], None],
+    on_call_connected: Callable[[], None],
+    call_state_tracking: CallStateTracking = CallStateTracking.EVENTS,
+) -> SipClient:
+    if backend is SipBackend.PJSUA2:
+        from fetap import pjsua2_backend
+
+        return pjsua2_backend.PJSua2(
+            on_incoming_call=on_incoming_call,
+            on_call_hangup=on_call_hangup,
+            on_call_connected=on_call_connected,
+        )
+    return PJSua(
+        on_incoming_call=on_incoming_call,
+        on_call_hangup=on_call_hangup,
+        on_call_connected=on_call_connected,
+        call_state_tracking=call_state_tracking,
+    )
+
+
+class _CallStateNotifier:
+    """Keeps the overall call state and calls the callbacks when it changes"""
+
     def __init__(
         self,
         on_incoming_call: Callable[[], None],
@@ -86,6 +200,101 @@ class PJSua:
         self._on_incoming_call = on_incoming_call
         self._on_call_hangup = on_call_hangup
         self._on_call_connected = on_call_connected
+        self._lock = threading.Lock()
+        self._call_state = CallState.IDLE
+
+    @property
+    def call_state(self) -> CallState:
+        with self._lock:
+            return self._call_state
+
+    def _set_call_state(self, new_state: CallState) -> None:
+        with self._lock:
+            old_state = self._call_state
+            self._call_state = new_state
+        if new_state is old_state:
+            return
+
+        if new_state is CallState.INCOMING:
+            self._on_incoming_call()
+        if new_state is CallState.IN_CALL:
+            self._on_call_connected()
+        if old_state is CallState.IN_CALL:
+            self._on_call_hangup()
+
+
+class _StdoutSplitter:
+    """Splits the stdout of pjsua into command responses and log lines.
+
+    Text can be fed in chunks of any size, each character is only scanned once.
+    Everything before a `>>>` prompt is a response. If `on_log_line` is given
+    it is called for every complete line first and lines it returns True for
+    are left out of the response.
+    """
+
+    def __init__(
+        self,
+        on_response: Callable[[str], None],
+        on_log_line: Callable[[str], bool] | None = None,
+    ) -> None:
+        self._on_response = on_response
+        self._on_log_line = on_log_line
+        self._response_parts: list[str] = []
+        self._pending = ""
+
+    def feed(self, data: str) -> None:
+        text = self._pending + data
+        start = 0
+        prompt = text.find(_PROMPT)
+        while True:
+            if self._on_log_line is not None:
+                newline = text.find("\n", start, len(text) if prompt == -1 else prompt)
+                if newline != -1:
+                    line = text[start : newline + 1]
+                    if not self._on_log_line(line):
+                        self._response_parts.append(line)
+                    start = newline + 1
+                    continue
+            if prompt == -1:
+                break
+            self._response_parts.append(text[start:prompt])
+            response = "".join(self._response_parts).strip()
+            self._response_parts = []
+            start = prompt + len(_PROMPT)
+            prompt = text.find(_PROMPT, start)
+            self._on_response(response)
+
+        if self._on_log_line is None:
+            # Only keep what could be the start of a prompt
+            keep_from = max(start, len(text) - len(_PROMPT) + 1)
+            self._response_parts.append(text[start:keep_from])
+            start = keep_from
+        # Otherwise this is the incomplete last line
+        self._pending = text[start:]
+
+
+def _stdout_decoder() -> io.IncrementalNewlineDecoder:
+    return io.IncrementalNewlineDecoder(
+        codecs.getincrementaldecoder("utf-8")(errors="replace"), translate=True
+    )
+
+
+class PJSua(_CallStateNotifier):
+    def __init__(
+        self,
+        on_incoming_call: Callable[[], None],
+        on_call_hangup: Callable[[], None],
+        on_call_connected: Callable[[], None],
+        call_state_tracking: CallStateTracking = CallStateTracking.EVENTS,
+        executable: str = PJSUA_PATH,
+        local_port: int | None = None,
+        null_audio: bool = False,
+    ) -> None:
+        super().__init__(on_incoming_call, on_call_hangup, on_call_connected)
+        self._local_port = local_port
+        self._null_audio = null_audio
+        self._call_state_tracking = call_state_tracking
+        self._executable = executable
         self._process_: subprocess.Popen | None = None
         self._supervisor_thread = threading.Thread(
             target=self._check_status_loop, daemon=True, name="pjsip-supervisor"
@@ -93,18 +302,30 @@ class PJSua:
         self._stdout_thread = threading.Thread(
             target=self._read_stdout_loop, daemon=True, name="pjsip-stdout"
         )
-        self._command_queue: queue.Queue[tuple[str, float]] = queue.Queue()
-        self._stdout_queue: queue.Queue[str] = queue.Queue()
-        self._responses_queue: queue.Queue[str] = queue.Queue()
+        # Responses arrive in the order the commands were written to stdin, so
+        # each response belongs to the oldest pending command.
+        self._write_lock = threading.Lock()
+        self._pending_commands: collections.deque[
+            tuple[int, str, Future[str]]
+        ] = collections.deque()
+        self._command_ids = itertools.count()
         self._should_stop = threading.Event()
-
-        self._lock = threading.Lock()
-        self._call_state = CallState.IDLE
-
-    @property
-    def call_state(self) -> CallState:
-        with self._lock:
-            return self._call_state
+        # Only set when started with start_async
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._poll_task: asyncio.Task | None = None
+
+        # Only used with CallStateTracking.EVENTS, owned by pjsip-stdout
+        self._call_states: dict[int, CallState] = {}
+        # Whether the last log line started an incoming call message
+        self._in_incoming_call_message = False
+        self._stdout_splitter = _StdoutSplitter(
+            on_response=self._handle_response,
+            on_log_line=(
+                self._handle_log_line
+                if call_state_tracking is CallStateTracking.EVENTS
+                else None
+            ),
+        )
 
     @property
     def _process(self) -> subprocess.Popen:
@@ -114,21 +335,40 @@ class PJSua:
 
     def _check_status_loop(self):
         """pjsip-supervisor mainloop"""
-        while not self._should_stop.is_set():
-            if (returncode := self._process.poll()) is not None:
-                raise ProcessDied(f"pjsua terminated unexpectedly: {returncode}")
-            try:
-                command, timeout = self._command_queue.get_nowait()
-            except queue.Empty:
-                pass
-            else:
-                self._process.stdin.write(command + "\n")
-                self._process.stdin.flush()
-                self._responses_queue.put_nowait(
-                    self._stdout_queue.get(timeout=timeout)
+        if self._call_state_tracking is CallStateTracking.EVENTS:
+            # Nothing to poll, just wait for the process to exit
+            returncode = self._process.wait()
+        else:
+            while (returncode := self._process.poll()) is None:
+                if self._should_stop.is_set():
+                    return
+                try:
+                    self._check_calls()
+                except ProcessDied:
+                    returncode = self._process.wait()
+                    break
+                time.sleep(_POLL_INTERVAL)
+        if not self._should_stop.is_set():
+            raise ProcessDied(f"pjsua terminated unexpectedly: {returncode}")
+
+    def _handle_response(self, response: str) -> None:
+        """Runs on pjsip-stdout"""
+        try:
+            command_id, command, future = self._pending_commands.popleft()
+        except IndexError:
+            log.debug("Discarding unexpected output:\n%s", response)
+            return
+        log.debug("Response to command %s (%s):\n%s", command_id, command, response)
+        future.set_result(response)
+
+    def _fail_pending_commands(self, returncode: int | None) -> None:
+        """Runs on pjsip-stdout"""
+        with self._write_lock:
+            while self._pending_commands:
+                _, command, future = self._pending_commands.popleft()
+                future.set_exception(
+                    ProcessDied(f"pjsua exited ({returncode}) before responding to {command}")
                 )
-            self._check_calls()
-            time.sleep(0.5)
 
     def _infer_call_state(self, call_list_response: str) -> CallState:
         current_call_lines = call_list_response.split("\n")[1:]
@@ -144,51 +384,134 @@ class PJSua:
 
     def _check_calls(self) -> None:
         """Runs on pjsip-supervisor"""
-        self._process.stdin.write("call list\n")
-        self._process.stdin.flush()
-        response = self._stdout_queue.get(timeout=_STDOUT_TIMEOUT)
+        self._apply_call_list(self.send_command("call list"))
+
+    async def _poll_calls(self) -> None:
+        """Replaces pjsip-supervisor when running on an event loop"""
+        while True:
+            response = await asyncio.wrap_future(self.submit_command("call list"))
+            self._apply_call_list(response)
+            await asyncio.sleep(_POLL_INTERVAL)
 
+    def _apply_call_list(self, response: str) -> None:
         new_state = self._infer_call_state(response)
         if new_state is self._call_state:
             return
-        
-        log.debug("Inferred new call state %s from response:\n%s", new_state, response)
-
-        if new_state is CallState.INCOMING:
-            self._on_incoming_call()
-        if new_state is CallState.IN_CALL:
-            self._on_call_connected()
-        if self._call_state is CallState.IN_CALL:
-            self._on_call_hangup()
 
-        with self._lock:
-            self._call_state = new_state
+        log.debug("Inferred new call state %s from response:\n%s", new_state, response)
+        self._set_call_state(new_state)
+
+    def _handle_log_line(self, line: str) -> bool:
+        """Runs on pjsip-stdout
+
+        Returns whether the line was a log line and should be dropped from the
+        command responses.
+        """
+        if not _LOG_LINE.match(line):
+            if self._in_incoming_call_message and _INCOMING_CALL_DETAIL_LINE.match(line):
+                return True
+            self._in_incoming_call_message = False
+            return False
+
+        self._in_incoming_call_message = False
+        if _INCOMING_CALL_LINE.search(line):
+            self._in_incoming_call_message = True
+            new_state = _update_call_states(
+                self._call_states, _PENDING_INCOMING_CALL, "INCOMING"
+            )
+        elif match := _CALL_STATE_LINE.search(line):
+            new_state = self._update_call(int(match[1]), match[2])
+        elif match := _CALL_DISCONNECTED_LINE.search(line):
+            new_state = self._update_call(int(match[1]), "DISCONNCTD")
+        else:
+            return True
+
+        log.debug("Call state %s from log line: %s", new_state, line.strip())
+        self._set_call_state(new_state)
+        return True
+
+    def _update_call(self, call_id: int, pjsip_state: str) -> CallState:
+        """Runs on pjsip-stdout"""
+        if call_id not in self._call_states:
+            pending = self._call_states.pop(_PENDING_INCOMING_CALL, None)
+            if pending is not None:
+                self._call_states[call_id] = pending
+        return _update_call_states(self._call_states, call_id, pjsip_state)
 
     def _read_stdout_loop(self):
         """pjsip-stdout mainloop"""
-        buffer: list[str] = []
+        # Read straight from the pipe instead of through the text wrapper, so we
+        # get whatever is available in one syscall instead of one char at a time
+        stdout_fd = self._process.stdout.fileno()
+        decoder = _stdout_decoder()
         while not self._should_stop.is_set():
-            buffer.append(self._process.stdout.read(1))
-            if "".join(buffer[-3:]) != ">>>":
-                continue
-            output = "".join(buffer[:-3]).strip()
-            buffer = []
-            self._stdout_queue.put_nowait(output)
+            chunk = os.read(stdout_fd, _STDOUT_READ_SIZE)
+            if not chunk:
+                break
+            self._stdout_splitter.feed(decoder.decode(chunk))
+        self._fail_pending_commands(self._process.wait())
+
+    def _on_stdout_readable(self, decoder: io.IncrementalNewlineDecoder) -> None:
+        """Replaces pjsip-stdout when running on an event loop"""
+        stdout_fd = self._process.stdout.fileno()
+        chunk = os.read(stdout_fd, _STDOUT_READ_SIZE)
+        if chunk:
+            self._stdout_splitter.feed(decoder.decode(chunk))
+            return
+        self._loop.remove_reader(stdout_fd)
+        if not self._should_stop.is_set():
+            log.error("pjsua terminated unexpectedly")
+        self._fail_pending_commands(self._process.poll())
 
     def start(self) -> None:
-        assert self._process_ is None
-        ensure_pjsua()
+        self._launch()
+        # When the process starts it prints the prompt symbols ">>>". We wan to
+        # discard this first output
+        startup = self._expect_response("<startup>")
+        self._stdout_thread.start()
+        startup.result(timeout=_STDOUT_TIMEOUT)
+        self._supervisor_thread.start()
 
+    async def start_async(self) -> None:
+        """Start pjsua and handle its output on the running event loop.
+
+        This needs no extra threads: stdout is read when the loop sees it is
+        readable and polling, if enabled, is a task.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._launch()
+        startup = self._expect_response("<startup>")
+        self._loop.add_reader(
+            self._process.stdout.fileno(), self._on_stdout_readable, _stdout_decoder()
+        )
+        await asyncio.wait_for(asyncio.wrap_future(startup), _STDOUT_TIMEOUT)
+        if self._call_state_tracking is CallStateTracking.POLL:
+            self._poll_task = self._loop.create_task(self._poll_calls())
+
+    def _launch(self) -> None:
+        assert self._process_ is None
+        if self._executable == PJSUA_PATH:
+            ensure_pjsua()
+
+        if self._call_state_tracking is CallStateTracking.EVENTS:
+            # Level 3 is the lowest level at which call state changes are logged
+            log_level = 3
+        else:
+            log_level = 0
         command = [
             "stdbuf",  # If we don't do this then there will appear to be no stdout
             "-o0",
-            PJSUA_PATH,
+            self._executable,
             "--use-cli",
             "--max-calls=3",
             "--no-tones",
             "--no-color",
-            "--log-level=0",
+            f"--log-level={log_level}",
         ]
+        if self._local_port is not None:
+            command.append(f"--local-port={self._local_port}")
+        if self._null_audio:
+            command.append("--null-audio")
         log.debug("Starting PJSUA process with: `%s`", " ".join(command))
         
         self._process_ = subprocess.Popen(
@@ -198,30 +521,44 @@ class PJSua:
             bufsize=0,
             universal_newlines=True,
         )
-        self._stdout_thread.start()
-        # When the process starts it prints the prompt symbols ">>>". We wan to
-        # discard this first output
-        self._stdout_queue.get(timeout=_STDOUT_TIMEOUT)
-        self._supervisor_thread.start()
+
+    def _expect_response(self, command: str) -> Future[str]:
+        future: Future[str] = Future()
+        command_id = next(self._command_ids)
+        self._pending_commands.append((command_id, command, future))
+        return future
+
+    def submit_command(self, command: str) -> Future[str]:
+        """Write the command to pjsua right away.
+
+        The returned future resolves with the response once pjsua prints it.
+        """
+        with self._write_lock:
+            if self._process.poll() is not None:
+                raise ProcessDied(f"pjsua is not running, can't send {command}")
+            future = self._expect_response(command)
+            self._process.stdin.write(command + "\n")
+            self._process.stdin.flush()
+        return future
 
     def send_command(self, command: str, timeout=_STDOUT_TIMEOUT) -> str:
-        self._command_queue.put_nowait((command, timeout))
-        response = self._responses_queue.get(timeout=timeout)
-        return response
+        return self.submit_command(command).result(timeout=timeout)
 
-    def call(self, address: str) -> None:
-        self.send_command(f"call new sip:{address}")
+    def call(self, address: str) -> Future[str]:
+        return self.submit_command(f"call new sip:{address}")
 
-    def accept_call(self) -> None:
-        self.send_command("call answer 200")
+    def accept_call(self) -> Future[str]:
+        return self.submit_command("call answer 200")
 
-    def call_list(self) -> None:
+    def call_list(self) -> CallState:
         response = self.send_command("call list")
         return self._infer_call_state(response)
 
-    def hangup_all(self) -> None:
-        self.send_command("call hangup_all")
+    def hangup_all(self) -> Future[str]:
+        return self.submit_command("call hangup_all")
 
     def stop(self) -> None:
         self._should_stop.set()
+        if self._poll_task is not None:
+            self._poll_task.cancel()
         self._process.terminate()
@@ -0,0 +1,193 @@
+"""SIP client using the pjsua2 python bindings instead of the pjsua binary.
+
+There is no wheel for pjsua2 on PyPI, see notes/notes.txt for how to build it.
+"""
+from __future__ import annotations
+import threading
+from concurrent.futures import Future
+from typing import Callable
+
+import logging
+
+import pjsua2 as pj
+
+from fetap.pjsua import CallState, _CallStateNotifier, _update_call_states
+
+log = logging.getLogger(__name__)
+
+# How long the event thread waits for SIP events before it checks if it should stop
+_HANDLE_EVENTS_MS = 500
+_DEFAULT_PORT = 5060
+
+
+class _Account(pj.Account):
+    def __init__(self, client: PJSua2) -> None:
+        super().__init__()
+        self._client = client
+
+    def onIncomingCall(self, prm: pj.OnIncomingCallParam) -> None:
+        self._client._handle_incoming_call(prm.callId)
+
+
+class _Call(pj.Call):
+    def __init__(
+        self, client: PJSua2, account: _Account, call_id: int = pj.PJSUA_INVALID_ID
+    ) -> None:
+        super().__init__(account, call_id)
+        self._client = client
+
+    def onCallState(self, prm: pj.OnCallStateParam) -> None:
+        info = self.getInfo()
+        self._client._handle_call_state(info.id, info.stateText)
+
+    def onCallMediaState(self, prm: pj.OnCallMediaStateParam) -> None:
+        info = self.getInfo()
+        for index, media in enumerate(info.media):
+            if (
+                media.type == pj.PJMEDIA_TYPE_AUDIO
+                and media.status == pj.PJSUA_CALL_MEDIA_ACTIVE
+            ):
+                self._client._connect_audio(self.getAudioMedia(index))
+
+
+class PJSua2(_CallStateNotifier):
+    def __init__(
+        self,
+        on_incoming_call: Callable[[], None],
+        on_call_hangup: Callable[[], None],
+        on_call_connected: Callable[[], None],
+        local_port: int | None = None,
+        null_audio: bool = False,
+    ) -> None:
+        super().__init__(on_incoming_call, on_call_hangup, on_call_connected)
+        self._local_port = _DEFAULT_PORT if local_port is None else local_port
+        self._null_audio = null_audio
+        self._endpoint = pj.Endpoint()
+        self._account: _Account | None = None
+        self._events_thread = threading.Thread(
+            target=self._handle_events_loop, daemon=True, name="pjsip-events"
+        )
+        self._should_stop = threading.Event()
+
+        self._calls_lock = threading.Lock()
+        self._calls: dict[int, _Call] = {}
+        self._call_states: dict[int, CallState] = {}
+        # pjsua2 must not free a call from within its own callback, so finished
+        # calls are only dropped on the next iteration of the event loop.
+        self._finished_calls: list[_Call] = []
+
+    def _handle_events_loop(self) -> None:
+        """pjsip-events mainloop"""
+        self._endpoint.libRegisterThread(threading.current_thread().name)
+        while not self._should_stop.is_set():
+            self._endpoint.libHandleEvents(_HANDLE_EVENTS_MS)
+            with self._calls_lock:
+                self._finished_calls.clear()
+
+    def _ensure_thread_registered(self) -> None:
+        if not self._endpoint.libIsThreadRegistered():
+            self._endpoint.libRegisterThread(threading.current_thread().name)
+
+    def _handle_incoming_call(self, call_id: int) -> None:
+        call = _Call(self, self._account, call_id)
+        with self._calls_lock:
+            self._calls[call_id] = call
+        self._handle_call_state(call_id, "INCOMING")
+        ringing = pj.CallOpParam()
+        ringing.statusCode = 180
+        call.answer(ringing)
+
+    def _handle_call_state(self, call_id: int, pjsip_state: str) -> None:
+        with self._calls_lock:
+            new_state = _update_call_states(self._call_states, call_id, pjsip_state)
+            if call_id not in self._call_states and call_id in self._calls:
+                self._finished_calls.append(self._calls.pop(call_id))
+        log.debug("Call %s is %s, call state %s", call_id, pjsip_state, new_state)
+        self._set_call_state(new_state)
+
+    def _connect_audio(self, call_media: pj.AudioMedia) -> None:
+        devices = self._endpoint.audDevManager()
+        devices.getCaptureDevMedia().startTransmit(call_media)
+        call_media.startTransmit(devices.getPlaybackDevMedia())
+
+    def _run(self, function: Callable[[], None]) -> Future[None]:
+        future: Future[None] = Future()
+        self._ensure_thread_registered()
+        try:
+            function()
+        except pj.Error as e:
+            log.warning("pjsua2 failed: %s", e.info())
+            future.set_exception(e)
+        else:
+            future.set_result(None)
+        return future
+
+    def start(self) -> None:
+        assert self._account is None
+        self._endpoint.libCreate()
+
+        config = pj.EpConfig()
+        # Callbacks have to arrive on a thread that python knows about, so
+        # instead of pjsip's worker threads we run our own event loop.
+        config.uaConfig.threadCnt = 0
+        config.uaConfig.maxCalls = 3
+        config.logConfig.level = 3
+        config.logConfig.consoleLevel = 3
+        self._endpoint.libInit(config)
+
+        transport_config = pj.TransportConfig()
+        transport_config.port = self._local_port
+        self._endpoint.transportCreate(pj.PJSIP_TRANSPORT_UDP, transport_config)
+        self._endpoint.libStart()
+        if self._null_audio:
+            self._endpoint.audDevManager().setNullDev()
+
+        account_config = pj.AccountConfig()
+        account_config.idUri = "sip:fetap@127.0.0.1"
+        self._account = _Account(self)
+        self._account.create(account_config)
+        log.debug("pjsua2 listening on port %s", self._local_port)
+
+        self._events_thread.start()
+
+    async def start_async(self) -> None:
+        # pjsua2 calls back from its own event thread either way
+        self.start()
+
+    def call(self, address: str) -> Future[None]:
+        def _make_call() -> None:
+            call = _Call(self, self._account)
+            call.makeCall(f"sip:{address}", pj.CallOpParam(True))
+            with self._calls_lock:
+                self._calls[call.getId()] = call
+
+        return self._run(_make_call)
+
+    def accept_call(self) -> Future[None]:
+        def _answer() -> None:
+            with self._calls_lock:
+                incoming_calls = [
+                    self._calls[call_id]
+                    for call_id, state in self._call_states.items()
+                    if state is CallState.INCOMING and call_id in self._calls
+                ]
+            accept = pj.CallOpParam()
+            accept.statusCode = 200
+            for call in incoming_calls:
+                call.answer(accept)
+
+        return self._run(_answer)
+
+    def hangup_all(self) -> Future[None]:
+        return self._run(self._endpoint.hangupAllCalls)
+
+    def stop(self) -> None:
+        self._should_stop.set()
+        self._events_thread.join()
+        self._ensure_thread_registered()
+        self._endpoint.hangupAllCalls()
+        with self._calls_lock:
+            self._calls.clear()
+            self._finished_calls.clear()
+        self._account = None
+        self._endpoint.libDestroy()
@@ -0,0 +1,141 @@
+"""Find and stop processes by reading /proc instead of running ps.
+
+Processes are held on to with pidfds where the kernel has them (Linux 5.3),
+so a pid that is reused after the process exited is never signalled, and
+waiting for the exit is a poll instead of a sleep.
+"""
+from __future__ import annotations
+import os
+import select
+import signal
+import time
+from typing import Collection, Optional
+
+import logging
+
+log = logging.getLogger(__name__)
+
+# How often to check for the exit without pidfds
+_POLL_INTERVAL = 0.01
+
+
+class _Process:
+    def __init__(self, pid: int) -> None:
+        self.pid = pid
+        self.pidfd: Optional[int] = None
+        if hasattr(os, "pidfd_open"):
+            try:
+                self.pidfd = os.pidfd_open(pid)
+            except ProcessLookupError:
+                raise
+            except OSError:
+                # ENOSYS on kernels before 5.3
+                pass
+
+    def send_signal(self, sig: int) -> None:
+        try:
+            if self.pidfd is not None:
+                signal.pidfd_send_signal(self.pidfd, sig)
+            else:
+                os.kill(self.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def has_exited(self) -> bool:
+        if self.pidfd is not None:
+            return bool(select.select([self.pidfd], [], [], 0)[0])
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                state = f.read().rsplit(")", 1)[1].split()[0]
+        except OSError:
+            return True
+        # Zombies exited and only wait to be reaped by their parent
+        return state in ("Z", "X")
+
+    def close(self) -> None:
+        if self.pidfd is not None:
+            os.close(self.pidfd)
+            self.pidfd = None
+
+
+def _command(pid: int) -> list[str]:
+    with open(f"/proc/{pid}/cmdline", "rb") as f:
+        return f.read().decode(errors="replace").split("\0")[:-1]
+
+
+def find_processes(prefix: str, exclude: Collection[int] = ()) -> list[int]:
+    """The pids of the processes whose executable path starts with prefix"""
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit() or int(entry) in exclude:
+            continue
+        try:
+            command = _command(int(entry))
+        except OSError:
+            # Exited since listing /proc, or not ours to look at
+            continue
+        # Exited processes that were not reaped yet have no command
+        if command and command[0].startswith(prefix):
+            pids.append(int(entry))
+    return pids
+
+
+def _open(pids: list[int], prefix: str) -> list[_Process]:
+    processes = []
+    for pid in pids:
+        try:
+            process = _Process(pid)
+            # Check again now that the pid is held, it could have been reused
+            command = _command(pid)
+        except OSError:
+            continue
+        if command and command[0].startswith(prefix):
+            processes.append(process)
+        else:
+            process.close()
+    return processes
+
+
+def _wait(processes: list[_Process], timeout: float) -> list[_Process]:
+    """Wait until the processes exited or the timeout passed, returns those still running"""
+    deadline = time.monotonic() + timeout
+    running = [p for p in processes if not p.has_exited()]
+    while running:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        with_pidfd = [p for p in running if p.pidfd is not None]
+        if len(with_pidfd) == len(running):
+            poll = select.poll()
+            for process in running:
+                poll.register(process.pidfd, select.POLLIN)
+            poll.poll(remaining * 1000)
+        else:
+            time.sleep(min(_POLL_INTERVAL, remaining))
+        running = [p for p in running if not p.has_exited()]
+    return running
+
+
+def terminate(prefix: str, exclude: Collection[int] = (), timeout: float = 3) -> bool:
+    """Stop the processes whose executable path starts with prefix.
+
+    They get SIGTERM and timeout seconds to exit, then SIGKILL and another
+    timeout seconds. Returns whether all of them exited.
+    """
+    opened = _open(find_processes(prefix, exclude), prefix)
+    processes = opened
+    try:
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            if not processes:
+                return True
+            for process in processes:
+                log.info("Sending %s to %s", sig.name, process.pid)
+                process.send_signal(sig)
+            processes = _wait(processes, timeout)
+        if not processes:
+            return True
+        log.error("Processes %s did not exit", [p.pid for p in processes])
+        return False
+    finally:
+        for process in opened:
+            process.close()
@@ -0,0 +1,235 @@
+"""Replay a scripted sequence of Events through a Phone.
+
+The Phone gets a fake SIP client and fake hardware that only record what they
+were asked to do, so a script can be replayed anywhere and with either the
+threaded App or the AsyncApp. Journals written by the App replay the same way,
+to reproduce what happened on a phone.
+"""
+from __future__ import annotations
+import asyncio
+import collections
+import dataclasses
+import queue
+import statistics
+from concurrent.futures import Future
+from typing import Iterable, Optional
+
+from fetap import journal, latency, pjsua, storage
+from fetap.main import JOURNAL_EVENTS, JOURNAL_STATES, App, Event, Phone
+
+
+@dataclasses.dataclass(frozen=True)
+class Step:
+    event: Event
+    # Seconds to wait after the previous step
+    delay: float = 0
+
+
+@dataclasses.dataclass(frozen=True)
+class Transition:
+    event: Event
+    state: str
+
+
+def dial(digit: int, delay: float = 0) -> list[Step]:
+    """The steps the rotary dial produces for one digit"""
+    return dial_pulses(digit or 10, delay)
+
+
+def dial_pulses(pulses: int, delay: float = 0) -> list[Step]:
+    """Like dial, with any number of pulses, to replay miscounted digits"""
+    return (
+        [Step(Event.DIAL_ACTIVATE, delay)]
+        + [Step(Event.DIAL_PULSE) for _ in range(pulses)]
+        + [Step(Event.DIAL_DEACTIVATE)]
+    )
+
+
+def dial_number(number: str, delay: float = 0) -> list[Step]:
+    return [step for digit in number for step in dial(int(digit), delay)]
+
+
+def complete_records(records: list[journal.Record], dropped: int) -> list[journal.Record]:
+    """The records from the first time the Phone was idle, if some were dropped.
+
+    Before that the Phone was in a state a replay can't start from.
+    """
+    if not dropped:
+        return records
+    idle = JOURNAL_STATES.index("idle")
+    for i, record in enumerate(records):
+        if record.state == idle:
+            return records[i + 1 :]
+    return []
+
+
+def steps_from_journal(records: Iterable[journal.Record]) -> list[Step]:
+    steps = []
+    previous_ns: Optional[int] = None
+    for record in records:
+        delay = 0 if previous_ns is None else (record.time_ns - previous_ns) / 1e9
+        steps.append(Step(JOURNAL_EVENTS[record.event], delay))
+        previous_ns = record.time_ns
+    return steps
+
+
+def transitions_from_journal(records: Iterable[journal.Record]) -> list[Transition]:
+    return [
+        Transition(JOURNAL_EVENTS[record.event], JOURNAL_STATES[record.state])
+        for record in records
+    ]
+
+
+def latencies(records: list[journal.Record]) -> dict[Transition, list[int]]:
+    """How long handling each event took in ns, by the event and the state it led to"""
+    durations: dict[Transition, list[int]] = collections.defaultdict(list)
+    for record, transition in zip(records, transitions_from_journal(records)):
+        durations[transition].append(record.duration_ns)
+    return dict(durations)
+
+
+class FakeSipClient:
+    def __init__(self) -> None:
+        self.commands: list[tuple[str, ...]] = []
+        self.call_state = pjsua.CallState.IDLE
+
+    def _record(self, *command: str) -> Future[None]:
+        self.commands.append(command)
+        future: Future[None] = Future()
+        future.set_result(None)
+        return future
+
+    def start(self) -> None:
+        pass
+
+    async def start_async(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+    def call(self, address: str) -> Future[None]:
+        return self._record("call", address)
+
+    def accept_call(self) -> Future[None]:
+        return self._record("accept_call")
+
+    def hangup_all(self) -> Future[None]:
+        return self._record("hangup_all")
+
+
+class FakeHardware:
+    def __init__(self) -> None:
+        self.is_ringing = False
+
+    def setup(self) -> None:
+        pass
+
+    def cleanup(self) -> None:
+        pass
+
+    def start_ringing(self) -> None:
+        self.is_ringing = True
+
+    def stop_ringing(self) -> None:
+        self.is_ringing = False
+
+
+class Replay:
+    def __init__(
+        self,
+        phone_book: storage.PhoneBook,
+        event_journal: Optional[journal.Journal] = None,
+        latency_recorder: Optional[latency.Recorder] = None,
+    ) -> None:
+        self.sip_client = FakeSipClient()
+        self.hardware = FakeHardware()
+        self.phone = Phone(
+            pjsua_=self.sip_client, phone_book=phone_book, hardware=self.hardware
+        )
+        self.event_journal = event_journal
+        self.latency_recorder = latency_recorder
+        self.transitions: list[Transition] = []
+
+    def _record(self, event: Event) -> None:
+        self.transitions.append(Transition(event, self.phone.current_state.id))
+
+    def run(self, steps: list[Step]) -> list[Transition]:
+        """Replay with the threaded App, ignoring the delays"""
+        event_queue: queue.Queue[Event] = (
+            queue.Queue()
+            if self.latency_recorder is None
+            else latency.StampedQueue(self.latency_recorder)
+        )
+        app = App(
+            event_queue,
+            self.phone,
+            self.sip_client,
+            self.hardware,
+            self.event_journal,
+            self.latency_recorder,
+        )
+        for step in steps:
+            event_queue.put_nowait(step.event)
+        for step in steps:
+            app.handle_next_event()
+            self._record(step.event)
+        return self.transitions
+
+    async def run_async(self, steps: list[Step]) -> list[Transition]:
+        """Replay with the AsyncApp, the events arrive after their delays"""
+        from fetap.async_app import AsyncApp, make_callback_for
+
+        loop = asyncio.get_running_loop()
+        event_queue: asyncio.Queue[Event] = (
+            asyncio.Queue()
+            if self.latency_recorder is None
+            else latency.AsyncStampedQueue(self.latency_recorder)
+        )
+        app = AsyncApp(
+            event_queue,
+            self.phone,
+            self.sip_client,
+            self.hardware,
+            self.event_journal,
+            self.latency_recorder,
+        )
+
+        async def _feed() -> None:
+            for step in steps:
+                await asyncio.sleep(step.delay)
+                make_callback_for(step.event, loop, event_queue)()
+
+        feeder = loop.create_task(_feed())
+        for step in steps:
+            await app.handle_next_event_async()
+            self._record(step.event)
+        await feeder
+        return self.transitions
+
+
+def replay_journal(journal_path: str, phone_book_path: str) -> bool:
+    """Replay a journal file, print where the replay differs and the latencies.
+
+    Returns whether the replay went through the same states as the journal.
+    """
+    records, dropped = journal.read_journal(journal_path)
+    records = complete_records(records, dropped)
+    recorded = transitions_from_journal(records)
+    player = Replay(storage.open_phone_book(phone_book_path))
+    replayed = player.run(steps_from_journal(records))
+    is_same = True
+    for i, (expected, actual) in enumerate(zip(recorded, replayed)):
+        if expected != actual:
+            print(f"{i}: {expected.event.name} led to {expected.state}, replayed {actual.state}")
+            is_same = False
+    print(f"Replayed {len(records)} events, {dropped} were dropped from the journal")
+    for transition, durations in sorted(
+        latencies(records).items(), key=lambda item: (item[0].event.name, item[0].state)
+    ):
+        print(
+            f"{transition.event.name} -> {transition.state}: {len(durations)} events,"
+            f" median {statistics.median(durations) / 1e3:.0f} us,"
+            f" max {max(durations) / 1e3:.0f} us"
+        )
+    return is_same
@@ -0,0 +1,153 @@
+"""Drives the bell on PIN_RING.
+
+The bell is rung with a square wave while a ring lasts and is silent in the
+pauses between rings. With PWM the wave comes from RPi.GPIO's own timer thread
+and Python only has to switch it on and off twice per ring. The software
+ringer toggles the pin itself, as a fallback for GPIO libraries without PWM.
+"""
+from __future__ import annotations
+import asyncio
+import dataclasses
+import functools
+import threading
+import time
+from typing import Callable, Iterator, Protocol
+
+import logging
+
+from fetap.conman import gpio
+
+log = logging.getLogger(__name__)
+
+# The bell only needs a square wave, so half of each period is on
+_DUTY_CYCLE = 50
+
+# Switches the bell to the next state, then the state is held for the duration
+Step = tuple[Callable[[], None], float]
+
+
+@dataclasses.dataclass(frozen=True)
+class RingCadence:
+    """How the bell rings: n rings with pauses in between, then a long pause"""
+
+    # Of the square wave driving the bell, in Hz
+    frequency: float = 50
+    ring_time: float = 1
+    pause_time: float = 1
+    n: int = 3
+    long_pause_time: float = 2
+
+    @classmethod
+    def parse(cls, text: str) -> RingCadence:
+        """Parse "ring_time,pause_time,n,long_pause_time", like "1,1,3,2" """
+        try:
+            ring_time, pause_time, n, long_pause_time = text.split(",")
+            return cls(
+                ring_time=float(ring_time),
+                pause_time=float(pause_time),
+                n=int(n),
+                long_pause_time=float(long_pause_time),
+            )
+        except ValueError as e:
+            raise ValueError(f"Invalid ring cadence {text!r}: {e}") from e
+
+    def bursts(self) -> Iterator[tuple[float, float]]:
+        """Yields how long to ring and how long to be silent afterwards, forever"""
+        while True:
+            for i in range(self.n):
+                pause = self.pause_time
+                if i == self.n - 1:
+                    pause += self.long_pause_time
+                yield self.ring_time, pause
+
+    def pulse_train(self) -> Iterator[tuple[bool, float]]:
+        """Yields the level of the ring pin and how long to keep it, forever"""
+        half_period = 1 / (2 * self.frequency)
+        periods = round(self.ring_time * self.frequency)
+        for _, pause in self.bursts():
+            for _ in range(periods):
+                yield True, half_period
+                yield False, half_period
+            yield False, pause
+
+
+class Ringer(Protocol):
+    def setup(self) -> None: ...
+    def steps(self) -> Iterator[Step]: ...
+    def silence(self) -> None: ...
+
+
+class PwmRinger:
+    def __init__(self, pin: int, cadence: RingCadence) -> None:
+        self.pin = pin
+        self.cadence = cadence
+        self._pwm: gpio.PWM | None = None
+
+    def setup(self) -> None:
+        self._pwm = gpio.PWM(self.pin, self.cadence.frequency)
+
+    def steps(self) -> Iterator[Step]:
+        assert self._pwm is not None, "setup must be called first"
+        for ring_time, pause in self.cadence.bursts():
+            yield functools.partial(self._pwm.start, _DUTY_CYCLE), ring_time
+            yield self._pwm.stop, pause
+
+    def silence(self) -> None:
+        if self._pwm is not None:
+            self._pwm.stop()
+        gpio.output(self.pin, gpio.LOW)
+
+
+class SoftwareRinger:
+    def __init__(self, pin: int, cadence: RingCadence) -> None:
+        self.pin = pin
+        self.cadence = cadence
+
+    def setup(self) -> None:
+        pass
+
+    def steps(self) -> Iterator[Step]:
+        high = functools.partial(gpio.output, self.pin, gpio.HIGH)
+        low = functools.partial(gpio.output, self.pin, gpio.LOW)
+        for level, duration in self.cadence.pulse_train():
+            yield (high if level else low), duration
+
+    def silence(self) -> None:
+        gpio.output(self.pin, gpio.LOW)
+
+
+def create_ringer(pin: int, cadence: RingCadence) -> Ringer:
+    if hasattr(gpio, "PWM"):
+        return PwmRinger(pin, cadence)
+    log.warning("GPIO has no PWM, ringing in software")
+    return SoftwareRinger(pin, cadence)
+
+
+def ring(ringer: Ringer, should_stop: threading.Event) -> None:
+    """Ring until should_stop is set.
+
+    Every step is scheduled against the start time rather than the end of the
+    previous wait, so a late wakeup doesn't shift the rest of the cadence.
+    """
+    deadline = time.monotonic()
+    try:
+        for switch, duration in ringer.steps():
+            switch()
+            deadline += duration
+            if should_stop.wait(max(0, deadline - time.monotonic())):
+                return
+    finally:
+        ringer.silence()
+
+
+async def ring_async(ringer: Ringer) -> None:
+    """Like ring, as a task that rings until it is cancelled"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time()
+    try:
+        for switch, duration in ringer.steps():
+            switch()
+            deadline += duration
+            await asyncio.sleep(max(0, deadline - loop.time()))
+    finally:
+        ringer.silence()
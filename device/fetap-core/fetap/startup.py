@@ -0,0 +1,154 @@
+"""Runs the steps of starting the phone concurrently.
+
+Every step runs on its own thread as soon as the steps it comes after are
+ready, so slow steps like starting pjsua don't hold up the GPIO. Each step
+can be waited for on its own, and the time from starting until each step was
+ready is logged.
+"""
+from __future__ import annotations
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Iterable, Optional
+
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class StepFailed(Exception):
+    pass
+
+
+class _Step:
+    def __init__(self, name: str, function: Callable[[], None], after: list[str]) -> None:
+        self.name = name
+        self.function = function
+        self.after = after
+        self.done = threading.Event()
+        self.error: Optional[Exception] = None
+        # Seconds from starting until the step was ready
+        self.ready_after: Optional[float] = None
+
+
+class Startup:
+    def __init__(self) -> None:
+        self._steps: dict[str, _Step] = {}
+        self._start_time: Optional[float] = None
+        self._lock = threading.Lock()
+        self._running = 0
+
+    def add(self, name: str, function: Callable[[], None], after: Iterable[str] = ()) -> None:
+        """Add a step that runs once the steps named in after are ready"""
+        if self._start_time is not None:
+            raise RuntimeError("Can't add steps after starting")
+        after = list(after)
+        missing = [n for n in after if n not in self._steps]
+        if missing:
+            raise ValueError(f"{name} comes after unknown steps {missing}")
+        self._steps[name] = _Step(name, function, after)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._steps
+
+    def start(self) -> None:
+        self._start_time = time.monotonic()
+        self._running = len(self._steps)
+        for step in self._steps.values():
+            threading.Thread(
+                target=self._run, args=(step,), daemon=True, name=f"startup-{step.name}"
+            ).start()
+
+    def _run(self, step: _Step) -> None:
+        """startup-<name> mainloop"""
+        try:
+            for name in step.after:
+                self.wait(name)
+            step.function()
+        except Exception as e:
+            step.error = e
+            log.exception("Starting %s failed", step.name)
+        else:
+            step.ready_after = time.monotonic() - self._start_time
+            log.info("%s ready after %.2fs", step.name, step.ready_after)
+        finally:
+            step.done.set()
+        with self._lock:
+            self._running -= 1
+            is_last = self._running == 0
+        if is_last and all(s.error is None for s in self._steps.values()):
+            log.info("Startup finished after %.2fs", time.monotonic() - self._start_time)
+
+    def wait(self, name: str, timeout: Optional[float] = None) -> bool:
+        """Wait until the step is ready, returns False on timeout"""
+        step = self._steps[name]
+        if not step.done.wait(timeout):
+            return False
+        if step.error is not None:
+            raise StepFailed(f"{name} failed to start") from step.error
+        return True
+
+    def wait_all(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for name in self._steps:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if not self.wait(name, remaining):
+                return False
+        return True
+
+    def wait_finished(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every step is ready or failed, returns False on timeout"""
+        if self._start_time is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for step in self._steps.values():
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if not step.done.wait(remaining):
+                return False
+        return True
+
+    def is_ready(self, name: str) -> bool:
+        step = self._steps[name]
+        return step.done.is_set() and step.error is None
+
+    @property
+    def ready_after(self) -> dict[str, float]:
+        """Seconds from starting until each step that is ready was ready"""
+        return {
+            name: step.ready_after
+            for name, step in self._steps.items()
+            if step.ready_after is not None
+        }
+
+
+class DeferredSipClient:
+    """Lets the Phone use a SIP client that may still be starting.
+
+    Calls wait until the SIP step is ready. Hanging up before then does
+    nothing, there can't be a call yet.
+    """
+
+    def __init__(self, client: Any, startup: Startup, step: str = "sip") -> None:
+        self._client = client
+        self._startup = startup
+        self._step = step
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+    def call(self, address: str) -> Future:
+        if not self._startup.is_ready(self._step):
+            log.info("Waiting for SIP to start before calling")
+            self._startup.wait(self._step)
+        return self._client.call(address)
+
+    def accept_call(self) -> Future:
+        self._startup.wait(self._step)
+        return self._client.accept_call()
+
+    def hangup_all(self) -> Future:
+        if self._startup.is_ready(self._step):
+            return self._client.hangup_all()
+        future: Future = Future()
+        future.set_result(None)
+        return future
@@ -1,8 +1,14 @@
+import bisect
 import json
-import time
+import os
+import sqlite3
+import threading
 from os import path
+from typing import Callable, Collection, Iterable, Iterator, NamedTuple, Optional, Union
 import filelock
 
+from fetap import watch
+
 
 class PhoneBookError(Exception): pass
 class EntryExists(PhoneBookError): pass
@@ -13,82 +19,583 @@ class NumberDoesNotExist(EntryDoesNotExist): pass
 class AddressDoesNotExist(EntryDoesNotExist): pass
 
 
+class _Snapshot(NamedTuple):
+    """One version of the phone book file, never modified once created"""
+    numbers_to_addresses: dict[str, str]
+    addresses_to_numbers: dict[str, str]
+    # Identifies the file version the snapshot was read from. Writers replace
+    # the file, so the inode changes even if mtime has a coarse resolution.
+    stamp: tuple[int, int, int]
+    # For prefix searches and pages with bisect
+    sorted_numbers: list[str]
+    sorted_addresses: list[str]
+
+
+def _make_snapshot(
+    numbers_to_addresses: dict[str, str], stamp: tuple[int, int, int]
+) -> _Snapshot:
+    return _Snapshot(
+        numbers_to_addresses,
+        {a: n for n, a in numbers_to_addresses.items()},
+        stamp,
+        sorted(numbers_to_addresses),
+        sorted(numbers_to_addresses.values()),
+    )
+
+
+def _inserted(keys: list[str], key: str) -> list[str]:
+    """A copy of sorted keys with key added, without sorting them again"""
+    keys = list(keys)
+    bisect.insort(keys, key)
+    return keys
+
+
+def _removed(keys: list[str], key: str) -> list[str]:
+    keys = list(keys)
+    del keys[bisect.bisect_left(keys, key)]
+    return keys
+
+
+_EMPTY_SNAPSHOT = _make_snapshot({}, (-1, -1, -1))
+
+
+def _prefix_end(prefix: str) -> str:
+    """The first string after all strings that start with prefix"""
+    if not prefix:
+        return "\U0010ffff"
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+# The fields entries can be searched and paged by, both are unique
+PAGE_FIELDS = ("number", "address")
+
+
+# A number and its new address, or None if it was removed
+Change = tuple[str, Optional[str]]
+# The position of a row in a bulk insert and why it was not inserted
+Conflict = tuple[int, EntryExists]
+
+
+def _check_field(field: str) -> None:
+    if field not in PAGE_FIELDS:
+        raise ValueError(f"Can't page by {field!r}, only by {PAGE_FIELDS}")
+
+# Called with the numbers that were added and the numbers that were removed
+ChangeListener = Callable[[Collection[str], Collection[str]], None]
+
+
+def _stamp(stat_result: os.stat_result) -> tuple[int, int, int]:
+    return (stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size)
+
+
 class PhoneBook:
+    """A phone book stored as a JSON file, shared between processes.
+
+    Reads never take the file lock: writers publish a new version of the file
+    with an atomic rename, and readers swap in a new snapshot only when the
+    file they see changed. With start_watching, changes are pushed to the
+    phone book instead and lookups don't even stat the file.
+    """
+
     def __init__(self, file_path: str) -> None:
-        self._numbers_to_addresses: dict[str, str] = {}
-        self._addresses_to_numbers: dict[str, str] = {}
-        self.last_loaded = 0
+        self._snapshot = _EMPTY_SNAPSHOT
         self.file_path = file_path
         self._file_lock = filelock.FileLock(self.file_path + ".lock")
+        self._watcher: Optional[watch.FileWatcher] = None
+        self._listeners: list[ChangeListener] = []
+        self._snapshot_lock = threading.Lock()
         self._ensure_file_exists()
 
+    def add_change_listener(self, listener: ChangeListener) -> None:
+        """Tell listener about every change to the numbers.
+
+        It is called right away with all current numbers as added. Changes by
+        other processes are only seen when the phone book reloads, so a
+        listener should be combined with start_watching.
+        """
+        self._get_snapshot(should_reload=True)
+        with self._snapshot_lock:
+            listener(self._snapshot.numbers_to_addresses.keys(), ())
+            self._listeners.append(listener)
+
+    def start_watching(self) -> None:
+        """Reload on every change of the file, as soon as it happens"""
+        if self._watcher is not None:
+            return
+        self._watcher = watch.watch_file(self.file_path, self._maybe_reload_phone_book)
+        # Changes before the watch started would otherwise be missed
+        self._maybe_reload_phone_book()
+
+    def stop_watching(self) -> None:
+        if self._watcher is None:
+            return
+        self._watcher.stop()
+        self._watcher = None
+
     def _ensure_file_exists(self) -> None:
         with self._file_lock:
             if not path.isfile(self.file_path):
-                self._save_phone_book()
+                self._save_phone_book({})
 
-    def _save_phone_book(self) -> None:
-        with open(self.file_path, "w") as f:
-            json.dump(self._numbers_to_addresses, f, indent=2)
-    
-    def _maybe_reload_phone_book(self) -> None:
-        if path.getmtime(self.file_path) < self.last_loaded:
-            return
-        self.last_loaded = time.time()
+    def _save_phone_book(
+        self,
+        numbers_to_addresses: dict[str, str],
+        sorted_numbers: Optional[list[str]] = None,
+        sorted_addresses: Optional[list[str]] = None,
+    ) -> None:
+        """Must hold the file lock.
+
+        Pass the sorted numbers and addresses if they are already known, to
+        not sort the whole phone book again.
+        """
+        temp_path = self.file_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(numbers_to_addresses, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+            stamp = _stamp(os.fstat(f.fileno()))
+        os.replace(temp_path, self.file_path)
+        if sorted_numbers is None or sorted_addresses is None:
+            snapshot = _make_snapshot(numbers_to_addresses, stamp)
+        else:
+            snapshot = _Snapshot(
+                numbers_to_addresses,
+                {a: n for n, a in numbers_to_addresses.items()},
+                stamp,
+                sorted_numbers,
+                sorted_addresses,
+            )
+        self._publish(snapshot)
+
+    def _publish(self, snapshot: _Snapshot) -> None:
+        with self._snapshot_lock:
+            previous = self._snapshot
+            self._snapshot = snapshot
+            if not self._listeners:
+                return
+            old_numbers = previous.numbers_to_addresses.keys()
+            new_numbers = snapshot.numbers_to_addresses.keys()
+            added = new_numbers - old_numbers
+            removed = old_numbers - new_numbers
+            if not (added or removed):
+                return
+            for listener in self._listeners:
+                listener(added, removed)
+
+    def _maybe_reload_phone_book(self) -> _Snapshot:
+        snapshot = self._snapshot
+        if _stamp(os.stat(self.file_path)) == snapshot.stamp:
+            return snapshot
         with open(self.file_path) as f:
-            self._numbers_to_addresses = json.load(f)
-        self._addresses_to_numbers = {a: n for n, a in self._numbers_to_addresses.items()}
+            # Stamp the file we actually read, it may have been replaced since
+            stamp = _stamp(os.fstat(f.fileno()))
+            numbers_to_addresses = json.load(f)
+        snapshot = _make_snapshot(numbers_to_addresses, stamp)
+        self._publish(snapshot)
+        return snapshot
+
+    def _get_snapshot(self, should_reload: bool) -> _Snapshot:
+        if should_reload and self._watcher is None:
+            return self._maybe_reload_phone_book()
+        return self._snapshot
 
     def get_number(self, address: str, should_reload: bool=True) -> str:
-        if should_reload:
-            with self._file_lock:
-                self._maybe_reload_phone_book()
         try:
-            return self._addresses_to_numbers[address]
+            return self._get_snapshot(should_reload).addresses_to_numbers[address]
         except KeyError as e:
             raise AddressDoesNotExist() from e
     
     def get_address(self, number: str, should_reload: bool=True) -> str:
-        if should_reload:
-            with self._file_lock:
-                self._maybe_reload_phone_book()
         try:
-            return self._numbers_to_addresses[number]
+            return self._get_snapshot(should_reload).numbers_to_addresses[number]
         except KeyError as e:
             raise NumberDoesNotExist() from e
 
     def del_address(self, address: str) -> None:
         with self._file_lock:
-            number = self._addresses_to_numbers.pop(address)
-            del self._numbers_to_addresses[number]
-            self._save_phone_book()
+            snapshot = self._maybe_reload_phone_book()
+            number = snapshot.addresses_to_numbers[address]
+            self._save_without(snapshot, number)
     
     def del_number(self, number: str) -> None:
         with self._file_lock:
-            address = self._numbers_to_addresses.pop(number)
-            del self._addresses_to_numbers[address]
-            self._save_phone_book()
+            snapshot = self._maybe_reload_phone_book()
+            if number not in snapshot.numbers_to_addresses:
+                raise KeyError(number)
+            self._save_without(snapshot, number)
+
+    def _save_without(self, snapshot: _Snapshot, number: str) -> None:
+        numbers_to_addresses = dict(snapshot.numbers_to_addresses)
+        address = numbers_to_addresses.pop(number)
+        self._save_phone_book(
+            numbers_to_addresses,
+            _removed(snapshot.sorted_numbers, number),
+            _removed(snapshot.sorted_addresses, address),
+        )
 
     def insert(self, number: str, address: str) -> None:
         with self._file_lock:
-            self._maybe_reload_phone_book()
-            try:
-                self.get_address(address, should_reload=False)
-            except NumberDoesNotExist:
-                pass
-            else:
+            snapshot = self._maybe_reload_phone_book()
+            if address in snapshot.addresses_to_numbers:
                 raise AddressExists()
-            try:
-                self.get_number(number, should_reload=False)
-            except AddressDoesNotExist:
-                pass
-            else:
+            if number in snapshot.numbers_to_addresses:
                 raise NumberExists()
-            self._numbers_to_addresses[number] = address
-            self._addresses_to_numbers[address] = number
-            self._save_phone_book()
+            numbers_to_addresses = dict(snapshot.numbers_to_addresses)
+            numbers_to_addresses[number] = address
+            self._save_phone_book(
+                numbers_to_addresses,
+                _inserted(snapshot.sorted_numbers, number),
+                _inserted(snapshot.sorted_addresses, address),
+            )
+
+    def insert_many(self, entries: Iterable[tuple[str, str]]) -> list[Conflict]:
+        """Insert all entries that don't conflict, with a single write.
+
+        Returns the conflicting ones, including those that conflict with an
+        earlier entry.
+        """
+        with self._file_lock:
+            snapshot = self._maybe_reload_phone_book()
+            numbers_to_addresses = dict(snapshot.numbers_to_addresses)
+            addresses = set(snapshot.addresses_to_numbers)
+            conflicts: list[Conflict] = []
+            for row, (number, address) in enumerate(entries):
+                # Same precedence as insert
+                if address in addresses:
+                    conflicts.append((row, AddressExists()))
+                elif number in numbers_to_addresses:
+                    conflicts.append((row, NumberExists()))
+                else:
+                    numbers_to_addresses[number] = address
+                    addresses.add(address)
+            if len(numbers_to_addresses) != len(snapshot.numbers_to_addresses):
+                self._save_phone_book(numbers_to_addresses)
+            return conflicts
+
+    def apply_changes(self, changes: Iterable[Change]) -> None:
+        """Apply changes from an authoritative source, with a single write.
+
+        An address that moves to another number replaces that number's entry.
+        """
+        with self._file_lock:
+            snapshot = self._maybe_reload_phone_book()
+            numbers_to_addresses = dict(snapshot.numbers_to_addresses)
+            addresses_to_numbers = dict(snapshot.addresses_to_numbers)
+            for number, address in changes:
+                old_address = numbers_to_addresses.pop(number, None)
+                if old_address is not None:
+                    del addresses_to_numbers[old_address]
+                if address is None:
+                    continue
+                old_number = addresses_to_numbers.pop(address, None)
+                if old_number is not None:
+                    del numbers_to_addresses[old_number]
+                numbers_to_addresses[number] = address
+                addresses_to_numbers[address] = number
+            if numbers_to_addresses != snapshot.numbers_to_addresses:
+                self._save_phone_book(numbers_to_addresses)
     
     def list_all(self) -> list[tuple[str, str]]:
-        with self._file_lock:
-            self._maybe_reload_phone_book()
-            return [(n, a) for n, a in sorted(self._numbers_to_addresses.items())]
+        snapshot = self._get_snapshot(should_reload=True)
+        return [(n, snapshot.numbers_to_addresses[n]) for n in snapshot.sorted_numbers]
+
+    def numbers_with_prefix(
+        self, prefix: str, limit: Optional[int] = None, should_reload: bool = True
+    ) -> list[str]:
+        """The numbers starting with prefix, in order"""
+        numbers = self._get_snapshot(should_reload).sorted_numbers
+        start = bisect.bisect_left(numbers, prefix)
+        end = bisect.bisect_left(numbers, _prefix_end(prefix), lo=start)
+        if limit is not None:
+            end = min(end, start + limit)
+        return numbers[start:end]
+
+    def page(
+        self,
+        prefix: str = "",
+        after: str = "",
+        limit: int = 50,
+        field: str = "number",
+    ) -> list[tuple[str, str]]:
+        """Up to limit entries whose field starts with prefix, ordered by field.
+
+        Only entries whose field comes after `after` are included, pass the
+        last one of a page to get the next.
+        """
+        _check_field(field)
+        snapshot = self._get_snapshot(should_reload=True)
+        if field == "number":
+            keys = snapshot.sorted_numbers
+        else:
+            keys = snapshot.sorted_addresses
+        start = max(bisect.bisect_left(keys, prefix), bisect.bisect_right(keys, after))
+        end = min(bisect.bisect_left(keys, _prefix_end(prefix), lo=start), start + limit)
+        if field == "number":
+            return [(n, snapshot.numbers_to_addresses[n]) for n in keys[start:end]]
+        return [(snapshot.addresses_to_numbers[a], a) for a in keys[start:end]]
+
+    def revision(self) -> str:
+        """Changes whenever the entries change"""
+        return "-".join(str(part) for part in self._get_snapshot(should_reload=True).stamp)
+
+
+class SqlitePhoneBook:
+    """A PhoneBook stored in SQLite, for large phone books.
+
+    Lookups use the indexes on number and address and every change writes a
+    single row, instead of reading and writing the whole file.
+    """
+
+    def __init__(self, file_path: str) -> None:
+        self.file_path = file_path
+        self._local = threading.local()
+        self._watcher: Optional[watch.FileWatcher] = None
+        self._listeners: list[ChangeListener] = []
+        self._listeners_lock = threading.Lock()
+        # The numbers the listeners were last told about
+        self._numbers: set[str] = set()
+        with self._connection as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS phone_book ("
+                "number TEXT PRIMARY KEY, address TEXT NOT NULL UNIQUE"
+                ")"
+            )
+            # Counts the changes, across processes, for revision()
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS revision ("
+                "id INTEGER PRIMARY KEY CHECK (id = 0), value INTEGER NOT NULL"
+                ")"
+            )
+            connection.execute("INSERT OR IGNORE INTO revision (id, value) VALUES (0, 0)")
+            for operation in ("INSERT", "UPDATE", "DELETE"):
+                connection.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS count_{operation.lower()} "
+                    f"AFTER {operation} ON phone_book "
+                    "BEGIN UPDATE revision SET value = value + 1; END"
+                )
+
+    def start_watching(self) -> None:
+        """Tell the change listeners about changes by other processes too.
+
+        Lookups always read the current data, only listeners need this.
+        """
+        if self._watcher is not None:
+            return
+        # Commits append to the write-ahead log, the database file itself only
+        # changes on checkpoints. It is only modified, never closed or
+        # replaced, so inotify's events don't fit and it is polled instead.
+        self._watcher = watch.PollingWatcher(self.file_path + "-wal", self._notify_changes)
+        self._watcher.start()
+        self._notify_changes()
+
+    def stop_watching(self) -> None:
+        if self._watcher is None:
+            return
+        self._watcher.stop()
+        self._watcher = None
+
+    def add_change_listener(self, listener: ChangeListener) -> None:
+        """Tell listener about every change to the numbers.
+
+        It is called right away with all current numbers as added. Finding the
+        changes reads all numbers, which is fine as long as changes are rare.
+        """
+        with self._listeners_lock:
+            if not self._listeners:
+                self._numbers = self._all_numbers()
+            listener(set(self._numbers), ())
+            self._listeners.append(listener)
+
+    def _all_numbers(self) -> set[str]:
+        return {row[0] for row in self._connection.execute("SELECT number FROM phone_book")}
+
+    def _notify_changes(self) -> None:
+        with self._listeners_lock:
+            if not self._listeners:
+                return
+            numbers = self._all_numbers()
+            added = numbers - self._numbers
+            removed = self._numbers - numbers
+            self._numbers = numbers
+            if not (added or removed):
+                return
+            for listener in self._listeners:
+                listener(added, removed)
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.file_path)
+            # WAL lets lookups run while someone else is writing
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get_number(self, address: str, should_reload: bool=True) -> str:
+        row = self._connection.execute(
+            "SELECT number FROM phone_book WHERE address = ?", (address,)
+        ).fetchone()
+        if row is None:
+            raise AddressDoesNotExist()
+        return row[0]
+
+    def get_address(self, number: str, should_reload: bool=True) -> str:
+        row = self._connection.execute(
+            "SELECT address FROM phone_book WHERE number = ?", (number,)
+        ).fetchone()
+        if row is None:
+            raise NumberDoesNotExist()
+        return row[0]
+
+    def del_address(self, address: str) -> None:
+        with self._connection as connection:
+            deleted = connection.execute(
+                "DELETE FROM phone_book WHERE address = ?", (address,)
+            ).rowcount
+        if not deleted:
+            raise KeyError(address)
+        self._notify_changes()
+
+    def del_number(self, number: str) -> None:
+        with self._connection as connection:
+            deleted = connection.execute(
+                "DELETE FROM phone_book WHERE number = ?", (number,)
+            ).rowcount
+        if not deleted:
+            raise KeyError(number)
+        self._notify_changes()
+
+    def insert(self, number: str, address: str) -> None:
+        with self._connection as connection:
+            try:
+                connection.execute(
+                    "INSERT INTO phone_book (number, address) VALUES (?, ?)",
+                    (number, address),
+                )
+            except sqlite3.IntegrityError:
+                inserted = False
+            else:
+                inserted = True
+        if inserted:
+            self._notify_changes()
+            return
+        # Same precedence as PhoneBook.insert
+        raise self._conflict(number, address)
+
+    def _conflict(self, number: str, address: str) -> EntryExists:
+        try:
+            self.get_number(address)
+        except AddressDoesNotExist:
+            return NumberExists()
+        return AddressExists()
+
+    def insert_many(self, entries: Iterable[tuple[str, str]]) -> list[Conflict]:
+        """Insert all entries that don't conflict, in a single transaction"""
+        conflicts: list[Conflict] = []
+        with self._connection as connection:
+            for row, (number, address) in enumerate(entries):
+                try:
+                    connection.execute(
+                        "INSERT INTO phone_book (number, address) VALUES (?, ?)",
+                        (number, address),
+                    )
+                except sqlite3.IntegrityError:
+                    # Only the statement is undone, not the transaction
+                    conflicts.append((row, self._conflict(number, address)))
+        self._notify_changes()
+        return conflicts
+
+    def apply_changes(self, changes: Iterable[Change]) -> None:
+        """Apply changes from an authoritative source, in a single transaction.
+
+        An address that moves to another number replaces that number's entry.
+        """
+        with self._connection as connection:
+            for number, address in changes:
+                connection.execute("DELETE FROM phone_book WHERE number = ?", (number,))
+                if address is None:
+                    continue
+                connection.execute("DELETE FROM phone_book WHERE address = ?", (address,))
+                connection.execute(
+                    "INSERT INTO phone_book (number, address) VALUES (?, ?)", (number, address)
+                )
+        self._notify_changes()
+
+    def list_all(self) -> list[tuple[str, str]]:
+        return self._connection.execute(
+            "SELECT number, address FROM phone_book ORDER BY number"
+        ).fetchall()
+
+    def numbers_with_prefix(
+        self, prefix: str, limit: Optional[int] = None, should_reload: bool = True
+    ) -> list[str]:
+        # A range on the primary key, so this uses its index unlike LIKE
+        rows = self._connection.execute(
+            "SELECT number FROM phone_book WHERE number >= ? AND number < ?"
+            " ORDER BY number LIMIT ?",
+            (prefix, _prefix_end(prefix), -1 if limit is None else limit),
+        )
+        return [row[0] for row in rows]
+
+    def page(
+        self,
+        prefix: str = "",
+        after: str = "",
+        limit: int = 50,
+        field: str = "number",
+    ) -> list[tuple[str, str]]:
+        _check_field(field)
+        # field is one of PAGE_FIELDS, both have an index
+        return self._connection.execute(
+            f"SELECT number, address FROM phone_book WHERE {field} >= ? AND {field} < ?"
+            f" AND {field} > ? ORDER BY {field} LIMIT ?",
+            (prefix, _prefix_end(prefix), after, limit),
+        ).fetchall()
+
+    def revision(self) -> str:
+        return str(
+            self._connection.execute("SELECT value FROM revision").fetchone()[0]
+        )
+
+
+def iter_entries(
+    phone_book: Union[PhoneBook, SqlitePhoneBook], page_size: int = 500
+) -> Iterator[tuple[str, str]]:
+    """All entries ordered by number, read a page at a time"""
+    after = ""
+    while True:
+        entries = phone_book.page(after=after, limit=page_size)
+        yield from entries
+        if len(entries) < page_size:
+            return
+        after = entries[-1][0]
+
+
+def open_phone_book(
+    file_path: str, watch: bool = False
+) -> Union[PhoneBook, SqlitePhoneBook]:
+    """Pick the phone book implementation from the file extension"""
+    if file_path.endswith((".sqlite", ".sqlite3", ".db")):
+        phone_book = SqlitePhoneBook(file_path)
+    else:
+        phone_book = PhoneBook(file_path)
+    if watch:
+        phone_book.start_watching()
+    return phone_book
+
+
+def migrate_to_sqlite(json_path: str, sqlite_path: str) -> int:
+    """Copy all entries of a JSON phone book into a SQLite phone book.
+
+    Returns the number of entries that were copied.
+    """
+    entries = PhoneBook(json_path).list_all()
+    phone_book = SqlitePhoneBook(sqlite_path)
+    with phone_book._connection as connection:
+        connection.executemany(
+            "INSERT INTO phone_book (number, address) VALUES (?, ?)", entries
+        )
+    return len(entries)
@@ -0,0 +1,109 @@
+"""Keeps the phone book in sync with the directory of a fetap_server.
+
+The phone asks for the changes since the revision it last synced, with the
+ETag of the last response, so an unchanged directory costs a 304 and a change
+costs only the changed entries. The revision and ETag are kept next to the
+phone book, delete that file to sync everything again.
+"""
+from __future__ import annotations
+import gzip
+import json
+import os
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import NamedTuple, Optional, Union
+
+import logging
+
+from fetap import storage
+
+log = logging.getLogger(__name__)
+
+SYNC_INTERVAL = 60
+
+
+class SyncState(NamedTuple):
+    revision: int = 0
+    etag: Optional[str] = None
+
+
+def load_state(file_path: str) -> SyncState:
+    try:
+        with open(file_path) as f:
+            return SyncState(**json.load(f))
+    except FileNotFoundError:
+        return SyncState()
+
+
+def save_state(file_path: str, state: SyncState) -> None:
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(state._asdict(), f)
+    os.replace(temp_path, file_path)
+
+
+class DirectorySync:
+    def __init__(
+        self,
+        phone_book: Union[storage.PhoneBook, storage.SqlitePhoneBook],
+        url: str,
+        state_path: str,
+        interval: float = SYNC_INTERVAL,
+    ) -> None:
+        self.phone_book = phone_book
+        self.url = url
+        self.state_path = state_path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sync(self) -> int:
+        """Pull the changes since the last sync, returns how many there were"""
+        state = load_state(self.state_path)
+        url = self.url + "?" + urllib.parse.urlencode({"since": state.revision})
+        headers = {"Accept-Encoding": "gzip"}
+        if state.etag is not None:
+            headers["If-None-Match"] = state.etag
+        try:
+            with urllib.request.urlopen(
+                urllib.request.Request(url, headers=headers), timeout=10
+            ) as response:
+                body = response.read()
+                if response.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                etag = response.headers.get("ETag")
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return 0
+            raise
+        data = json.loads(body)
+        changes = [(change["number"], change["address"]) for change in data["changes"]]
+        if changes:
+            self.phone_book.apply_changes(changes)
+        save_state(self.state_path, SyncState(data["revision"], etag))
+        log.info("Synced %s changes up to revision %s", len(changes), data["revision"])
+        return len(changes)
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._mainloop, daemon=True, name="sync")
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _mainloop(self) -> None:
+        """sync mainloop"""
+        while True:
+            try:
+                self.sync()
+            except (OSError, ValueError, KeyError):
+                # The phone works with the phone book it has until the next try
+                log.exception("Syncing with %s failed", self.url)
+            if self._stop.wait(self.interval):
+                return
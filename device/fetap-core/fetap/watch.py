@@ -0,0 +1,158 @@
+"""Get notified when a file changes.
+
+On Linux this uses inotify, everywhere else (or if inotify is unavailable) the
+file is polled.
+"""
+from __future__ import annotations
+import ctypes
+import ctypes.util
+import os
+import struct
+import threading
+from os import path
+from typing import Callable, Protocol
+
+import logging
+
+log = logging.getLogger(__name__)
+
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_IGNORED = 0x00008000
+_IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+_POLL_INTERVAL = 1
+
+
+def _notify(on_change: Callable[[], None]) -> None:
+    try:
+        on_change()
+    except Exception:
+        # Keep watching, the next change may well succeed
+        log.exception("Handling a file change failed")
+
+
+class FileWatcher(Protocol):
+    def start(self) -> None: ...
+    def stop(self) -> None: ...
+
+
+class InotifyWatcher:
+    """Calls on_change whenever the file is written, replaced or deleted.
+
+    The directory is watched rather than the file, because writers replace the
+    file with a rename.
+    """
+
+    def __init__(self, file_path: str, on_change: Callable[[], None]) -> None:
+        self._directory, self._file_name = path.split(path.abspath(file_path))
+        self._on_change = on_change
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError("libc not found")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        # Raises AttributeError if there is no inotify
+        self._libc.inotify_init1
+        self._fd = -1
+        self._watch = -1
+        self._thread = threading.Thread(
+            target=self._watch_loop, daemon=True, name=f"watch-{self._file_name}"
+        )
+        self._should_stop = threading.Event()
+
+    def start(self) -> None:
+        self._fd = self._libc.inotify_init1(_IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watch = self._libc.inotify_add_watch(
+            self._fd,
+            self._directory.encode(),
+            _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE,
+        )
+        if self._watch < 0:
+            os.close(self._fd)
+            raise OSError(ctypes.get_errno(), f"Can't watch {self._directory}")
+        self._thread.start()
+
+    def _watch_loop(self) -> None:
+        """watch mainloop"""
+        while not self._should_stop.is_set():
+            data = os.read(self._fd, 4096)
+            changed = False
+            offset = 0
+            while offset < len(data):
+                _, mask, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset : offset + name_length].split(b"\0", 1)[0]
+                offset += name_length
+                if mask & _IN_IGNORED:
+                    return
+                changed = changed or name.decode() == self._file_name
+            if changed:
+                _notify(self._on_change)
+
+    def stop(self) -> None:
+        self._should_stop.set()
+        # Removing the watch queues IN_IGNORED, which wakes up the read
+        self._libc.inotify_rm_watch(self._fd, self._watch)
+        self._thread.join()
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """Calls on_change when the stat of the file changes, checked periodically"""
+
+    def __init__(
+        self,
+        file_path: str,
+        on_change: Callable[[], None],
+        interval: float = _POLL_INTERVAL,
+    ) -> None:
+        self._file_path = file_path
+        self._on_change = on_change
+        self._interval = interval
+        self._thread = threading.Thread(
+            target=self._poll_loop,
+            daemon=True,
+            name=f"watch-{path.basename(file_path)}",
+        )
+        self._should_stop = threading.Event()
+        self._last: tuple[int, int, int] | None = None
+
+    def _stat(self) -> tuple[int, int, int] | None:
+        try:
+            result = os.stat(self._file_path)
+        except FileNotFoundError:
+            return None
+        return (result.st_ino, result.st_mtime_ns, result.st_size)
+
+    def start(self) -> None:
+        # Changes right after start returns must not be missed
+        self._last = self._stat()
+        self._thread.start()
+
+    def _poll_loop(self) -> None:
+        """watch mainloop"""
+        while not self._should_stop.wait(self._interval):
+            current = self._stat()
+            if current != self._last:
+                self._last = current
+                _notify(self._on_change)
+
+    def stop(self) -> None:
+        self._should_stop.set()
+        self._thread.join()
+
+
+def watch_file(file_path: str, on_change: Callable[[], None]) -> FileWatcher:
+    """Start watching the file with inotify if possible, otherwise by polling"""
+    try:
+        watcher: FileWatcher = InotifyWatcher(file_path, on_change)
+        watcher.start()
+    except (OSError, AttributeError) as e:
+        log.warning("inotify is not available (%s), polling %s instead", e, file_path)
+        watcher = PollingWatcher(file_path, on_change)
+        watcher.start()
+    return watcher
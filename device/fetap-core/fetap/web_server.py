@@ -1,24 +1,117 @@
+import csv
+import io
+import itertools
+import json
 import os
-from flask import Flask, current_app, render_template, request, redirect, url_for
+from typing import Iterable, Iterator, Optional
 
-from fetap import storage, logging
+from flask import Flask, Response, current_app, jsonify, render_template, request, redirect, url_for
 
+from fetap import error_correction, storage, logging
 
-def create_app() -> Flask:
-    logging.configure()
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# The formats of bulk imports and exports, with their content types
+BULK_FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+
+def create_app(
+    phone_book: Optional[storage.PhoneBook] = None,
+    number_index: Optional[error_correction.NumberIndex] = None,
+) -> Flask:
+    """The config web app, on the phone's phone book if it runs in the same process"""
+    if phone_book is None:
+        # Started on its own, by `flask --app fetap.web_server run`
+        logging.configure()
+        phone_book = storage.open_phone_book(os.environ["PHONE_BOOK"], watch=True)
 
     app = Flask(__name__)
-    app.phone_book = storage.PhoneBook(file_path=os.environ["PHONE_BOOK"])
+    app.phone_book = phone_book
+    if number_index is None:
+        number_index = error_correction.NumberIndex(phone_book)
+    app.number_index = number_index
+    app.add_url_rule("/", view_func=home_page)
+    app.add_url_rule("/api/entries", view_func=list_entries)
+    app.add_url_rule("/api/import", view_func=import_entries, methods=["POST"])
+    app.add_url_rule("/api/export", view_func=export_entries)
+    app.add_url_rule("/add-number", view_func=add_number, methods=["GET", "POST"])
     return app
 
-app = create_app()
 
-@app.route("/")
-def home_page():
+def _page_args() -> tuple[str, str, str, int]:
+    field = request.args.get("field", "number")
+    if field not in storage.PAGE_FIELDS:
+        field = "number"
+    limit = request.args.get("limit", PAGE_SIZE, type=int)
+    return (
+        field,
+        request.args.get("prefix", ""),
+        request.args.get("after", ""),
+        min(max(1, limit), MAX_PAGE_SIZE),
+    )
+
+
+def _page(
+    field: str, prefix: str, after: str, limit: int
+) -> tuple[list[tuple[str, str]], Optional[str]]:
+    """A page of entries and the cursor of the next page, if there is one"""
     phone_book: storage.PhoneBook = current_app.phone_book
-    return render_template("list_numbers.html", entries=phone_book.list_all())
+    # One more entry than shown tells whether there is a next page
+    entries = phone_book.page(prefix, after, limit + 1, field)
+    if len(entries) <= limit:
+        return entries, None
+    entries = entries[:limit]
+    number, address = entries[-1]
+    return entries, number if field == "number" else address
+
+
+def _etag() -> tuple[str, Optional[Response]]:
+    """The ETag of the current phone book, and a 304 response if the client has it.
+
+    The revision is read before the entries, so a change in between makes the
+    ETag older than the response and the next request fetches it again.
+    """
+    phone_book: storage.PhoneBook = current_app.phone_book
+    etag = phone_book.revision()
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return etag, response
+    return etag, None
+
+
+def home_page():
+    etag, not_modified = _etag()
+    if not_modified is not None:
+        return not_modified
+    field, prefix, after, limit = _page_args()
+    entries, next_after = _page(field, prefix, after, limit)
+    response = Response(
+        render_template(
+            "list_numbers.html",
+            entries=entries,
+            field=field,
+            prefix=prefix,
+            limit=limit,
+            next_after=next_after,
+        )
+    )
+    response.set_etag(etag)
+    return response
+
+def list_entries():
+    etag, not_modified = _etag()
+    if not_modified is not None:
+        return not_modified
+    field, prefix, after, limit = _page_args()
+    entries, next_after = _page(field, prefix, after, limit)
+    response = jsonify(
+        entries=[{"number": number, "address": address} for number, address in entries],
+        next=next_after,
+    )
+    response.set_etag(etag)
+    return response
 
-@app.route("/add-number", methods=["GET", "POST"])
 def add_number():
     if request.method == "POST":
         return add_number_post()
@@ -29,16 +122,122 @@ def add_number_post():
     number = request.form.get("number")
 
     if address is None or number is None:
-        return 400, "address and number can't be None"
+        return "address and number can't be None", 400
     address = str(address)
     number = str(number)
 
+    try:
+        phone_number = error_correction.as_phone_number(number)
+    except ValueError:
+        # Not a number the dial can produce, nothing to confuse it with
+        pass
+    else:
+        number_index: error_correction.NumberIndex = current_app.number_index
+        similar = [
+            n for n, _ in number_index.find_similar_numbers(phone_number) if n != phone_number
+        ]
+        if similar:
+            too_close = ", ".join("".join(str(d) for d in n) for n in similar)
+            return f"Number is too similar to {too_close}", 400
+
     phone_book: storage.PhoneBook = current_app.phone_book
     try:
         phone_book.insert(number, address)
     except storage.NumberExists:
-        return 400, "Number exists"
+        return "Number exists", 400
     except storage.AddressExists:
-        return 400, "address exists"
+        return "address exists", 400
+
+    return redirect(url_for("home_page"))
+
+
+def _bulk_format(default: str) -> Optional[str]:
+    """The format from the query, the content type or default, None if unknown"""
+    format = request.args.get("format")
+    if format is None:
+        by_type = {t: f for f, t in BULK_FORMATS.items()}
+        format = by_type.get(request.mimetype, default)
+    return format if format in BULK_FORMATS else None
+
+
+def _read_rows(format: str, lines: Iterable[bytes]) -> Iterator[object]:
+    text = (line.decode("utf-8") for line in lines)
+    if format == "csv":
+        yield from csv.DictReader(text)
+        return
+    for line in text:
+        if line.strip():
+            yield json.loads(line)
+
+
+def import_entries():
+    """Insert the uploaded entries, the ones that don't conflict.
+
+    Every row needs a number and an address. If any row doesn't, nothing is
+    inserted. Rows are counted from 1, without the CSV header.
+    """
+    format = _bulk_format(default="jsonl")
+    if format is None:
+        return f"Format must be one of {', '.join(BULK_FORMATS)}", 400
+    entries: list[tuple[str, str]] = []
+    invalid = []
+    try:
+        # Parsed as the upload arrives, without reading it all first
+        for row, values in enumerate(_read_rows(format, request.stream), start=1):
+            number = values.get("number") if isinstance(values, dict) else None
+            address = values.get("address") if isinstance(values, dict) else None
+            if not (isinstance(number, str) and number and isinstance(address, str) and address):
+                invalid.append(row)
+                continue
+            entries.append((number, address))
+    except (UnicodeDecodeError, ValueError, csv.Error) as e:
+        return f"Can't read the {format} upload: {e}", 400
+    if invalid:
+        return jsonify(imported=0, conflicts=[], invalid=invalid), 400
+
+    phone_book: storage.PhoneBook = current_app.phone_book
+    conflicts = phone_book.insert_many(entries)
+    return jsonify(
+        imported=len(entries) - len(conflicts),
+        conflicts=[
+            {
+                "row": row + 1,
+                "number": entries[row][0],
+                "address": entries[row][1],
+                "error": type(error).__name__,
+            }
+            for row, error in conflicts
+        ],
+        invalid=[],
+    )
+
+
+def _csv_lines(entries: Iterable[tuple[str, str]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in itertools.chain([("number", "address")], entries):
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
 
-    return redirect(url_for("home_page"))
\ No newline at end of file
+def export_entries():
+    """All entries, streamed a page at a time"""
+    format = _bulk_format(default="csv")
+    if format is None:
+        return f"Format must be one of {', '.join(BULK_FORMATS)}", 400
+    # Look up the phone book now, the response is generated after the request
+    entries = storage.iter_entries(current_app.phone_book)
+    if format == "csv":
+        lines = _csv_lines(entries)
+    else:
+        lines = (
+            json.dumps({"number": number, "address": address}) + "\n"
+            for number, address in entries
+        )
+    return Response(
+        lines,
+        mimetype=BULK_FORMATS[format],
+        headers={"Content-Disposition": f"attachment; filename=phone_book.{format}"},
+    )
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""A scripted stand-in for the pjsua CLI.
+
+It speaks just enough of the pjsua console protocol for `fetap.pjsua.PJSua`:
+commands are read from stdin and every response is terminated by the `>>>`
+prompt. Call state changes are logged like pjsua does at log level 3.
+
+The remote side of a call is controlled with signals:
+    SIGUSR1: a call comes in
+    SIGUSR2: the remote party hangs up all calls
+"""
+import os
+import signal
+import sys
+import time
+
+
+log_level = 5
+calls: dict[int, str] = {}
+next_call_id = 0
+
+
+def write(text: str) -> None:
+    # Signal handlers may interrupt a write in progress, so avoid buffered io
+    os.write(sys.stdout.fileno(), text.encode())
+
+
+def log(message: str) -> None:
+    if log_level < 3:
+        return
+    now = time.time()
+    timestamp = time.strftime("%H:%M:%S", time.localtime(now))
+    write(f"{timestamp}.{int(now * 1000) % 1000:03d}   pjsua_app.c  .......{message}\n")
+
+
+def set_state(call_id: int, state: str) -> None:
+    if state == "DISCONNCTD":
+        calls.pop(call_id, None)
+        log(f"Call {call_id} is DISCONNECTED [reason=200 (Normal call clearing)]")
+        return
+    calls[call_id] = state
+    log(f"Call {call_id} state changed to {state}")
+
+
+def new_call_id() -> int:
+    global next_call_id
+    call_id = next_call_id
+    next_call_id += 1
+    return call_id
+
+
+def incoming_call(*args: object) -> None:
+    call_id = new_call_id()
+    calls[call_id] = "INCOMING"
+    log("Incoming call for account 0!\nFrom: <sip:fake@127.0.0.1>\nTo: <sip:127.0.0.1>")
+
+
+def remote_hangup(*args: object) -> None:
+    for call_id in list(calls):
+        set_state(call_id, "DISCONNCTD")
+
+
+def call_list() -> str:
+    lines = [f"You have {len(calls)} active call(s)"]
+    lines.extend(
+        f"  [{call_id}] sip:fake@127.0.0.1 [{state}]" for call_id, state in calls.items()
+    )
+    return "\n".join(lines)
+
+
+def handle(command: str) -> str:
+    if command == "call list":
+        return call_list()
+    if command.startswith("call new "):
+        call_id = new_call_id()
+        set_state(call_id, "CALLING")
+        set_state(call_id, "EARLY")
+        set_state(call_id, "CONFIRMED")
+        return ""
+    if command.startswith("call answer"):
+        for call_id, state in list(calls.items()):
+            if state == "INCOMING":
+                set_state(call_id, "CONNECTING")
+                set_state(call_id, "CONFIRMED")
+        return ""
+    if command == "call hangup_all":
+        remote_hangup()
+        return ""
+    return f"Unknown command: {command}"
+
+
+def main() -> None:
+    global log_level
+    for arg in sys.argv[1:]:
+        if arg.startswith("--log-level="):
+            log_level = int(arg.split("=", 1)[1])
+
+    signal.signal(signal.SIGUSR1, incoming_call)
+    signal.signal(signal.SIGUSR2, remote_hangup)
+
+    write(">>> ")
+    for line in sys.stdin:
+        response = handle(line.strip())
+        write(f"{response}\n>>> ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import pathlib
+import random
+import threading
+import time
+from typing import Optional
+import pytest
+from fetap import edges
+
+ACTIVE = 27
+PULSE = 22
+MS = 1_000_000
+
+
+class Session:
+    """Builds the edges a rotary dial produces"""
+
+    def __init__(self, seed: int = 0, bounces: int = 0, random_pulse_levels: bool = False) -> None:
+        self.rng = random.Random(seed)
+        self.bounces = bounces
+        self.random_pulse_levels = random_pulse_levels
+        self.time_ns = 1000 * MS
+        self.edges: list[edges.Edge] = []
+
+    def _edge(self, time_ns: int, channel: int, level: bool) -> None:
+        if channel == PULSE and self.random_pulse_levels:
+            level = self.rng.random() < 0.5
+        self.edges.append(edges.Edge(time_ns, channel, level))
+
+    def transition(self, channel: int, level: bool) -> None:
+        time_ns = self.time_ns
+        for _ in range(self.bounces):
+            self._edge(time_ns, channel, level)
+            time_ns += self.rng.randrange(MS // 10, MS)
+            self._edge(time_ns, channel, not level)
+            time_ns += self.rng.randrange(MS // 10, MS)
+        self._edge(time_ns, channel, level)
+
+    def wait(self, ms: float, jitter_ms: float = 0) -> None:
+        self.time_ns += int((ms + self.rng.uniform(-jitter_ms, jitter_ms)) * MS)
+
+    def dial(self, pulses: int, spike_after: Optional[int] = None) -> None:
+        self.transition(ACTIVE, True)
+        self.wait(300)
+        for pulse in range(pulses):
+            self.transition(PULSE, False)
+            self.wait(60, jitter_ms=8)
+            self.transition(PULSE, True)
+            self.wait(20)
+            if pulse == spike_after:
+                # Falls and comes right back, within the debounce time
+                self._edge(self.time_ns, PULSE, False)
+                self._edge(self.time_ns + MS // 2, PULSE, True)
+            self.wait(20, jitter_ms=5)
+        self.wait(30)
+        self.transition(ACTIVE, False)
+        self.wait(700)
+
+
+class TestDecode:
+    @pytest.mark.parametrize("bounces", [0, 1, 3])
+    def test_digits(self, bounces: int) -> None:
+        session = Session(bounces=bounces)
+        for pulses in [1, 10, 5, 3]:
+            session.dial(pulses)
+
+        assert edges.decode(session.edges, ACTIVE, PULSE) == [1, 10, 5, 3]
+
+    def test_pulse_levels_are_not_needed(self) -> None:
+        session = Session(bounces=2, random_pulse_levels=True)
+        for pulses in [7, 2, 9]:
+            session.dial(pulses)
+
+        assert edges.decode(session.edges, ACTIVE, PULSE) == [7, 2, 9]
+
+    def test_spike_is_ignored(self) -> None:
+        session = Session()
+        session.dial(4, spike_after=1)
+
+        assert edges.decode(session.edges, ACTIVE, PULSE) == [4]
+
+    def test_pulses_too_close_together(self) -> None:
+        session = Session()
+        session.transition(ACTIVE, True)
+        session.wait(100)
+        for _ in range(2):
+            session.transition(PULSE, False)
+            session.wait(15)
+            session.transition(PULSE, True)
+            session.wait(15)
+        session.wait(100)
+        session.transition(ACTIVE, False)
+
+        assert edges.decode(session.edges, ACTIVE, PULSE) == [1]
+
+    def test_events(self) -> None:
+        session = Session(bounces=2)
+        session.dial(2)
+        decoder = edges.DialDecoder(ACTIVE, PULSE)
+
+        events = [event for edge in session.edges for event in decoder.feed(edge)]
+        events += decoder.settle(float("inf"))
+
+        assert events == [
+            edges.DialEvent.ACTIVATE,
+            edges.DialEvent.PULSE,
+            edges.DialEvent.PULSE,
+            edges.DialEvent.DEACTIVATE,
+        ]
+
+    def test_last_pulses(self) -> None:
+        session = Session()
+        session.dial(3)
+        session.dial(6)
+        decoder = edges.DialDecoder(ACTIVE, PULSE)
+
+        for edge in session.edges:
+            decoder.feed(edge)
+        decoder.settle(float("inf"))
+
+        assert decoder.last_pulses == 6
+
+    def test_save_and_load(self, tmp_path: pathlib.Path) -> None:
+        session = Session(bounces=1)
+        session.dial(6)
+        file_path = str(tmp_path / "session.txt")
+
+        edges.save_edges(file_path, session.edges)
+
+        assert edges.load_edges(file_path) == session.edges
+        assert edges.decode(edges.load_edges(file_path), ACTIVE, PULSE) == [6]
+
+
+class TestEdgeBuffer:
+    def test_read(self) -> None:
+        buffer = edges.EdgeBuffer(capacity=4)
+        for i in range(3):
+            buffer.append(edges.Edge(i, PULSE, True))
+
+        read, position, dropped = buffer.read(1)
+
+        assert read == [edges.Edge(1, PULSE, True), edges.Edge(2, PULSE, True)]
+        assert position == 3
+        assert dropped == 0
+
+    def test_overflow(self) -> None:
+        buffer = edges.EdgeBuffer(capacity=4)
+        for i in range(10):
+            buffer.append(edges.Edge(i, PULSE, True))
+
+        read, position, dropped = buffer.read(0)
+
+        assert [edge.time_ns for edge in read] == [6, 7, 8, 9]
+        assert position == 10
+        assert dropped == 6
+        assert buffer.contents() == read
+
+    def test_read_timeout(self) -> None:
+        buffer = edges.EdgeBuffer()
+
+        assert buffer.read(0, timeout=0.01) == ([], 0, 0)
+
+
+class TestDialCapture:
+    def test_callbacks(self) -> None:
+        events: list[str] = []
+        done = threading.Event()
+
+        def _deactivate() -> None:
+            events.append("deactivate")
+            done.set()
+
+        capture = edges.DialCapture(
+            ACTIVE,
+            PULSE,
+            on_activate=lambda: events.append("activate"),
+            on_pulse=lambda: events.append("pulse"),
+            on_deactivate=_deactivate,
+        )
+        capture.start()
+        try:
+            session = Session(bounces=1)
+            session.dial(3)
+            # Replay in real time, shifted to now
+            offset = time.monotonic_ns() - session.edges[0].time_ns
+            for edge in session.edges:
+                delay = (edge.time_ns + offset - time.monotonic_ns()) / 1e9
+                if delay > 0:
+                    time.sleep(delay)
+                capture.buffer.append(edge._replace(time_ns=edge.time_ns + offset))
+            assert done.wait(timeout=5)
+        finally:
+            capture.stop()
+
+        assert events == ["activate", "pulse", "pulse", "pulse", "deactivate"]
@@ -1,3 +1,4 @@
+import random
 from typing import Iterable, Union
 import pytest
 from fetap import error_correction
@@ -40,6 +41,155 @@ class TestFindClosestPhoneNumbers:
         assert result == []
 
 
+@pytest.fixture(
+    params=[
+        False,
+        pytest.param(
+            True,
+            marks=pytest.mark.skipif(
+                error_correction._import_numpy() is None, reason="numpy is not installed"
+            ),
+        ),
+    ],
+    ids=["python", "numpy"],
+)
+def use_numpy(request: pytest.FixtureRequest) -> bool:
+    return request.param
+
+
+class TestPulseIndex:
+    def test_closest(self, use_numpy: bool) -> None:
+        index = error_correction.PulseIndex(NUMBERS, use_numpy=use_numpy)
+
+        result = index.closest(error_correction.as_pulse_counts([6, 4, 6, 4, 6, 4, 6]), k=2)
+
+        assert result == [
+            (error_correction.as_phone_number("5555555"), 7),
+            (error_correction.as_phone_number("0987654"), 17),
+        ]
+
+    def test_closest_max_distance(self, use_numpy: bool) -> None:
+        index = error_correction.PulseIndex(NUMBERS, use_numpy=use_numpy)
+
+        result = index.closest(
+            error_correction.as_pulse_counts([6, 4, 6, 4, 6, 4, 7]), k=3, max_distance=7
+        )
+
+        assert result == []
+
+    def test_ties_keep_index_order(self, use_numpy: bool) -> None:
+        numbers = [
+            error_correction.as_phone_number("2222222"),
+            error_correction.as_phone_number("1111111"),
+            error_correction.as_phone_number("3333333"),
+        ]
+        index = error_correction.PulseIndex(numbers, use_numpy=use_numpy)
+
+        result = index.closest(error_correction.as_pulse_counts([2] * 7), k=3)
+
+        assert [number for number, _ in result] == numbers
+
+    def test_prefix(self, use_numpy: bool) -> None:
+        index = error_correction.PulseIndex(NUMBERS, use_numpy=use_numpy)
+
+        result = index.within(error_correction.PulseCounts((5, 5, 4)), max_distance=2)
+
+        assert result == [(error_correction.as_phone_number("5555555"), 1)]
+
+    def test_numpy_only_for_many_numbers(self) -> None:
+        few = error_correction.PulseIndex(NUMBERS)
+        many = error_correction.PulseIndex(
+            NUMBERS * (error_correction.NUMPY_MIN_NUMBERS // len(NUMBERS) + 1)
+        )
+
+        assert few._np is None
+        assert (many._np is None) == (error_correction._import_numpy() is None)
+
+    def test_empty(self, use_numpy: bool) -> None:
+        index = error_correction.PulseIndex([], use_numpy=use_numpy)
+
+        assert index.closest(error_correction.as_pulse_counts([1] * 7)) == []
+        assert index.within(error_correction.as_pulse_counts([1] * 7)) == []
+
+    def test_matches_find_closest_phone_numbers(self, use_numpy: bool) -> None:
+        rng = random.Random(0)
+        numbers = [
+            error_correction.as_phone_number([rng.randrange(10) for _ in range(7)])
+            for _ in range(500)
+        ]
+        index = error_correction.PulseIndex(numbers, use_numpy=use_numpy)
+
+        for _ in range(50):
+            # Include pulse counts no digit can produce
+            pulses = error_correction.as_pulse_counts(
+                [rng.randrange(40) for _ in range(7)]
+            )
+            expected = error_correction.find_closest_phone_numbers(pulses, numbers, 40)
+
+            assert index.within(pulses, 40) == expected
+            assert index.closest(pulses, k=len(numbers), max_distance=40) == sorted(
+                expected, key=lambda match: match[1]
+            )
+
+
+def _random_numbers(rng: random.Random, count: int) -> list[error_correction.PhoneNumber]:
+    return [
+        error_correction.as_phone_number([rng.randrange(10) for _ in range(7)])
+        for _ in range(count)
+    ]
+
+
+class TestBKTree:
+    def test_within_matches_linear_scan(self) -> None:
+        rng = random.Random(1)
+        numbers = list(dict.fromkeys(_random_numbers(rng, 300)))
+        tree = error_correction.BKTree(numbers)
+
+        for _ in range(50):
+            pulses = error_correction.as_pulse_counts([rng.randrange(1, 12) for _ in range(7)])
+            expected = error_correction.find_closest_phone_numbers(pulses, numbers, 12)
+
+            assert tree.within(pulses, 12) == sorted(
+                expected, key=lambda match: (match[1], match[0])
+            )
+
+    def test_insert_and_remove(self) -> None:
+        rng = random.Random(2)
+        tree = error_correction.BKTree()
+        present: set[error_correction.PhoneNumber] = set()
+
+        for number in _random_numbers(rng, 1000):
+            if number in present and rng.random() < 0.7:
+                tree.remove(number)
+                present.remove(number)
+            else:
+                tree.insert(number)
+                present.add(number)
+
+        assert len(tree) == len(present)
+        pulses = error_correction.as_pulse_counts([5] * 7)
+        expected = error_correction.find_closest_phone_numbers(pulses, list(present), 20)
+        assert sorted(tree.within(pulses, 20)) == sorted(expected)
+
+    def test_remove_missing(self) -> None:
+        tree = error_correction.BKTree(NUMBERS)
+        tree.remove(NUMBERS[0])
+
+        with pytest.raises(KeyError):
+            tree.remove(NUMBERS[0])
+        assert NUMBERS[0] not in tree
+        assert len(tree) == len(NUMBERS) - 1
+
+    def test_find_similar_numbers(self) -> None:
+        tree = error_correction.BKTree(NUMBERS)
+        new_number = error_correction.as_phone_number("5555556")
+
+        assert tree.find_similar_numbers(new_number) == sorted(
+            error_correction.find_similar_numbers(new_number, NUMBERS),
+            key=lambda match: match[1],
+        )
+
+
 class TestAsPulseCounts:
     @pytest.mark.parametrize(
         "pulses",
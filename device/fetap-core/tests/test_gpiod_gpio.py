@@ -0,0 +1,139 @@
+"""Runs the gpiod backend against a simulated GPIO chip.
+
+Needs the gpio-sim kernel module and write access to its configfs directory,
+usually: modprobe gpio-sim && mount -t configfs none /sys/kernel/config
+"""
+import os
+import pathlib
+import threading
+import time
+import uuid
+from typing import Iterator
+import pytest
+
+gpiod = pytest.importorskip("gpiod")
+
+from fetap import edges, gpiod_gpio
+
+GPIO_SIM = pathlib.Path("/sys/kernel/config/gpio-sim")
+
+pytestmark = pytest.mark.skipif(
+    not os.access(GPIO_SIM, os.W_OK), reason="gpio-sim is not available"
+)
+
+ACTIVE = 27
+PULSE = 22
+RING = 17
+
+
+class SimulatedChip:
+    def __init__(self, directory: pathlib.Path) -> None:
+        self.directory = directory
+        bank = directory / "bank0"
+        self.chip_name = (bank / "chip_name").read_text().strip()
+        self.path = f"/dev/{self.chip_name}"
+        dev_name = (directory / "dev_name").read_text().strip()
+        self._lines = pathlib.Path("/sys/devices/platform") / dev_name / self.chip_name
+
+    def pull(self, offset: int, high: bool) -> None:
+        """Drive an input line, like the phone's contacts would"""
+        (self._lines / f"sim_gpio{offset}" / "pull").write_text(
+            "pull-up" if high else "pull-down"
+        )
+
+    def value(self, offset: int) -> bool:
+        return (self._lines / f"sim_gpio{offset}" / "value").read_text().strip() == "1"
+
+
+@pytest.fixture()
+def chip(monkeypatch: pytest.MonkeyPatch) -> Iterator[SimulatedChip]:
+    directory = GPIO_SIM / f"fetap-{uuid.uuid4().hex[:8]}"
+    directory.mkdir()
+    (directory / "bank0").mkdir()
+    (directory / "bank0" / "num_lines").write_text("32")
+    (directory / "live").write_text("1")
+    simulated = SimulatedChip(directory)
+    monkeypatch.setattr(gpiod_gpio, "CHIP_PATH", simulated.path)
+    try:
+        yield simulated
+    finally:
+        gpiod_gpio.cleanup()
+        (directory / "live").write_text("0")
+        (directory / "bank0").rmdir()
+        directory.rmdir()
+
+
+class TestGpiodGpio:
+    def test_output(self, chip: SimulatedChip) -> None:
+        gpiod_gpio.setup(RING, gpiod_gpio.OUT, initial=gpiod_gpio.LOW)
+        assert not chip.value(RING)
+
+        gpiod_gpio.output(RING, gpiod_gpio.HIGH)
+
+        assert chip.value(RING)
+
+    def test_input(self, chip: SimulatedChip) -> None:
+        gpiod_gpio.setup(ACTIVE, gpiod_gpio.IN, pull_up_down=gpiod_gpio.PUD_DOWN)
+        assert gpiod_gpio.input(ACTIVE) == gpiod_gpio.LOW
+
+        chip.pull(ACTIVE, True)
+
+        assert gpiod_gpio.input(ACTIVE) == gpiod_gpio.HIGH
+
+    def test_event_callback(self, chip: SimulatedChip) -> None:
+        called = threading.Event()
+        gpiod_gpio.setup(ACTIVE, gpiod_gpio.IN, pull_up_down=gpiod_gpio.PUD_DOWN)
+        gpiod_gpio.add_event_detect(ACTIVE, gpiod_gpio.RISING, callback=lambda c: called.set())
+
+        chip.pull(ACTIVE, True)
+
+        assert called.wait(timeout=5)
+
+    def test_batch_has_kernel_timestamps(self, chip: SimulatedChip) -> None:
+        received: list[tuple[int, int, bool]] = []
+        gpiod_gpio.setup(PULSE, gpiod_gpio.IN, pull_up_down=gpiod_gpio.PUD_DOWN)
+        gpiod_gpio.add_event_detect(PULSE, gpiod_gpio.BOTH)
+        gpiod_gpio.add_edge_batch_callback(received.extend)
+        before = time.monotonic_ns()
+
+        for _ in range(3):
+            chip.pull(PULSE, True)
+            chip.pull(PULSE, False)
+
+        deadline = time.monotonic() + 5
+        while len(received) < 6 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert [rising for _, _, rising in received] == [True, False] * 3
+        assert all(channel == PULSE for _, channel, _ in received)
+        timestamps = [time_ns for time_ns, _, _ in received]
+        assert timestamps == sorted(timestamps)
+        assert before <= timestamps[0] <= time.monotonic_ns()
+
+    def test_dial_capture(self, chip: SimulatedChip, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(edges, "gpio", gpiod_gpio)
+        pulses = []
+        done = threading.Event()
+        capture = edges.DialCapture(
+            ACTIVE,
+            PULSE,
+            on_activate=lambda: None,
+            on_pulse=lambda: pulses.append(1),
+            on_deactivate=done.set,
+        )
+        capture.setup()
+        try:
+            chip.pull(ACTIVE, True)
+            time.sleep(0.1)
+            for _ in range(4):
+                chip.pull(PULSE, True)
+                time.sleep(0.06)
+                chip.pull(PULSE, False)
+                time.sleep(0.04)
+            chip.pull(ACTIVE, False)
+
+            assert done.wait(timeout=5)
+        finally:
+            capture.stop()
+
+        assert len(pulses) == 4
+        assert capture.decoder.last_pulses == 4
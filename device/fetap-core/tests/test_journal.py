@@ -0,0 +1,80 @@
+import pathlib
+
+import pytest
+from fetap import journal
+
+
+@pytest.fixture()
+def journal_path(tmp_path: pathlib.Path) -> str:
+    return str(tmp_path / "journal.bin")
+
+
+def _fill(event_journal: journal.Journal, n: int) -> list[journal.Record]:
+    records = [journal.Record(1000 * i, i, i % 8, i % 7) for i in range(n)]
+    for record in records:
+        event_journal.append(*record)
+    return records
+
+
+class TestJournal:
+    def test_records(self, journal_path: str) -> None:
+        event_journal = journal.Journal(journal_path, capacity=8)
+
+        records = _fill(event_journal, 5)
+
+        assert event_journal.records() == records
+        assert event_journal.dropped == 0
+
+    def test_overwrites_oldest(self, journal_path: str) -> None:
+        event_journal = journal.Journal(journal_path, capacity=8)
+
+        records = _fill(event_journal, 13)
+
+        assert event_journal.records() == records[5:]
+        assert event_journal.dropped == 5
+
+    def test_reopen_continues(self, journal_path: str) -> None:
+        records = _fill(journal.Journal(journal_path), 3)
+
+        event_journal = journal.Journal(journal_path)
+        event_journal.append(*records[0])
+
+        assert event_journal.records() == records + records[:1]
+
+    def test_open_starts_new_session(self, journal_path: str) -> None:
+        with journal.open_journal(journal_path) as event_journal:
+            records = _fill(event_journal, 3)
+        with journal.open_journal(journal_path) as event_journal:
+            event_journal.append(*records[0])
+
+            assert event_journal.records() == records[:1]
+        previous = journal.read_journal(journal_path + journal.PREVIOUS_SUFFIX)
+        assert previous == (records, 0)
+
+    def test_other_capacity_starts_over(self, journal_path: str) -> None:
+        with journal.open_journal(journal_path) as event_journal:
+            _fill(event_journal, 3)
+
+        event_journal = journal.Journal(journal_path, capacity=8)
+
+        assert event_journal.records() == []
+
+    def test_long_duration_is_capped(self, journal_path: str) -> None:
+        event_journal = journal.Journal(journal_path, capacity=8)
+
+        event_journal.append(0, 10**10, 0, 0)
+
+        assert event_journal.records()[0].duration_ns == 2**32 - 1
+
+    def test_read_journal(self, journal_path: str) -> None:
+        event_journal = journal.Journal(journal_path, capacity=8)
+        records = _fill(event_journal, 10)
+
+        assert journal.read_journal(journal_path) == (records[2:], 2)
+
+    def test_read_other_file(self, tmp_path: pathlib.Path) -> None:
+        path = tmp_path / "other.bin"
+        path.write_bytes(b"\0" * 64)
+
+        with pytest.raises(ValueError):
+            journal.read_journal(str(path))
@@ -0,0 +1,126 @@
+import asyncio
+import pathlib
+import random
+import socket
+from concurrent.futures import Future
+
+import pytest
+from fetap import latency, replay, storage
+from fetap.main import Event
+
+
+@pytest.fixture()
+def phone_book(tmp_path: pathlib.Path) -> storage.PhoneBook:
+    phone_book = storage.PhoneBook(str(tmp_path / "phone_book.json"))
+    phone_book.insert("1234567", "0.0.0.1")
+    return phone_book
+
+
+INCOMING = [
+    replay.Step(Event.INCOMING_CALL),
+    replay.Step(Event.RECEIVER_UP),
+    replay.Step(Event.COUNTER_PARTY_HANG_UP),
+    replay.Step(Event.RECEIVER_DOWN),
+]
+
+
+class TestHistogram:
+    def test_percentiles_are_close(self) -> None:
+        values = [random.randrange(1, 10**9) for _ in range(10_000)]
+        histogram = latency.Histogram()
+        for value in values:
+            histogram.record(value)
+
+        values.sort()
+        for percentile in latency.PERCENTILES:
+            exact = values[int(percentile / 100 * len(values)) - 1]
+            assert histogram.percentile(percentile) == pytest.approx(exact, rel=0.05)
+
+    def test_small_values_are_exact(self) -> None:
+        histogram = latency.Histogram()
+        for value in range(1, 11):
+            histogram.record(value)
+
+        assert histogram.percentile(50) == 5
+        assert histogram.summary() == {
+            "count": 10, "min": 1, "max": 10, "p50": 5, "p90": 9, "p99": 10, "p99.9": 10
+        }
+
+    def test_buckets_are_contiguous(self) -> None:
+        for bucket in range(latency._bucket(latency._MAX_VALUE_NS)):
+            lowest = latency._lowest_value(bucket)
+            assert latency._bucket(lowest) == bucket
+            assert latency._bucket(latency._lowest_value(bucket + 1) - 1) == bucket
+
+    def test_empty(self) -> None:
+        assert latency.Histogram().summary()["min"] == 0
+
+
+class TestStampedQueue:
+    def test_records_wait(self) -> None:
+        recorder = latency.Recorder()
+        event_queue = latency.StampedQueue(recorder)
+
+        event_queue.put(Event.RECEIVER_UP)
+
+        assert event_queue.get() is Event.RECEIVER_UP
+        assert event_queue.last_put_ns > 0
+        assert recorder.summary()["queue RECEIVER_UP"]["count"] == 1
+
+
+class TestApp:
+    def test_threads(self, phone_book: storage.PhoneBook) -> None:
+        recorder = latency.Recorder()
+
+        replay.Replay(phone_book, latency_recorder=recorder).run(INCOMING)
+
+        summary = recorder.summary()
+        assert summary["handle RECEIVER_UP -> in_call"]["count"] == 1
+        assert summary["total INCOMING_CALL -> ringing"]["count"] == 1
+        assert summary["queue RECEIVER_DOWN"]["count"] == 1
+        total = summary["total RECEIVER_UP -> in_call"]
+        assert total["min"] >= summary["handle RECEIVER_UP -> in_call"]["min"]
+
+    def test_async(self, phone_book: storage.PhoneBook) -> None:
+        recorder = latency.Recorder()
+
+        asyncio.run(replay.Replay(phone_book, latency_recorder=recorder).run_async(INCOMING))
+
+        assert recorder.summary()["total RECEIVER_DOWN -> idle"]["count"] == 1
+
+
+class TestTimedSipClient:
+    def test_times_until_answered(self) -> None:
+        recorder = latency.Recorder()
+        sip_client = replay.FakeSipClient()
+        pending: Future[None] = Future()
+        sip_client.call = lambda address: pending
+        timed = latency.TimedSipClient(sip_client, recorder)
+
+        assert timed.call("0.0.0.1") is pending
+        assert "sip call" not in recorder.summary()
+        pending.set_result(None)
+
+        assert recorder.summary()["sip call"]["count"] == 1
+        assert timed.call_state is sip_client.call_state
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_serve_and_fetch() -> None:
+    recorder = latency.Recorder()
+    recorder.record("handle RECEIVER_UP -> in_call", 1500)
+    port = _free_port()
+
+    with latency.serving(recorder, port):
+        summary = latency.fetch(port)
+
+    assert summary == recorder.summary()
+    table = latency.format_summary(summary)
+    assert table.splitlines()[1].split() == [
+        "handle", "RECEIVER_UP", "->", "in_call", "1", "2", "2", "2", "2", "2", "2"
+    ]
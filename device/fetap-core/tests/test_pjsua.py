@@ -0,0 +1,205 @@
+import asyncio
+import os
+import queue
+import signal
+from os import path
+from typing import Iterable
+
+import pytest
+from fetap import pjsua
+
+
+FAKE_PJSUA = path.join(path.dirname(__file__), "fake_pjsua.py")
+
+
+@pytest.fixture()
+def events() -> queue.Queue[str]:
+    return queue.Queue()
+
+
+@pytest.fixture(params=list(pjsua.CallStateTracking))
+def client(request: pytest.FixtureRequest, events: queue.Queue[str]) -> Iterable[pjsua.PJSua]:
+    client = pjsua.PJSua(
+        on_incoming_call=lambda: events.put_nowait("incoming"),
+        on_call_hangup=lambda: events.put_nowait("hangup"),
+        on_call_connected=lambda: events.put_nowait("connected"),
+        call_state_tracking=request.param,
+        executable=FAKE_PJSUA,
+    )
+    client.start()
+    try:
+        yield client
+    finally:
+        client.stop()
+
+
+class TestHandleLogLine:
+    @pytest.fixture()
+    def client(self, events: queue.Queue[str]) -> pjsua.PJSua:
+        return pjsua.PJSua(
+            on_incoming_call=lambda: events.put_nowait("incoming"),
+            on_call_hangup=lambda: events.put_nowait("hangup"),
+            on_call_connected=lambda: events.put_nowait("connected"),
+        )
+
+    def test_incoming_call(self, client: pjsua.PJSua, events: queue.Queue[str]) -> None:
+        is_log_line = client._handle_log_line(
+            "12:00:00.000   pjsua_app.c  .......Incoming call for account 0!\n"
+        )
+
+        assert is_log_line
+        assert client.call_state is pjsua.CallState.INCOMING
+        assert events.get_nowait() == "incoming"
+
+    def test_accepted_incoming_call(self, client: pjsua.PJSua, events: queue.Queue[str]) -> None:
+        client._handle_log_line("12:00:00.000   pjsua_app.c  .......Incoming call for account 0!\n")
+        client._handle_log_line("12:00:00.000   pjsua_app.c  .......Call 2 state changed to CONNECTING\n")
+        client._handle_log_line("12:00:00.000   pjsua_app.c  .......Call 2 state changed to CONFIRMED\n")
+        client._handle_log_line("12:00:00.000   pjsua_app.c  .......Call 2 is DISCONNECTED [reason=200 (Normal call clearing)]\n")
+
+        assert client.call_state is pjsua.CallState.IDLE
+        assert [events.get_nowait() for _ in range(3)] == ["incoming", "connected", "hangup"]
+
+    def test_outgoing_call(self, client: pjsua.PJSua, events: queue.Queue[str]) -> None:
+        client._handle_log_line("12:00:00.000   pjsua_app.c  .......Call 0 state changed to CALLING\n")
+        client._handle_log_line("12:00:00.000   pjsua_app.c  .......Call 0 state changed to EARLY (180 Ringing)\n")
+
+        assert client.call_state is pjsua.CallState.CALLING
+        assert events.empty()
+
+    def test_incoming_call_mid_command(self, client: pjsua.PJSua) -> None:
+        future = client._expect_response("call list")
+
+        client._stdout_splitter.feed(
+            "You have 1 active call(s)\n"
+            "12:00:00.000   pjsua_app.c  .......Incoming call for account 0!\n"
+            "Media count: 1 audio & 0 video\n"
+            "From: <sip:fake@127.0.0.1>\n"
+            "To: <sip:127.0.0.1>\n"
+            "Press ca a to answer or g to reject call\n"
+            "  [0] sip:fake@127.0.0.1 [INCOMING]\n"
+            ">>> "
+        )
+
+        assert future.result(timeout=0) == (
+            "You have 1 active call(s)\n  [0] sip:fake@127.0.0.1 [INCOMING]"
+        )
+
+    def test_from_line_without_incoming_call(self, client: pjsua.PJSua) -> None:
+        assert not client._handle_log_line("From: a command response\n")
+
+    @pytest.mark.parametrize(
+        "line",
+        [
+            "You have 0 active call(s)\n",
+            "  [0] sip:fake@127.0.0.1 [CONFIRMED]\n",
+        ],
+    )
+    def test_not_a_log_line(self, client: pjsua.PJSua, line: str) -> None:
+        assert not client._handle_log_line(line)
+
+
+TRANSCRIPT = (
+    ">>> You have 1 active call(s)\n"
+    "  [0] sip:fake@127.0.0.1 [CONFIRMED]\n"
+    ">>> \n"
+    "12:00:00.000   pjsua_app.c  .......Call 0 state changed to CONFIRMED\n"
+    ">>> You have 0 active call(s)\n"
+    ">>> "
+)
+
+
+class TestStdoutSplitter:
+    @pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, len(TRANSCRIPT)])
+    def test_responses(self, chunk_size: int) -> None:
+        responses: list[str] = []
+        splitter = pjsua._StdoutSplitter(on_response=responses.append)
+
+        for i in range(0, len(TRANSCRIPT), chunk_size):
+            splitter.feed(TRANSCRIPT[i : i + chunk_size])
+
+        assert responses == [
+            "",
+            "You have 1 active call(s)\n  [0] sip:fake@127.0.0.1 [CONFIRMED]",
+            "12:00:00.000   pjsua_app.c  .......Call 0 state changed to CONFIRMED",
+            "You have 0 active call(s)",
+        ]
+
+    @pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, len(TRANSCRIPT)])
+    def test_log_lines(self, chunk_size: int) -> None:
+        responses: list[str] = []
+        log_lines: list[str] = []
+
+        def on_log_line(line: str) -> bool:
+            is_log_line = "pjsua_app.c" in line
+            if is_log_line:
+                log_lines.append(line)
+            return is_log_line
+
+        splitter = pjsua._StdoutSplitter(on_response=responses.append, on_log_line=on_log_line)
+
+        for i in range(0, len(TRANSCRIPT), chunk_size):
+            splitter.feed(TRANSCRIPT[i : i + chunk_size])
+
+        assert responses == [
+            "",
+            "You have 1 active call(s)\n  [0] sip:fake@127.0.0.1 [CONFIRMED]",
+            "",
+            "You have 0 active call(s)",
+        ]
+        assert log_lines == [
+            "12:00:00.000   pjsua_app.c  .......Call 0 state changed to CONFIRMED\n",
+        ]
+
+
+class TestPJSua:
+    def test_incoming_call_and_hangup(self, client: pjsua.PJSua, events: queue.Queue[str]) -> None:
+        os.kill(client._process.pid, signal.SIGUSR1)
+        assert events.get(timeout=5) == "incoming"
+
+        client.accept_call()
+        assert events.get(timeout=5) == "connected"
+
+        os.kill(client._process.pid, signal.SIGUSR2)
+        assert events.get(timeout=5) == "hangup"
+        assert client.call_state is pjsua.CallState.IDLE
+
+    def test_pipelined_commands(self, client: pjsua.PJSua) -> None:
+        futures = [
+            client.submit_command("call list"),
+            client.submit_command("bogus"),
+            client.submit_command("call list"),
+        ]
+
+        responses = [future.result(timeout=5) for future in futures]
+
+        assert responses[0].startswith("You have")
+        assert responses[1] == "Unknown command: bogus"
+        assert responses[2].startswith("You have")
+
+
+class TestPJSuaAsync:
+    @pytest.mark.parametrize("tracking", list(pjsua.CallStateTracking))
+    def test_incoming_call_and_hangup(self, tracking: pjsua.CallStateTracking) -> None:
+        async def _scenario() -> list[str]:
+            events: asyncio.Queue[str] = asyncio.Queue()
+            client = pjsua.PJSua(
+                on_incoming_call=lambda: events.put_nowait("incoming"),
+                on_call_hangup=lambda: events.put_nowait("hangup"),
+                on_call_connected=lambda: events.put_nowait("connected"),
+                call_state_tracking=tracking,
+                executable=FAKE_PJSUA,
+            )
+            await client.start_async()
+            try:
+                os.kill(client._process.pid, signal.SIGUSR1)
+                received = [await asyncio.wait_for(events.get(), 5)]
+                await asyncio.wrap_future(client.accept_call())
+                received.append(await asyncio.wait_for(events.get(), 5))
+                os.kill(client._process.pid, signal.SIGUSR2)
+                received.append(await asyncio.wait_for(events.get(), 5))
+            finally:
+                client.stop()
+            return received
+
+        assert asyncio.run(_scenario()) == ["incoming", "connected", "hangup"]
@@ -0,0 +1,87 @@
+import os
+import pathlib
+import subprocess
+import sys
+import time
+from typing import Iterator
+
+import pytest
+from fetap import process_table
+
+IGNORE_SIGTERM = (
+    "import signal, time\n"
+    "signal.signal(signal.SIGTERM, signal.SIG_IGN)\n"
+    "print('ready', flush=True)\n"
+    "time.sleep(60)\n"
+)
+
+
+@pytest.fixture()
+def install_dir(tmp_path: pathlib.Path) -> pathlib.Path:
+    """Looks like an install of fetap to the scanner, only the tests' processes run from it"""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "python").symlink_to(sys.executable)
+    return tmp_path
+
+
+@pytest.fixture()
+def spawn(install_dir: pathlib.Path) -> Iterator:
+    processes: list[subprocess.Popen] = []
+
+    def _spawn(code: str = "import time; print('ready', flush=True); time.sleep(60)") -> subprocess.Popen:
+        process = subprocess.Popen(
+            [str(install_dir / "bin" / "python"), "-c", code],
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        assert process.stdout.readline() == "ready\n"
+        processes.append(process)
+        return process
+
+    yield _spawn
+    for process in processes:
+        process.kill()
+        process.wait()
+
+
+class TestProcessTable:
+    def test_find(self, install_dir: pathlib.Path, spawn) -> None:
+        process = spawn()
+
+        assert process_table.find_processes(str(install_dir)) == [process.pid]
+        assert process_table.find_processes(str(install_dir), exclude=[process.pid]) == []
+
+    def test_terminate(self, install_dir: pathlib.Path, spawn) -> None:
+        processes = [spawn(), spawn()]
+        start = time.monotonic()
+
+        assert process_table.terminate(str(install_dir), timeout=5)
+
+        # Done as soon as they exited, not after the timeout
+        assert time.monotonic() - start < 2
+        assert [p.wait(timeout=1) for p in processes] == [-15, -15]
+
+    def test_kill_after_timeout(self, install_dir: pathlib.Path, spawn) -> None:
+        process = spawn(IGNORE_SIGTERM)
+
+        assert process_table.terminate(str(install_dir), timeout=0.2)
+
+        assert process.wait(timeout=1) == -9
+
+    def test_nothing_to_terminate(self, install_dir: pathlib.Path) -> None:
+        start = time.monotonic()
+
+        assert process_table.terminate(str(install_dir))
+
+        assert time.monotonic() - start < 0.5
+
+    def test_without_pidfd(
+        self, install_dir: pathlib.Path, spawn, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.delattr(os, "pidfd_open")
+        process = spawn()
+
+        assert process_table.terminate(str(install_dir), timeout=5)
+
+        assert process.wait(timeout=1) == -15
@@ -0,0 +1,198 @@
+import asyncio
+import pathlib
+
+import pytest
+from fetap import journal, replay, storage
+from fetap.main import Event
+
+
+@pytest.fixture()
+def phone_book(tmp_path: pathlib.Path) -> storage.PhoneBook:
+    phone_book = storage.PhoneBook(str(tmp_path / "phone_book.json"))
+    phone_book.insert("123450", "0.0.0.1")
+    return phone_book
+
+
+SCRIPTS = {
+    "dial": (
+        [replay.Step(Event.RECEIVER_UP)]
+        + replay.dial_number("1234500", delay=0.001)
+        + [replay.Step(Event.CALL_CONNECTED), replay.Step(Event.RECEIVER_DOWN)]
+    ),
+    "incoming": [
+        replay.Step(Event.INCOMING_CALL),
+        replay.Step(Event.RECEIVER_UP, delay=0.001),
+        replay.Step(Event.COUNTER_PARTY_HANG_UP),
+        replay.Step(Event.RECEIVER_DOWN),
+    ],
+    "not_allowed": [
+        replay.Step(Event.DIAL_PULSE),
+        replay.Step(Event.RECEIVER_DOWN),
+        replay.Step(Event.CALL_CONNECTED),
+    ],
+}
+
+
+class TestReplay:
+    def test_dial(self, phone_book: storage.PhoneBook) -> None:
+        player = replay.Replay(phone_book)
+
+        transitions = player.run(
+            [replay.Step(Event.RECEIVER_UP)] + replay.dial_number("123450")
+        )
+
+        assert player.phone.dialed_number == "123450"
+        assert transitions[-1].state != "idle"
+
+    def test_incoming(self, phone_book: storage.PhoneBook) -> None:
+        player = replay.Replay(phone_book)
+
+        transitions = player.run(SCRIPTS["incoming"][:1])
+
+        assert transitions[-1].state == "ringing"
+        assert player.hardware.is_ringing
+
+        transitions = player.run(SCRIPTS["incoming"][1:])
+
+        assert [t.state for t in transitions] == ["ringing", "in_call", "disconnected", "idle"]
+        assert not player.hardware.is_ringing
+
+    @pytest.mark.parametrize("script", list(SCRIPTS))
+    def test_async_matches_threads(self, phone_book: storage.PhoneBook, script: str) -> None:
+        threaded = replay.Replay(phone_book)
+        asynchronous = replay.Replay(phone_book)
+
+        expected = threaded.run(SCRIPTS[script])
+        transitions = asyncio.run(asynchronous.run_async(SCRIPTS[script]))
+
+        assert transitions == expected
+        assert asynchronous.sip_client.commands == threaded.sip_client.commands
+
+
+@pytest.fixture()
+def directory(tmp_path: pathlib.Path) -> storage.PhoneBook:
+    phone_book = storage.PhoneBook(str(tmp_path / "directory.json"))
+    phone_book.insert("1234567", "0.0.0.1")
+    phone_book.insert("1237777", "0.0.0.2")
+    phone_book.insert("110", "0.0.0.3")
+    return phone_book
+
+
+class TestDialCorrection:
+    def test_exact(self, directory: storage.PhoneBook) -> None:
+        player = replay.Replay(directory)
+
+        player.run([replay.Step(Event.RECEIVER_UP)] + replay.dial_number("1234567"))
+
+        assert player.sip_client.commands == [("call", "0.0.0.1")]
+        assert player.phone.dialed_pulses == [1, 2, 3, 4, 5, 6, 7]
+
+    def test_miscounted_pulses(self, directory: storage.PhoneBook) -> None:
+        player = replay.Replay(directory)
+        steps = [replay.Step(Event.RECEIVER_UP)] + replay.dial_number("12345")
+        # One pulse too many on each of the last two digits
+        steps += replay.dial_pulses(7) + replay.dial_pulses(8)
+
+        transitions = player.run(steps)
+
+        assert player.phone.dialed_number == "1234578"
+        assert transitions[-1].state == "connecting"
+        assert player.sip_client.commands == [("call", "0.0.0.1")]
+
+    def test_too_far_off(self, directory: storage.PhoneBook) -> None:
+        player = replay.Replay(directory)
+
+        transitions = player.run([replay.Step(Event.RECEIVER_UP)] + replay.dial_number("9999999"))
+
+        assert transitions[-1].state == "connecting"
+        assert player.sip_client.commands == []
+
+    def test_short_number(self, directory: storage.PhoneBook) -> None:
+        player = replay.Replay(directory)
+
+        transitions = player.run([replay.Step(Event.RECEIVER_UP)] + replay.dial_number("110"))
+
+        assert transitions[-1].state == "connecting"
+        assert player.sip_client.commands == [("call", "0.0.0.3")]
+
+    def test_unique_prefix(self, tmp_path: pathlib.Path) -> None:
+        phone_book = storage.PhoneBook(str(tmp_path / "phone_book.json"))
+        phone_book.insert("1234567", "0.0.0.1")
+        phone_book.insert("55", "0.0.0.5")
+        player = replay.Replay(phone_book)
+
+        transitions = player.run([replay.Step(Event.RECEIVER_UP)] + replay.dial_number("55"))
+
+        assert transitions[-1].state == "connecting"
+        assert player.sip_client.commands == [("call", "0.0.0.5")]
+
+    @pytest.mark.parametrize("number", ["5", "8", "12", "123456"])
+    def test_prefix_is_not_corrected(self, tmp_path: pathlib.Path, number: str) -> None:
+        phone_book = storage.PhoneBook(str(tmp_path / "phone_book.json"))
+        phone_book.insert("1234567", "0.0.0.1")
+        player = replay.Replay(phone_book)
+
+        transitions = player.run(
+            [replay.Step(Event.RECEIVER_UP)] + replay.dial_number(number[:-1])
+            # A pulse too many, close enough to correct a whole number
+            + replay.dial_pulses(int(number[-1]) + 1)
+        )
+
+        assert transitions[-1].state == "awaiting_dial_input"
+        assert player.sip_client.commands == []
+
+    def test_ambiguous_prefix(self, directory: storage.PhoneBook) -> None:
+        player = replay.Replay(directory)
+
+        transitions = player.run([replay.Step(Event.RECEIVER_UP)] + replay.dial_number("123"))
+
+        assert transitions[-1].state == "awaiting_dial_input"
+        assert player.sip_client.commands == []
+
+
+class TestJournalReplay:
+    @pytest.mark.parametrize("script", list(SCRIPTS))
+    def test_replay_matches_journal(
+        self, phone_book: storage.PhoneBook, tmp_path: pathlib.Path, script: str
+    ) -> None:
+        with journal.open_journal(str(tmp_path / "journal.bin")) as event_journal:
+            recorded = replay.Replay(phone_book, event_journal).run(SCRIPTS[script])
+            records = event_journal.records()
+
+        replayed = replay.Replay(phone_book).run(replay.steps_from_journal(records))
+
+        assert replay.transitions_from_journal(records) == recorded
+        assert replayed == recorded
+
+    def test_delays(self) -> None:
+        records = [journal.Record(5_000_000, 0, 0, 0), journal.Record(7_000_000, 0, 1, 0)]
+
+        steps = replay.steps_from_journal(records)
+
+        assert [step.delay for step in steps] == [0, 0.002]
+
+    def test_complete_records(self, phone_book: storage.PhoneBook, tmp_path: pathlib.Path) -> None:
+        # Too small for the whole dial script, so it starts mid call
+        event_journal = journal.Journal(str(tmp_path / "journal.bin"), capacity=20)
+        steps = SCRIPTS["dial"] + SCRIPTS["incoming"]
+        replay.Replay(phone_book, event_journal).run(steps)
+
+        records = replay.complete_records(event_journal.records(), event_journal.dropped)
+
+        assert [step.event for step in replay.steps_from_journal(records)] == [
+            step.event for step in SCRIPTS["incoming"]
+        ]
+
+    def test_latencies(self, phone_book: storage.PhoneBook, tmp_path: pathlib.Path) -> None:
+        event_journal = journal.Journal(str(tmp_path / "journal.bin"))
+        replay.Replay(phone_book, event_journal).run(SCRIPTS["incoming"])
+
+        durations = replay.latencies(event_journal.records())
+
+        assert list(durations) == [
+            replay.Transition(Event.INCOMING_CALL, "ringing"),
+            replay.Transition(Event.RECEIVER_UP, "in_call"),
+            replay.Transition(Event.COUNTER_PARTY_HANG_UP, "disconnected"),
+            replay.Transition(Event.RECEIVER_DOWN, "idle"),
+        ]
+        assert all(len(d) == 1 and d[0] > 0 for d in durations.values())
@@ -0,0 +1,131 @@
+import asyncio
+import itertools
+import threading
+import time
+from typing import Iterator
+
+import pytest
+from fetap import fake_gpio, ringer
+
+PIN = 17
+# Short enough for tests, long enough to measure with a loose tolerance
+CADENCE = ringer.RingCadence(
+    frequency=100, ring_time=0.06, pause_time=0.04, n=2, long_pause_time=0.05
+)
+TOLERANCE = 0.02
+
+
+@pytest.fixture(autouse=True)
+def clear_waveform() -> Iterator[None]:
+    fake_gpio.waveform.clear()
+    yield
+    fake_gpio.waveform.clear()
+
+
+def pin_waveform() -> list[fake_gpio.WaveformChange]:
+    return [change for change in fake_gpio.waveform if change.channel == PIN]
+
+
+def ring_for(ringer_: ringer.Ringer, seconds: float) -> None:
+    should_stop = threading.Event()
+    thread = threading.Thread(target=ringer.ring, args=(ringer_, should_stop))
+    thread.start()
+    time.sleep(seconds)
+    should_stop.set()
+    thread.join()
+
+
+class TestRingCadence:
+    def test_bursts(self) -> None:
+        bursts = list(itertools.islice(CADENCE.bursts(), 4))
+
+        assert bursts == [(0.06, 0.04), (0.06, 0.09), (0.06, 0.04), (0.06, 0.09)]
+
+    def test_pulse_train(self) -> None:
+        cadence = ringer.RingCadence(frequency=50, ring_time=0.1)
+        pulses = list(itertools.islice(cadence.pulse_train(), 11))
+
+        assert pulses == [(True, 0.01), (False, 0.01)] * 5 + [(False, 1)]
+
+    def test_parse(self) -> None:
+        assert ringer.RingCadence.parse("0.5,1,2,3") == ringer.RingCadence(
+            ring_time=0.5, pause_time=1, n=2, long_pause_time=3
+        )
+
+    @pytest.mark.parametrize("text", ["1,1,3", "1,1,three,2", ""])
+    def test_parse_error(self, text: str) -> None:
+        with pytest.raises(ValueError):
+            ringer.RingCadence.parse(text)
+
+
+class TestFakeGpio:
+    def test_waveform_is_capped(self) -> None:
+        for _ in range(fake_gpio.WAVEFORM_LENGTH + 1):
+            fake_gpio.output(PIN, fake_gpio.HIGH)
+
+        assert len(fake_gpio.waveform) == fake_gpio.WAVEFORM_LENGTH
+
+
+class TestPwmRinger:
+    def test_waveform_timing(self) -> None:
+        pwm_ringer = ringer.PwmRinger(PIN, CADENCE)
+        pwm_ringer.setup()
+
+        ring_for(pwm_ringer, 0.35)
+
+        changes = pin_waveform()
+        # The ring starts at once and ends silent
+        assert changes[0].duty_cycle == 50
+        assert changes[0].frequency == 100
+        assert changes[-1].duty_cycle == 0
+        expected = [0.06, 0.04, 0.06, 0.09, 0.06]
+        durations = [later.time - earlier.time for earlier, later in zip(changes, changes[1:])]
+        for duration, expected_duration in zip(durations, expected):
+            assert duration == pytest.approx(expected_duration, abs=TOLERANCE)
+
+    def test_few_wakeups(self) -> None:
+        pwm_ringer = ringer.PwmRinger(PIN, CADENCE)
+        pwm_ringer.setup()
+
+        ring_for(pwm_ringer, 0.2)
+
+        # On and off once per ring, plus the final silence
+        assert len(pin_waveform()) <= 6
+
+
+class TestSoftwareRinger:
+    def test_toggles_during_ring(self) -> None:
+        software_ringer = ringer.SoftwareRinger(PIN, CADENCE)
+
+        ring_for(software_ringer, 0.08)
+
+        changes = pin_waveform()
+        levels = [change.duty_cycle for change in changes[:12]]
+        assert levels == [100, 0] * 6
+        assert changes[-1].duty_cycle == 0
+        # Deadlines are absolute, so the ring lasts ring_time in total
+        assert changes[12].time - changes[0].time == pytest.approx(0.06, abs=TOLERANCE)
+
+
+class TestRingAsync:
+    def test_cancel_silences(self) -> None:
+        pwm_ringer = ringer.PwmRinger(PIN, CADENCE)
+        pwm_ringer.setup()
+
+        async def _ring_briefly() -> None:
+            task = asyncio.get_running_loop().create_task(ringer.ring_async(pwm_ringer))
+            await asyncio.sleep(0.08)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(_ring_briefly())
+
+        changes = pin_waveform()
+        assert [change.duty_cycle for change in changes[:2]] == [50, 0]
+        assert changes[1].time - changes[0].time == pytest.approx(0.06, abs=TOLERANCE)
+        assert changes[-1].duty_cycle == 0
+
+
+def test_create_ringer_prefers_pwm() -> None:
+    assert isinstance(ringer.create_ringer(PIN, CADENCE), ringer.PwmRinger)
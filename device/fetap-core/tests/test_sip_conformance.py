@@ -0,0 +1,121 @@
+"""Checks that every SIP backend behaves the same towards the Phone.
+
+Each backend talks to a pjsua CLI peer over the loopback interface, so these
+tests need the pjsua binary (see `fetap.pjsua.ensure_pjsua`) and, for the
+pjsua2 backend, the pjsua2 bindings.
+"""
+import queue
+from os import path
+from typing import Iterable
+
+import pytest
+from fetap import pjsua
+
+
+CLIENT_PORT = 5071
+PEER_PORT = 5072
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.events: queue.Queue[str] = queue.Queue()
+
+    def callbacks(self) -> dict[str, object]:
+        return {
+            "on_incoming_call": lambda: self.events.put_nowait("incoming"),
+            "on_call_hangup": lambda: self.events.put_nowait("hangup"),
+            "on_call_connected": lambda: self.events.put_nowait("connected"),
+        }
+
+    def next(self) -> str:
+        return self.events.get(timeout=10)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def require_pjsua() -> None:
+    if not path.exists(pjsua.PJSUA_PATH):
+        pytest.skip("pjsua binary is not installed")
+
+
+@pytest.fixture()
+def peer_events() -> Recorder:
+    return Recorder()
+
+
+@pytest.fixture()
+def client_events() -> Recorder:
+    return Recorder()
+
+
+@pytest.fixture()
+def peer(peer_events: Recorder) -> Iterable[pjsua.PJSua]:
+    peer = pjsua.PJSua(**peer_events.callbacks(), local_port=PEER_PORT, null_audio=True)
+    peer.start()
+    try:
+        yield peer
+    finally:
+        peer.stop()
+
+
+@pytest.fixture(params=list(pjsua.SipBackend))
+def client(
+    request: pytest.FixtureRequest, client_events: Recorder
+) -> Iterable[pjsua.SipClient]:
+    if request.param is pjsua.SipBackend.PJSUA2:
+        pytest.importorskip("pjsua2")
+        from fetap import pjsua2_backend
+
+        client = pjsua2_backend.PJSua2(
+            **client_events.callbacks(), local_port=CLIENT_PORT, null_audio=True
+        )
+    else:
+        client = pjsua.PJSua(
+            **client_events.callbacks(), local_port=CLIENT_PORT, null_audio=True
+        )
+    client.start()
+    try:
+        yield client
+    finally:
+        client.stop()
+
+
+class TestConformance:
+    def test_outgoing_call(
+        self,
+        client: pjsua.SipClient,
+        peer: pjsua.PJSua,
+        client_events: Recorder,
+        peer_events: Recorder,
+    ) -> None:
+        client.call(f"127.0.0.1:{PEER_PORT}")
+        assert peer_events.next() == "incoming"
+        assert client.call_state is pjsua.CallState.CALLING
+
+        peer.accept_call()
+        assert client_events.next() == "connected"
+        assert peer_events.next() == "connected"
+
+        client.hangup_all()
+        assert client_events.next() == "hangup"
+        assert peer_events.next() == "hangup"
+        assert client.call_state is pjsua.CallState.IDLE
+
+    def test_incoming_call(
+        self,
+        client: pjsua.SipClient,
+        peer: pjsua.PJSua,
+        client_events: Recorder,
+        peer_events: Recorder,
+    ) -> None:
+        peer.call(f"127.0.0.1:{CLIENT_PORT}")
+        assert client_events.next() == "incoming"
+        assert client.call_state is pjsua.CallState.INCOMING
+
+        client.accept_call()
+        assert client_events.next() == "connected"
+        assert peer_events.next() == "connected"
+
+        peer.hangup_all()
+        assert client_events.next() == "hangup"
+        assert peer_events.next() == "hangup"
+        assert client.call_state is pjsua.CallState.IDLE
@@ -0,0 +1,244 @@
+import os
+import queue
+import subprocess
+import sys
+import threading
+
+import pytest
+from fetap import replay, startup, storage
+from fetap.main import App, Event, Phone, phone_app
+
+# Modules only some features need, they must be imported when they are used
+HEAVY_MODULES = [
+    "requests",
+    "flask",
+    "http.server",
+    "urllib.request",
+    "statemachine.contrib.diagram",
+    "fetap.latency",
+    "fetap.web_server",
+    "fetap.async_app",
+    "numpy",
+]
+# Generous, so a loaded machine doesn't fail the test. Takes about 0.2s on a
+# desktop.
+IMPORT_BUDGET_US = 1_000_000
+
+
+def _import_times(*args: str) -> dict[str, int]:
+    """The cumulative import time of every module python imports, in microseconds"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        stdout=subprocess.DEVNULL,
+        env={**os.environ, "FETAP_GPIO_BACKEND": "fake"},
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.fixture(scope="module")
+def main_import_times() -> dict[str, int]:
+    return _import_times("-c", "import fetap.main")
+
+
+class TestImportTime:
+    @pytest.mark.parametrize("module", HEAVY_MODULES)
+    def test_not_imported(self, main_import_times: dict[str, int], module: str) -> None:
+        assert module not in main_import_times
+
+    def test_budget(self, main_import_times: dict[str, int]) -> None:
+        assert main_import_times["fetap.main"] < IMPORT_BUDGET_US
+
+    def test_cli_imports_nothing_up_front(self) -> None:
+        times = _import_times("-m", "fetap", "--help")
+
+        assert "fetap.main" not in times
+
+
+class TestStartup:
+    def test_independent_steps_run_concurrently(self) -> None:
+        both_running = threading.Barrier(2, timeout=5)
+        boot = startup.Startup()
+        boot.add("a", both_running.wait)
+        boot.add("b", both_running.wait)
+
+        boot.start()
+
+        assert boot.wait_all(timeout=5)
+        assert set(boot.ready_after) == {"a", "b"}
+
+    def test_order(self) -> None:
+        order = []
+        boot = startup.Startup()
+        boot.add("first", lambda: order.append("first"))
+        boot.add("second", lambda: order.append("second"), after=["first"])
+        boot.add("third", lambda: order.append("third"), after=["second", "first"])
+
+        boot.start()
+
+        assert boot.wait_all(timeout=5)
+        assert order == ["first", "second", "third"]
+
+    def test_failed_step(self) -> None:
+        ran = []
+
+        def _fail() -> None:
+            raise OSError("GPIO busy")
+
+        boot = startup.Startup()
+        boot.add("hardware", _fail)
+        boot.add("dial", lambda: ran.append("dial"), after=["hardware"])
+        boot.add("sip", lambda: ran.append("sip"))
+
+        boot.start()
+
+        with pytest.raises(startup.StepFailed):
+            boot.wait("dial", timeout=5)
+        assert boot.wait("sip", timeout=5)
+        assert not boot.is_ready("hardware")
+        assert ran == ["sip"]
+
+    def test_wait_finished(self) -> None:
+        def _fail() -> None:
+            raise OSError("GPIO busy")
+
+        boot = startup.Startup()
+        boot.add("hardware", _fail)
+        boot.add("sip", lambda: None)
+
+        assert boot.wait_finished(timeout=0)
+        boot.start()
+
+        assert boot.wait_finished(timeout=5)
+        assert boot.is_ready("sip")
+
+    def test_unknown_step(self) -> None:
+        boot = startup.Startup()
+
+        with pytest.raises(ValueError):
+            boot.add("sip", lambda: None, after=["zombies"])
+
+
+class _SlowSipClient(replay.FakeSipClient):
+    def __init__(self) -> None:
+        super().__init__()
+        self.may_start = threading.Event()
+
+    def start(self) -> None:
+        assert self.may_start.wait(timeout=5)
+
+    def stop(self) -> None:
+        self.commands.append(("stop",))
+
+
+class TestDeferredSipClient:
+    def test_hangup_before_ready(self) -> None:
+        sip_client = _SlowSipClient()
+        boot = startup.Startup()
+        boot.add("sip", sip_client.start)
+        boot.start()
+        deferred = startup.DeferredSipClient(sip_client, boot)
+
+        assert deferred.hangup_all().done()
+        assert sip_client.commands == []
+        sip_client.may_start.set()
+        boot.wait("sip")
+        deferred.hangup_all()
+
+        assert sip_client.commands == [("hangup_all",)]
+
+    def test_call_waits(self) -> None:
+        sip_client = _SlowSipClient()
+        boot = startup.Startup()
+        boot.add("sip", sip_client.start)
+        boot.start()
+        deferred = startup.DeferredSipClient(sip_client, boot)
+        threading.Timer(0.05, sip_client.may_start.set).start()
+
+        deferred.call("0.0.0.1")
+
+        assert boot.is_ready("sip")
+        assert sip_client.commands == [("call", "0.0.0.1")]
+
+
+def test_app_handles_events_before_sip_is_ready(tmp_path) -> None:
+    sip_client = _SlowSipClient()
+    hardware = replay.FakeHardware()
+    boot = startup.Startup()
+    boot.add("hardware", hardware.setup)
+    boot.add("sip", sip_client.start)
+    phone_book = storage.PhoneBook(str(tmp_path / "phone_book.json"))
+    phone = Phone(
+        pjsua_=startup.DeferredSipClient(sip_client, boot),
+        phone_book=phone_book,
+        hardware=hardware,
+    )
+    event_queue: queue.Queue[Event] = queue.Queue()
+    app = App(event_queue, phone, sip_client, hardware, startup_=boot)
+
+    app.start()
+    for event in [Event.RECEIVER_UP, Event.RECEIVER_DOWN]:
+        app.handle_event(event)
+
+    assert phone.current_state.id == "idle"
+    assert not boot.is_ready("sip")
+    sip_client.may_start.set()
+    app.stop()
+
+
+def _fail() -> None:
+    raise OSError("no pjsua")
+
+
+def test_app_survives_sip_failing(tmp_path) -> None:
+    sip_client = replay.FakeSipClient()
+    hardware = replay.FakeHardware()
+    boot = startup.Startup()
+    boot.add("hardware", hardware.setup)
+    boot.add("sip", _fail)
+    phone_book = storage.PhoneBook(str(tmp_path / "phone_book.json"))
+    phone_book.insert("110", "0.0.0.1")
+    phone = Phone(
+        pjsua_=startup.DeferredSipClient(sip_client, boot),
+        phone_book=phone_book,
+        hardware=hardware,
+    )
+    event_queue: queue.Queue[Event] = queue.Queue()
+    app = App(event_queue, phone, sip_client, hardware, startup_=boot)
+
+    app.start()
+    for step in [replay.Step(Event.RECEIVER_UP)] + replay.dial_number("110"):
+        app.handle_event(step.event)
+
+    assert phone.current_state.id == "disconnected"
+    app.handle_event(Event.RECEIVER_DOWN)
+    assert phone.current_state.id == "idle"
+    app.stop()
+
+
+def test_failed_start_stops_the_rest(tmp_path) -> None:
+    sip_client = _SlowSipClient()
+    hardware = replay.FakeHardware()
+    boot = startup.Startup()
+    boot.add("hardware", _fail)
+    boot.add("sip", sip_client.start)
+    phone = Phone(
+        pjsua_=startup.DeferredSipClient(sip_client, boot),
+        phone_book=storage.PhoneBook(str(tmp_path / "phone_book.json")),
+        hardware=hardware,
+    )
+    threading.Timer(0.05, sip_client.may_start.set).start()
+
+    with pytest.raises(startup.StepFailed):
+        with phone_app(queue.Queue(), phone, sip_client, hardware, startup_=boot):
+            pass
+
+    assert sip_client.commands == [("stop",)]
@@ -1,16 +1,20 @@
+import functools
 import pathlib
+import threading
+import time
+import filelock
 import pytest
-from fetap import storage
+from fetap import error_correction, storage, watch
 
 
-@pytest.fixture()
-def phone_book_path(tmp_path: pathlib.Path) -> str:
-    return str((tmp_path / "phone_book.json").resolve())
+@pytest.fixture(params=[".json", ".sqlite"])
+def phone_book_path(tmp_path: pathlib.Path, request: pytest.FixtureRequest) -> str:
+    return str((tmp_path / f"phone_book{request.param}").resolve())
 
 
 @pytest.fixture()
 def empty_phone_book(phone_book_path: str) -> storage.PhoneBook:
-    return storage.PhoneBook(phone_book_path)
+    return storage.open_phone_book(phone_book_path)
 
 
 @pytest.fixture()
@@ -46,7 +50,7 @@ class TestPhoneBook:
         phone_book_path: str,
         numbers_and_addresses: list[tuple[str, str]],
     ) -> None:
-        second_phone_book = storage.PhoneBook(phone_book_path)
+        second_phone_book = storage.open_phone_book(phone_book_path)
 
         all_numbers = second_phone_book.list_all()
 
@@ -58,7 +62,7 @@ class TestPhoneBook:
         phone_book_path: str,
         numbers_and_addresses: list[tuple[str, str]],
     ) -> None:
-        second_phone_book = storage.PhoneBook(phone_book_path)
+        second_phone_book = storage.open_phone_book(phone_book_path)
         phone_book.insert("113", "0.0.0.3")
 
         all_numbers = second_phone_book.list_all()
@@ -79,3 +83,230 @@ class TestPhoneBook:
         retrieved_address = phone_book.get_address(number)
 
         assert retrieved_address == address
+
+    def test_insert_existing_number(self, phone_book: storage.PhoneBook) -> None:
+        with pytest.raises(storage.NumberExists):
+            phone_book.insert("110", "0.0.0.9")
+
+    def test_insert_existing_address(self, phone_book: storage.PhoneBook) -> None:
+        with pytest.raises(storage.AddressExists):
+            phone_book.insert("119", "0.0.0.0")
+
+    def test_get_missing(self, phone_book: storage.PhoneBook) -> None:
+        with pytest.raises(storage.NumberDoesNotExist):
+            phone_book.get_address("999")
+        with pytest.raises(storage.AddressDoesNotExist):
+            phone_book.get_number("9.9.9.9")
+
+    def test_delete(self, phone_book: storage.PhoneBook) -> None:
+        phone_book.del_number("110")
+        phone_book.del_address("0.0.0.1")
+
+        assert phone_book.list_all() == []
+        with pytest.raises(KeyError):
+            phone_book.del_number("110")
+
+    @pytest.mark.parametrize(
+        "prefix, expected",
+        [("11", ["110", "112"]), ("112", ["112"]), ("1129", []), ("2", []), ("", ["110", "112"])],
+    )
+    def test_numbers_with_prefix(
+        self, phone_book: storage.PhoneBook, prefix: str, expected: list[str]
+    ) -> None:
+        assert phone_book.numbers_with_prefix(prefix) == expected
+
+    def test_numbers_with_prefix_limit(self, phone_book: storage.PhoneBook) -> None:
+        phone_book.insert("1", "0.0.0.2")
+
+        assert phone_book.numbers_with_prefix("1", limit=2) == ["1", "110"]
+
+    def test_numbers_with_prefix_sees_new_numbers(
+        self, phone_book: storage.PhoneBook, phone_book_path: str
+    ) -> None:
+        second_phone_book = storage.open_phone_book(phone_book_path)
+        phone_book.insert("119", "0.0.0.3")
+
+        assert second_phone_book.numbers_with_prefix("119") == ["119"]
+
+    def test_page(self, phone_book: storage.PhoneBook) -> None:
+        phone_book.insert("1", "0.0.0.9")
+
+        assert phone_book.page(limit=2) == [("1", "0.0.0.9"), ("110", "0.0.0.0")]
+        assert phone_book.page(after="110") == [("112", "0.0.0.1")]
+        assert phone_book.page(prefix="11", after="1") == [("110", "0.0.0.0"), ("112", "0.0.0.1")]
+
+    def test_page_by_address(self, phone_book: storage.PhoneBook) -> None:
+        phone_book.insert("1", "0.0.0.9")
+        phone_book.del_number("110")
+
+        assert phone_book.page(field="address") == [("112", "0.0.0.1"), ("1", "0.0.0.9")]
+        assert phone_book.page(prefix="0.0.0.9", field="address") == [("1", "0.0.0.9")]
+        with pytest.raises(ValueError):
+            phone_book.page(field="name")
+
+    def test_insert_many(self, phone_book: storage.PhoneBook) -> None:
+        conflicts = phone_book.insert_many(
+            [("113", "0.0.0.3"), ("110", "0.0.0.4"), ("114", "0.0.0.3"), ("115", "0.0.0.5")]
+        )
+
+        assert [(row, type(error)) for row, error in conflicts] == [
+            (1, storage.NumberExists),
+            (2, storage.AddressExists),
+        ]
+        assert phone_book.list_all() == [
+            ("110", "0.0.0.0"),
+            ("112", "0.0.0.1"),
+            ("113", "0.0.0.3"),
+            ("115", "0.0.0.5"),
+        ]
+
+    def test_apply_changes(self, phone_book: storage.PhoneBook) -> None:
+        phone_book.apply_changes(
+            [("110", None), ("112", "0.0.0.2"), ("113", "0.0.0.2"), ("114", "0.0.0.4"), ("999", None)]
+        )
+
+        assert phone_book.list_all() == [("113", "0.0.0.2"), ("114", "0.0.0.4")]
+
+    def test_iter_entries(self, phone_book: storage.PhoneBook) -> None:
+        phone_book.insert_many([(f"2{i:02}", f"1.0.0.{i}") for i in range(10)])
+
+        assert list(storage.iter_entries(phone_book, page_size=3)) == phone_book.list_all()
+
+    def test_revision(self, phone_book: storage.PhoneBook, phone_book_path: str) -> None:
+        second_phone_book = storage.open_phone_book(phone_book_path)
+        revision = second_phone_book.revision()
+        assert second_phone_book.revision() == revision
+
+        phone_book.insert("119", "0.0.0.3")
+
+        assert second_phone_book.revision() != revision
+
+
+class TestJsonPhoneBook:
+    def test_lookup_while_locked(self, tmp_path: pathlib.Path) -> None:
+        file_path = str(tmp_path / "phone_book.json")
+        storage.PhoneBook(file_path).insert("110", "0.0.0.0")
+        reader = storage.PhoneBook(file_path)
+        locked = threading.Event()
+        release = threading.Event()
+
+        def _hold_lock() -> None:
+            with filelock.FileLock(file_path + ".lock"):
+                locked.set()
+                release.wait(timeout=10)
+
+        holder = threading.Thread(target=_hold_lock)
+        holder.start()
+        try:
+            locked.wait(timeout=10)
+            assert reader.get_address("110") == "0.0.0.0"
+        finally:
+            release.set()
+            holder.join()
+
+
+def _wait_for(condition, timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture(params=["inotify", "polling"])
+def watched_phone_book(
+    tmp_path: pathlib.Path, request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch
+) -> storage.PhoneBook:
+    if request.param == "polling":
+        monkeypatch.setattr(
+            watch,
+            "watch_file",
+            functools.partial(_start_polling_watcher, interval=0.01),
+        )
+    phone_book = storage.PhoneBook(str(tmp_path / "phone_book.json"))
+    phone_book.start_watching()
+    yield phone_book
+    phone_book.stop_watching()
+
+
+def _start_polling_watcher(file_path, on_change, interval) -> watch.PollingWatcher:
+    watcher = watch.PollingWatcher(file_path, on_change, interval=interval)
+    watcher.start()
+    return watcher
+
+
+class TestWatchedPhoneBook:
+    def test_sees_changes_from_other_instance(
+        self, watched_phone_book: storage.PhoneBook
+    ) -> None:
+        writer = storage.PhoneBook(watched_phone_book.file_path)
+
+        writer.insert("110", "0.0.0.0")
+        assert _wait_for(lambda: watched_phone_book.list_all() == [("110", "0.0.0.0")])
+
+        writer.del_number("110")
+        assert _wait_for(lambda: watched_phone_book.list_all() == [])
+
+    def test_lookup_does_not_stat(
+        self, watched_phone_book: storage.PhoneBook, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        watched_phone_book.insert("110", "0.0.0.0")
+
+        def _fail() -> None:
+            raise AssertionError("Lookup checked the file")
+
+        monkeypatch.setattr(watched_phone_book, "_maybe_reload_phone_book", _fail)
+        assert watched_phone_book.get_address("110") == "0.0.0.0"
+        assert watched_phone_book.get_number("0.0.0.0") == "110"
+
+
+class TestChangeListener:
+    def test_own_changes(self, phone_book: storage.PhoneBook) -> None:
+        changes = []
+        phone_book.add_change_listener(
+            lambda added, removed: changes.append((set(added), set(removed)))
+        )
+
+        phone_book.insert("0000000", "0.0.0.9")
+        phone_book.del_number("110")
+
+        assert changes == [
+            ({"110", "112"}, set()),
+            ({"0000000"}, set()),
+            (set(), {"110"}),
+        ]
+
+    def test_other_instance(self, phone_book: storage.PhoneBook) -> None:
+        index = error_correction.NumberIndex(phone_book)
+        phone_book.start_watching()
+        try:
+            other = storage.open_phone_book(phone_book.file_path)
+            other.insert("5555555", "0.0.0.9")
+
+            assert _wait_for(lambda: len(index) == 1)
+            pulses = error_correction.as_pulse_counts([5, 5, 5, 5, 5, 5, 6])
+            assert index.within(pulses) == [
+                (error_correction.as_phone_number("5555555"), 1)
+            ]
+        finally:
+            phone_book.stop_watching()
+
+
+class TestMigrateToSqlite:
+    def test_migrate(
+        self,
+        tmp_path: pathlib.Path,
+        numbers_and_addresses: list[tuple[str, str]],
+    ) -> None:
+        json_phone_book = storage.PhoneBook(str(tmp_path / "phone_book.json"))
+        for number, address in numbers_and_addresses:
+            json_phone_book.insert(number, address)
+
+        count = storage.migrate_to_sqlite(
+            json_phone_book.file_path, str(tmp_path / "phone_book.sqlite")
+        )
+
+        sqlite_phone_book = storage.SqlitePhoneBook(str(tmp_path / "phone_book.sqlite"))
+        assert count == len(numbers_and_addresses)
+        assert sqlite_phone_book.list_all() == sorted(numbers_and_addresses)
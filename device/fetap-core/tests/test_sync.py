@@ -0,0 +1,83 @@
+"""Syncs against a local fetap_server.
+
+Needs the fetap_server package from server/fetap-server on the path.
+"""
+import pathlib
+from typing import Iterator
+
+import pytest
+
+fetap_server = pytest.importorskip("fetap_server")
+
+from fetap_server import directory, server
+from fetap import storage, sync
+
+
+@pytest.fixture()
+def directory_(tmp_path: pathlib.Path) -> directory.Directory:
+    directory_ = directory.Directory(str(tmp_path / "directory.sqlite"))
+    directory_.put("110", "sip:110@fetap.net")
+    directory_.put("112", "sip:112@fetap.net")
+    return directory_
+
+
+@pytest.fixture()
+def url(directory_: directory.Directory) -> Iterator[str]:
+    with server.serving(directory_) as http_server:
+        yield f"http://127.0.0.1:{http_server.server_address[1]}/directory"
+
+
+@pytest.fixture(params=[".json", ".sqlite"])
+def phone_book(tmp_path: pathlib.Path, request: pytest.FixtureRequest) -> storage.PhoneBook:
+    return storage.open_phone_book(str(tmp_path / f"phone_book{request.param}"))
+
+
+@pytest.fixture()
+def directory_sync(phone_book: storage.PhoneBook, url: str) -> sync.DirectorySync:
+    return sync.DirectorySync(phone_book, url, phone_book.file_path + ".sync")
+
+
+class TestDirectorySync:
+    def test_first_sync(
+        self, directory_sync: sync.DirectorySync, phone_book: storage.PhoneBook
+    ) -> None:
+        assert directory_sync.sync() == 2
+
+        assert phone_book.list_all() == [("110", "sip:110@fetap.net"), ("112", "sip:112@fetap.net")]
+        assert sync.load_state(directory_sync.state_path) == sync.SyncState(2, '"2"')
+
+    def test_only_changes(
+        self,
+        directory_sync: sync.DirectorySync,
+        directory_: directory.Directory,
+        phone_book: storage.PhoneBook,
+    ) -> None:
+        directory_sync.sync()
+        directory_.delete("110")
+        directory_.put("112", "sip:other@fetap.net")
+        directory_.put("113", "sip:113@fetap.net")
+
+        assert directory_sync.sync() == 3
+
+        assert phone_book.list_all() == [
+            ("112", "sip:other@fetap.net"),
+            ("113", "sip:113@fetap.net"),
+        ]
+
+    def test_unchanged(self, directory_sync: sync.DirectorySync, phone_book: storage.PhoneBook) -> None:
+        directory_sync.sync()
+        revision = phone_book.revision()
+
+        assert directory_sync.sync() == 0
+        assert phone_book.revision() == revision
+
+    def test_directory_wins(
+        self, directory_sync: sync.DirectorySync, phone_book: storage.PhoneBook
+    ) -> None:
+        phone_book.insert("999", "sip:110@fetap.net")
+
+        directory_sync.sync()
+
+        with pytest.raises(storage.NumberDoesNotExist):
+            phone_book.get_address("999")
+        assert phone_book.get_number("sip:110@fetap.net") == "110"
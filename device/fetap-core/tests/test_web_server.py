@@ -0,0 +1,199 @@
+import pathlib
+import socket
+import urllib.parse
+import urllib.request
+
+import pytest
+
+pytest.importorskip("flask")
+
+from fetap import error_correction, main, storage, web_server
+
+
+@pytest.fixture()
+def phone_book(tmp_path: pathlib.Path) -> storage.PhoneBook:
+    phone_book = storage.open_phone_book(str(tmp_path / "phone_book.json"))
+    phone_book.insert("1234567", "0.0.0.1")
+    return phone_book
+
+
+@pytest.fixture()
+def client(phone_book: storage.PhoneBook):
+    return web_server.create_app(phone_book).test_client()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class TestWebServer:
+    def test_list(self, client) -> None:
+        response = client.get("/")
+
+        assert response.status_code == 200
+        assert b"1234567" in response.data
+
+    def test_add(self, client, phone_book: storage.PhoneBook) -> None:
+        response = client.post("/add-number", data={"number": "7654321", "address": "0.0.0.2"})
+
+        assert response.status_code == 302
+        assert phone_book.get_address("7654321") == "0.0.0.2"
+
+    def test_too_similar(self, client, phone_book: storage.PhoneBook) -> None:
+        response = client.post("/add-number", data={"number": "1234568", "address": "0.0.0.2"})
+
+        assert response.status_code == 400
+        with pytest.raises(storage.NumberDoesNotExist):
+            phone_book.get_address("1234568")
+
+    @pytest.mark.parametrize(
+        "data, message",
+        [
+            ({"number": "7654321"}, b"address and number can't be None"),
+            ({"address": "0.0.0.2"}, b"address and number can't be None"),
+            ({"number": "1234567", "address": "0.0.0.2"}, b"Number exists"),
+            ({"number": "110", "address": "0.0.0.1"}, b"address exists"),
+        ],
+    )
+    def test_add_error(self, client, data: dict[str, str], message: bytes) -> None:
+        response = client.post("/add-number", data=data)
+
+        assert (response.status_code, response.data) == (400, message)
+
+
+class TestThreadedConfigServer:
+    def test_shares_phone_book(self, phone_book: storage.PhoneBook) -> None:
+        port = _free_port()
+        server = main.ThreadedConfigServer(
+            phone_book, error_correction.NumberIndex(phone_book), port=port
+        )
+        server.start()
+        try:
+            data = urllib.parse.urlencode({"number": "7654321", "address": "0.0.0.2"}).encode()
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/add-number", data) as response:
+                assert b"7654321" in response.read()
+        finally:
+            server.stop()
+
+        # The same instance, no reload from the file needed
+        assert phone_book.numbers_with_prefix("765", should_reload=False) == ["7654321"]
+
+
+@pytest.fixture()
+def big_client(tmp_path: pathlib.Path):
+    phone_book = storage.open_phone_book(str(tmp_path / "phone_book.sqlite"))
+    for i in range(25):
+        phone_book.insert(f"{i:03}", f"10.0.0.{99 - i}")
+    return web_server.create_app(phone_book).test_client()
+
+
+class TestEntries:
+    def test_pages(self, big_client) -> None:
+        numbers = []
+        after = ""
+        while True:
+            page = big_client.get("/api/entries", query_string={"limit": 10, "after": after}).json
+            numbers.extend(entry["number"] for entry in page["entries"])
+            if page["next"] is None:
+                break
+            after = page["next"]
+
+        assert numbers == [f"{i:03}" for i in range(25)]
+
+    def test_prefix(self, big_client) -> None:
+        page = big_client.get("/api/entries", query_string={"prefix": "01"}).json
+
+        assert [entry["number"] for entry in page["entries"]] == [f"{i:03}" for i in range(10, 20)]
+        assert page["next"] is None
+
+    def test_address(self, big_client) -> None:
+        page = big_client.get(
+            "/api/entries", query_string={"field": "address", "prefix": "10.0.0.8", "limit": 3}
+        ).json
+
+        assert page["entries"] == [
+            {"number": "019", "address": "10.0.0.80"},
+            {"number": "018", "address": "10.0.0.81"},
+            {"number": "017", "address": "10.0.0.82"},
+        ]
+        assert page["next"] == "10.0.0.82"
+
+    @pytest.mark.parametrize("path", ["/", "/api/entries"])
+    def test_not_modified(self, client, phone_book: storage.PhoneBook, path: str) -> None:
+        etag = client.get(path).headers["ETag"]
+
+        assert client.get(path, headers={"If-None-Match": etag}).status_code == 304
+
+        phone_book.insert("7654321", "0.0.0.2")
+
+        response = client.get(path, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert b"7654321" in response.data
+
+    def test_html_next(self, big_client) -> None:
+        response = big_client.get("/", query_string={"limit": 10})
+
+        assert b"009" in response.data
+        assert b"010" not in response.data
+        assert b"after=009" in response.data
+
+
+class TestBulk:
+    def test_import_csv(self, client, phone_book: storage.PhoneBook) -> None:
+        upload = "number,address\n7654321,0.0.0.2\n7654322,0.0.0.1\n7654322,0.0.0.3\n"
+
+        response = client.post("/api/import", data=upload, content_type="text/csv")
+
+        assert response.status_code == 200
+        assert response.json == {
+            "imported": 2,
+            "conflicts": [
+                {"row": 2, "number": "7654322", "address": "0.0.0.1", "error": "AddressExists"},
+            ],
+            "invalid": [],
+        }
+        assert phone_book.get_address("7654322") == "0.0.0.3"
+
+    def test_import_jsonl(self, big_client) -> None:
+        upload = '{"number": "100", "address": "0.0.0.2"}\n\n{"number": "000", "address": "0.0.0.3"}\n'
+
+        response = big_client.post("/api/import?format=jsonl", data=upload)
+
+        assert response.json["imported"] == 1
+        assert response.json["conflicts"][0]["error"] == "NumberExists"
+
+    def test_import_invalid(self, client, phone_book: storage.PhoneBook) -> None:
+        upload = '{"number": "7654321", "address": "0.0.0.2"}\n{"number": "7654322"}\n[]\n'
+
+        response = client.post("/api/import", data=upload, content_type="application/x-ndjson")
+
+        assert response.status_code == 400
+        assert response.json["invalid"] == [2, 3]
+        with pytest.raises(storage.NumberDoesNotExist):
+            phone_book.get_address("7654321")
+
+    def test_import_malformed(self, client) -> None:
+        response = client.post("/api/import?format=jsonl", data="{")
+
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize("format", ["csv", "jsonl"])
+    def test_round_trip(self, big_client, tmp_path: pathlib.Path, format: str) -> None:
+        exported = big_client.get("/api/export", query_string={"format": format}).data
+        other = web_server.create_app(
+            storage.open_phone_book(str(tmp_path / "other.json"))
+        ).test_client()
+
+        response = other.post("/api/import", query_string={"format": format}, data=exported)
+
+        assert response.json["imported"] == 25
+        assert other.get("/api/export", query_string={"format": format}).data == exported
+
+    def test_export_empty(self, tmp_path: pathlib.Path) -> None:
+        client = web_server.create_app(
+            storage.open_phone_book(str(tmp_path / "phone_book.json"))
+        ).test_client()
+
+        assert client.get("/api/export").data == b"number,address\r\n"
@@ -0,0 +1,110 @@
+import argparse
+import logging
+import os
+import tempfile
+
+from fetap_server import asterisk, directory, server
+
+
+def serve(args: argparse.Namespace) -> None:
+    directory_ = directory.Directory(args.database)
+    token = os.environ.get("FETAP_TOKEN") or None
+    if token is None and args.insecure:
+        logging.warning("FETAP_TOKEN is not set, anyone can change the directory")
+    elif token is None:
+        logging.warning("FETAP_TOKEN is not set, the directory is read only")
+    http_server = server.make_server(
+        directory_, args.host, args.port, token=token, insecure=args.insecure
+    )
+    if args.asterisk_conf is not None:
+        asterisk.AsteriskSync(
+            directory_,
+            args.asterisk_conf,
+            _sip_secret(),
+            # Empty to only write the files
+            command=args.asterisk_command or None,
+        ).start()
+    logging.info("Serving %s on %s:%s", args.database, args.host, args.port)
+    http_server.serve_forever()
+
+
+def asterisk_config(args: argparse.Namespace) -> None:
+    """Write the Asterisk config once"""
+    changed = asterisk.write_config(
+        args.conf_dir, asterisk.numbers(directory.Directory(args.database)), _sip_secret()
+    )
+    if args.reload:
+        asterisk.reload(changed, args.asterisk_command)
+    print(f"Changed: {', '.join(changed) or 'nothing'}")
+
+
+def sip_password(args: argparse.Namespace) -> None:
+    print(asterisk.sip_password(_sip_secret(), args.number))
+
+
+def benchmark_asterisk(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as conf_dir:
+        timings = asterisk.benchmark(args.count, conf_dir)
+    for name, seconds in timings.items():
+        print(f"{name:<10}{seconds * 1000:>10.1f} ms")
+
+
+def _sip_secret() -> str:
+    secret = os.environ.get("FETAP_SIP_SECRET")
+    if not secret:
+        raise SystemExit("FETAP_SIP_SECRET must be set, the SIP passwords are derived from it")
+    return secret
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="fetap_server")
+    parser.add_argument(
+        "--database", default=os.environ.get("FETAP_DIRECTORY", "directory.sqlite")
+    )
+    commands = parser.add_subparsers(required=True)
+
+    serve_parser = commands.add_parser("serve", help="Serve the directory")
+    serve_parser.add_argument("--host", default="0.0.0.0")
+    serve_parser.add_argument(
+        "--port", type=int, default=int(os.environ.get("FETAP_PORT", "8000"))
+    )
+    serve_parser.add_argument(
+        "--insecure",
+        action="store_true",
+        help="Let anyone change the directory if FETAP_TOKEN is not set",
+    )
+    serve_parser.add_argument(
+        "--asterisk-conf",
+        default=os.environ.get("FETAP_ASTERISK_CONF"),
+        help="Keep the generated Asterisk config in this directory up to date",
+    )
+    serve_parser.set_defaults(function=serve)
+
+    config_parser = commands.add_parser("asterisk-config", help="Write the Asterisk config once")
+    config_parser.add_argument("conf_dir")
+    config_parser.add_argument("--reload", action="store_true")
+    config_parser.set_defaults(function=asterisk_config)
+
+    for command_parser in (serve_parser, config_parser):
+        command_parser.add_argument(
+            "--asterisk-command",
+            default=os.environ.get("FETAP_ASTERISK_COMMAND", "asterisk -rx"),
+            help="Runs an Asterisk CLI command, for reloading",
+        )
+
+    password_parser = commands.add_parser("sip-password", help="The SIP password of a number")
+    password_parser.add_argument("number")
+    password_parser.set_defaults(function=sip_password)
+
+    benchmark_parser = commands.add_parser(
+        "benchmark-asterisk", help="Time generating the Asterisk config"
+    )
+    benchmark_parser.add_argument("--count", type=int, default=10_000)
+    benchmark_parser.set_defaults(function=benchmark_asterisk)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    args.function(args)
+
+
+main()
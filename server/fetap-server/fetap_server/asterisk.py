@@ -0,0 +1,212 @@
+"""Generates the Asterisk endpoints and dialplan from the directory.
+
+Every number gets an endpoint, auth and aor section named after it in
+pjsip.conf, and an extension that dials it in extensions.conf. Both files go
+to a directory that the hand written config includes. Passwords are derived
+from a secret with HMAC, so the directory does not need to store them and
+`python -m fetap_server sip-password NUMBER` prints the one to put on a phone.
+
+A file is only written when its content changed, and then only the module
+that reads it is reloaded, so adding a phone needs no restart.
+"""
+from __future__ import annotations
+import base64
+import hashlib
+import hmac
+import os
+import shlex
+import subprocess
+import threading
+import time
+from typing import Iterable, Optional, Sequence
+
+import logging
+
+from fetap_server import directory
+
+log = logging.getLogger(__name__)
+
+PJSIP_FILE = "pjsip.conf"
+EXTENSIONS_FILE = "extensions.conf"
+# The Asterisk command that makes it read each file again
+RELOAD_COMMANDS = {
+    PJSIP_FILE: "module reload res_pjsip.so",
+    EXTENSIONS_FILE: "dialplan reload",
+}
+# The dialplan context the numbers are in, for `include =>`
+CONTEXT = "directory"
+SYNC_INTERVAL = 5
+
+
+def sip_password(secret: str, number: str) -> str:
+    digest = hmac.new(secret.encode(), number.encode(), hashlib.sha256).digest()
+    return base64.b32encode(digest[:15]).decode().lower()
+
+
+def render_pjsip(numbers: Iterable[str], secret: str) -> str:
+    parts = ["; Generated by fetap_server from the directory, don't edit\n"]
+    for number in numbers:
+        parts.append(
+            f"\n[{number}]\n"
+            "type=endpoint\n"
+            "context=internal\n"
+            "disallow=all\n"
+            "allow=ulaw\n"
+            f"auth={number}\n"
+            f"aors={number}\n"
+            f"\n[{number}]\n"
+            "type=auth\n"
+            "auth_type=userpass\n"
+            f"username={number}\n"
+            f"password={sip_password(secret, number)}\n"
+            f"\n[{number}]\n"
+            "type=aor\n"
+            "max_contacts=1\n"
+        )
+    return "".join(parts)
+
+
+def render_extensions(numbers: Iterable[str]) -> str:
+    parts = [f"; Generated by fetap_server from the directory, don't edit\n\n[{CONTEXT}]\n"]
+    for number in numbers:
+        parts.append(
+            f"exten => {number},1,NoOp(Call from ${{CALLERID(num)}} to {number})\n"
+            f" same => n,Dial(PJSIP/{number})\n"
+            " same => n,Hangup()\n"
+        )
+    return "".join(parts)
+
+
+def _write_if_changed(file_path: str, content: str) -> bool:
+    try:
+        with open(file_path) as f:
+            if f.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "w") as f:
+        f.write(content)
+    # Asterisk never sees half a file
+    os.replace(temp_path, file_path)
+    return True
+
+
+def write_config(conf_dir: str, numbers: Sequence[str], secret: str) -> list[str]:
+    """Write the config files of the numbers, returns the files that changed"""
+    contents = {
+        PJSIP_FILE: render_pjsip(numbers, secret),
+        EXTENSIONS_FILE: render_extensions(numbers),
+    }
+    return [
+        file_name
+        for file_name, content in contents.items()
+        if _write_if_changed(os.path.join(conf_dir, file_name), content)
+    ]
+
+
+def reload(changed: Iterable[str], command: str = "asterisk -rx") -> None:
+    """Make Asterisk read the changed files again.
+
+    command runs a CLI command on Asterisk, it must reach its control socket.
+    """
+    for file_name in changed:
+        log.info("Reloading %s", file_name)
+        subprocess.run([*shlex.split(command), RELOAD_COMMANDS[file_name]], check=True)
+
+
+def numbers(directory_: directory.Directory) -> list[str]:
+    """The numbers that can be endpoints, anything else could break the config"""
+    valid = []
+    for number, _ in directory_.entries():
+        if number.isascii() and number.isdigit():
+            valid.append(number)
+        else:
+            log.warning("Leaving %r out of the Asterisk config, it is not a number", number)
+    return valid
+
+
+class AsteriskSync:
+    """Regenerates the config whenever the directory's revision changes"""
+
+    def __init__(
+        self,
+        directory_: directory.Directory,
+        conf_dir: str,
+        secret: str,
+        command: Optional[str] = "asterisk -rx",
+        interval: float = SYNC_INTERVAL,
+    ) -> None:
+        self.directory = directory_
+        self.conf_dir = conf_dir
+        self.secret = secret
+        # None to only write the files
+        self.command = command
+        self.interval = interval
+        self._revision: Optional[int] = None
+        # Written but not reloaded yet, because reloading failed
+        self._not_reloaded: set[str] = set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sync(self) -> list[str]:
+        """Write the config if the directory changed, returns the files that changed"""
+        revision = self.directory.revision()
+        changed: list[str] = []
+        if revision != self._revision:
+            start = time.perf_counter()
+            changed = write_config(self.conf_dir, numbers(self.directory), self.secret)
+            log.info(
+                "Generated the config of revision %s in %.3fs",
+                revision,
+                time.perf_counter() - start,
+            )
+            self._revision = revision
+            self._not_reloaded.update(changed)
+        if self._not_reloaded and self.command is not None:
+            reload(sorted(self._not_reloaded), self.command)
+            self._not_reloaded.clear()
+        return changed
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._mainloop, daemon=True, name="asterisk")
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _mainloop(self) -> None:
+        """asterisk mainloop"""
+        while True:
+            try:
+                self.sync()
+            except (OSError, subprocess.CalledProcessError):
+                # Tried again at the next interval
+                log.exception("Updating the Asterisk config failed")
+            if self._stop.wait(self.interval):
+                return
+
+
+def benchmark(count: int, conf_dir: str) -> dict[str, float]:
+    """Seconds to fill a directory with count numbers and generate their config"""
+    directory_ = directory.Directory(os.path.join(conf_dir, "benchmark.sqlite"))
+    with directory_._connection as connection:
+        connection.executemany(
+            "INSERT INTO entries (number, address, revision) VALUES (?, ?, 1)",
+            ((f"{i:06}", f"sip:{i:06}@fetap.net") for i in range(count)),
+        )
+    timings = {}
+    start = time.perf_counter()
+    numbers_ = numbers(directory_)
+    timings["read"] = time.perf_counter() - start
+    start = time.perf_counter()
+    write_config(conf_dir, numbers_, "benchmark")
+    timings["generate"] = time.perf_counter() - start
+    start = time.perf_counter()
+    write_config(conf_dir, numbers_, "benchmark")
+    timings["unchanged"] = time.perf_counter() - start
+    return timings
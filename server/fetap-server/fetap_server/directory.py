@@ -0,0 +1,127 @@
+"""The authoritative directory of numbers and SIP addresses, in SQLite.
+
+Every change gets the next revision number. Each number keeps the revision of
+its last change, and removed numbers stay as tombstones with no address, so
+the changes since any revision are a range on the revision index. A device
+that synced up to revision N only ever downloads what changed after N, at most
+one change per number.
+"""
+from __future__ import annotations
+import sqlite3
+import threading
+from typing import NamedTuple, Optional
+
+
+class DirectoryError(Exception): pass
+class AddressExists(DirectoryError): pass
+class NumberDoesNotExist(DirectoryError): pass
+
+
+class Change(NamedTuple):
+    number: str
+    # None if the number was removed
+    address: Optional[str]
+    revision: int
+
+
+class Directory:
+    def __init__(self, file_path: str) -> None:
+        self.file_path = file_path
+        self._local = threading.local()
+        with self._connection as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "number TEXT PRIMARY KEY, address TEXT, revision INTEGER NOT NULL"
+                ")"
+            )
+            connection.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS entries_address "
+                "ON entries (address) WHERE address IS NOT NULL"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS entries_revision ON entries (revision)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS revision ("
+                "id INTEGER PRIMARY KEY CHECK (id = 0), value INTEGER NOT NULL"
+                ")"
+            )
+            connection.execute("INSERT OR IGNORE INTO revision (id, value) VALUES (0, 0)")
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.file_path)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            # Changes take the write lock right away, so two of them can't
+            # read the same revision
+            connection.isolation_level = "IMMEDIATE"
+            self._local.connection = connection
+        return connection
+
+    def revision(self) -> int:
+        return self._connection.execute("SELECT value FROM revision").fetchone()[0]
+
+    def _next_revision(self, connection: sqlite3.Connection) -> int:
+        connection.execute("UPDATE revision SET value = value + 1")
+        return connection.execute("SELECT value FROM revision").fetchone()[0]
+
+    def put(self, number: str, address: str) -> int:
+        """Add the number or change its address, returns the new revision"""
+        with self._connection as connection:
+            row = connection.execute(
+                "SELECT address FROM entries WHERE number = ?", (number,)
+            ).fetchone()
+            if row is not None and row[0] == address:
+                return self.revision()
+            revision = self._next_revision(connection)
+            try:
+                connection.execute(
+                    "INSERT INTO entries (number, address, revision) VALUES (?, ?, ?) "
+                    "ON CONFLICT (number) DO UPDATE SET "
+                    "address = excluded.address, revision = excluded.revision",
+                    (number, address, revision),
+                )
+            except sqlite3.IntegrityError as e:
+                raise AddressExists(address) from e
+        return revision
+
+    def delete(self, number: str) -> int:
+        """Remove the number, returns the new revision"""
+        with self._connection as connection:
+            row = connection.execute(
+                "SELECT address FROM entries WHERE number = ?", (number,)
+            ).fetchone()
+            if row is None or row[0] is None:
+                raise NumberDoesNotExist(number)
+            revision = self._next_revision(connection)
+            connection.execute(
+                "UPDATE entries SET address = NULL, revision = ? WHERE number = ?",
+                (revision, number),
+            )
+        return revision
+
+    def changes_since(self, revision: int) -> tuple[int, list[Change]]:
+        """The current revision and the last change of each number after revision.
+
+        Removals are only included when revision is not 0, a device that
+        starts from nothing has nothing to remove.
+        """
+        # The revision first, a change made in between is then sent again next
+        # time instead of being missed
+        current = self.revision()
+        rows = self._connection.execute(
+            "SELECT number, address, revision FROM entries "
+            "WHERE revision > ? AND (address IS NOT NULL OR ? > 0) ORDER BY revision",
+            (revision, revision),
+        ).fetchall()
+        return current, [Change(*row) for row in rows]
+
+    def entries(self) -> list[tuple[str, str]]:
+        """The numbers and addresses, without removed numbers, ordered by number"""
+        return self._connection.execute(
+            "SELECT number, address FROM entries WHERE address IS NOT NULL ORDER BY number"
+        ).fetchall()
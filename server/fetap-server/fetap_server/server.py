@@ -0,0 +1,173 @@
+"""Serves the directory over HTTP, with only the standard library.
+
+GET /directory?since=N answers with the current revision and the changes
+after revision N as JSON:
+
+    {"revision": 12, "changes": [{"number": "110", "address": "sip:..."}, ...]}
+
+A removed number has a null address. The ETag is the current revision, so a
+device that is up to date gets a 304 without the directory being read, and
+responses are gzipped for clients that accept it.
+
+PUT /directory/<number> with {"address": ...} adds or changes a number and
+DELETE /directory/<number> removes it. Changes need the server's token as
+"Authorization: Bearer <token>". Without a token the directory is read only,
+unless the server is explicitly insecure.
+"""
+from __future__ import annotations
+import contextlib
+import gzip
+import hmac
+import http.server
+import json
+import threading
+import urllib.parse
+from typing import Any, Iterator, Optional
+
+import logging
+
+from fetap_server import directory
+
+log = logging.getLogger(__name__)
+
+# Smaller responses fit in a packet anyway
+_MIN_GZIP_SIZE = 512
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    directory: directory.Directory
+    token: Optional[str]
+    insecure: bool
+
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status: int, value: Any, etag: Optional[str] = None) -> None:
+        body = json.dumps(value).encode()
+        accepts_gzip = "gzip" in self.headers.get("Accept-Encoding", "")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if etag is not None:
+            self.send_header("ETag", etag)
+        if accepts_gzip and len(body) >= _MIN_GZIP_SIZE:
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_status(self, status: int, etag: Optional[str] = None) -> None:
+        self.send_response(status)
+        if etag is not None:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != "/directory":
+            self.send_error(404)
+            return
+        try:
+            since = int(urllib.parse.parse_qs(url.query).get("since", ["0"])[0])
+        except ValueError:
+            self.send_error(400, "since must be a revision number")
+            return
+        etag = f'"{self.directory.revision()}"'
+        if etag in self.headers.get("If-None-Match", ""):
+            self._send_status(304, etag)
+            return
+        revision, changes = self.directory.changes_since(since)
+        self._send_json(
+            200,
+            {
+                "revision": revision,
+                "changes": [{"number": c.number, "address": c.address} for c in changes],
+            },
+            # The revision the changes go up to, it can be newer than etag
+            etag=f'"{revision}"',
+        )
+
+    def _number(self) -> Optional[str]:
+        prefix = "/directory/"
+        path = urllib.parse.urlsplit(self.path).path
+        if not path.startswith(prefix) or len(path) == len(prefix):
+            self.send_error(404)
+            return None
+        if self.token is not None:
+            authorization = self.headers.get("Authorization", "")
+            if not hmac.compare_digest(authorization, f"Bearer {self.token}"):
+                self.send_error(401)
+                return None
+        elif not self.insecure:
+            self.send_error(403, "The directory is read only without a token")
+            return None
+        return urllib.parse.unquote(path[len(prefix):])
+
+    def do_PUT(self) -> None:
+        number = self._number()
+        if number is None:
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", "0"))))
+            address = body["address"]
+        except (ValueError, TypeError, KeyError):
+            self.send_error(400, 'Expected {"address": ...}')
+            return
+        if not isinstance(address, str) or not address:
+            self.send_error(400, "address must be a string")
+            return
+        try:
+            revision = self.directory.put(number, address)
+        except directory.AddressExists:
+            self.send_error(409, "address exists")
+            return
+        self._send_json(200, {"revision": revision})
+
+    def do_DELETE(self) -> None:
+        number = self._number()
+        if number is None:
+            return
+        try:
+            revision = self.directory.delete(number)
+        except directory.NumberDoesNotExist:
+            self.send_error(404, "number does not exist")
+            return
+        self._send_json(200, {"revision": revision})
+
+    def log_message(self, format: str, *args: Any) -> None:
+        log.info(format, *args)
+
+
+def make_server(
+    directory_: directory.Directory,
+    host: str = "0.0.0.0",
+    port: int = 8000,
+    token: Optional[str] = None,
+    insecure: bool = False,
+) -> http.server.ThreadingHTTPServer:
+    """Without a token, changes are refused unless insecure"""
+    handler = type(
+        "Handler",
+        (_Handler,),
+        {"directory": directory_, "token": token, "insecure": insecure},
+    )
+    return http.server.ThreadingHTTPServer((host, port), handler)
+
+
+@contextlib.contextmanager
+def serving(
+    directory_: directory.Directory,
+    host: str = "127.0.0.1",
+    port: int = 0,
+    token: Optional[str] = None,
+    insecure: bool = False,
+) -> Iterator[http.server.ThreadingHTTPServer]:
+    """Serve on a thread, port 0 picks a free port"""
+    server = make_server(directory_, host, port, token, insecure)
+    thread = threading.Thread(target=server.serve_forever, daemon=True, name="directory")
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
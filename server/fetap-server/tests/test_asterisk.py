@@ -0,0 +1,128 @@
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+from fetap_server import asterisk, directory
+
+SECRET = "secret"
+
+
+@pytest.fixture()
+def directory_(tmp_path: pathlib.Path) -> directory.Directory:
+    directory_ = directory.Directory(str(tmp_path / "directory.sqlite"))
+    directory_.put("1000", "sip:1000@fetap.net")
+    directory_.put("1001", "sip:1001@fetap.net")
+    return directory_
+
+
+@pytest.fixture()
+def conf_dir(tmp_path: pathlib.Path) -> pathlib.Path:
+    conf_dir = tmp_path / "conf"
+    conf_dir.mkdir()
+    return conf_dir
+
+
+@pytest.fixture()
+def reloads(tmp_path: pathlib.Path) -> pathlib.Path:
+    """Where the fake Asterisk command writes the commands it got"""
+    return tmp_path / "reloads.txt"
+
+
+@pytest.fixture()
+def command(tmp_path: pathlib.Path, reloads: pathlib.Path) -> str:
+    script = tmp_path / "fake_asterisk.py"
+    script.write_text(
+        "import sys\n"
+        f"with open({str(reloads)!r}, 'a') as f:\n"
+        "    f.write(sys.argv[1] + '\\n')\n"
+    )
+    return f"{sys.executable} {script}"
+
+
+class TestRender:
+    def test_pjsip(self) -> None:
+        config = asterisk.render_pjsip(["1000"], SECRET)
+
+        assert "[1000]\ntype=endpoint\n" in config
+        assert "[1000]\ntype=aor\n" in config
+        assert f"password={asterisk.sip_password(SECRET, '1000')}\n" in config
+
+    def test_extensions(self) -> None:
+        config = asterisk.render_extensions(["1000"])
+
+        assert "[directory]\n" in config
+        assert "exten => 1000,1," in config
+        assert " same => n,Dial(PJSIP/1000)\n" in config
+
+    def test_passwords(self) -> None:
+        password = asterisk.sip_password(SECRET, "1000")
+
+        assert password == asterisk.sip_password(SECRET, "1000")
+        assert password != asterisk.sip_password(SECRET, "1001")
+        assert password != asterisk.sip_password("other", "1000")
+        assert len(password) == 24
+
+    def test_only_numbers(self, directory_: directory.Directory) -> None:
+        directory_.put("1002]\n[evil", "sip:evil@fetap.net")
+
+        assert asterisk.numbers(directory_) == ["1000", "1001"]
+
+
+class TestAsteriskSync:
+    def test_writes_and_reloads(
+        self,
+        directory_: directory.Directory,
+        conf_dir: pathlib.Path,
+        command: str,
+        reloads: pathlib.Path,
+    ) -> None:
+        sync = asterisk.AsteriskSync(directory_, str(conf_dir), SECRET, command)
+
+        assert sync.sync() == [asterisk.PJSIP_FILE, asterisk.EXTENSIONS_FILE]
+
+        assert "[1001]" in (conf_dir / asterisk.PJSIP_FILE).read_text()
+        assert reloads.read_text().splitlines() == ["dialplan reload", "module reload res_pjsip.so"]
+
+    def test_unchanged(
+        self,
+        directory_: directory.Directory,
+        conf_dir: pathlib.Path,
+        command: str,
+        reloads: pathlib.Path,
+    ) -> None:
+        sync = asterisk.AsteriskSync(directory_, str(conf_dir), SECRET, command)
+        sync.sync()
+        reloads.unlink()
+
+        # A new revision with the same numbers only changes the address
+        directory_.put("1000", "sip:other@fetap.net")
+
+        assert sync.sync() == []
+        assert not reloads.exists()
+
+    def test_retries_reload(
+        self,
+        directory_: directory.Directory,
+        conf_dir: pathlib.Path,
+        command: str,
+        reloads: pathlib.Path,
+    ) -> None:
+        sync = asterisk.AsteriskSync(directory_, str(conf_dir), SECRET, "false")
+        with pytest.raises(subprocess.CalledProcessError):
+            sync.sync()
+
+        sync.command = command
+        sync.sync()
+
+        assert len(reloads.read_text().splitlines()) == 2
+
+
+class TestBenchmark:
+    def test_10k_endpoints(self, conf_dir: pathlib.Path) -> None:
+        timings = asterisk.benchmark(10_000, str(conf_dir))
+
+        # Well below the sync interval, so a change is live within seconds
+        assert timings["generate"] < 2
+        assert (conf_dir / asterisk.PJSIP_FILE).read_text().count("type=endpoint") == 10_000
@@ -0,0 +1,69 @@
+import pathlib
+
+import pytest
+
+from fetap_server import directory
+
+
+@pytest.fixture()
+def directory_(tmp_path: pathlib.Path) -> directory.Directory:
+    directory_ = directory.Directory(str(tmp_path / "directory.sqlite"))
+    directory_.put("110", "sip:110@fetap.net")
+    directory_.put("112", "sip:112@fetap.net")
+    return directory_
+
+
+class TestDirectory:
+    def test_revisions(self, directory_: directory.Directory) -> None:
+        assert directory_.revision() == 2
+
+        assert directory_.put("113", "sip:113@fetap.net") == 3
+        assert directory_.delete("110") == 4
+
+    def test_unchanged_put(self, directory_: directory.Directory) -> None:
+        assert directory_.put("110", "sip:110@fetap.net") == 2
+
+    def test_changes_since(self, directory_: directory.Directory) -> None:
+        directory_.put("110", "sip:other@fetap.net")
+        directory_.delete("112")
+
+        assert directory_.changes_since(1) == (
+            4,
+            [
+                directory.Change("110", "sip:other@fetap.net", 3),
+                directory.Change("112", None, 4),
+            ],
+        )
+        assert directory_.changes_since(4) == (4, [])
+
+    def test_changes_since_0_has_no_removals(self, directory_: directory.Directory) -> None:
+        directory_.delete("112")
+
+        assert directory_.changes_since(0) == (3, [directory.Change("110", "sip:110@fetap.net", 1)])
+
+    def test_address_exists(self, directory_: directory.Directory) -> None:
+        with pytest.raises(directory.AddressExists):
+            directory_.put("113", "sip:110@fetap.net")
+
+        assert directory_.revision() == 2
+
+    def test_removed_address_can_be_reused(self, directory_: directory.Directory) -> None:
+        directory_.delete("110")
+
+        directory_.put("113", "sip:110@fetap.net")
+
+    def test_delete_missing(self, directory_: directory.Directory) -> None:
+        directory_.delete("110")
+
+        with pytest.raises(directory.NumberDoesNotExist):
+            directory_.delete("110")
+
+    def test_entries(self, directory_: directory.Directory) -> None:
+        directory_.delete("110")
+
+        assert directory_.entries() == [("112", "sip:112@fetap.net")]
+
+    def test_persists(self, directory_: directory.Directory) -> None:
+        reopened = directory.Directory(directory_.file_path)
+
+        assert reopened.changes_since(0) == directory_.changes_since(0)
@@ -0,0 +1,120 @@
+import gzip
+import json
+import pathlib
+import urllib.error
+import urllib.request
+from typing import Any, Iterator, Optional
+
+import pytest
+
+from fetap_server import directory, server
+
+TOKEN = "secret"
+
+
+@pytest.fixture()
+def directory_(tmp_path: pathlib.Path) -> directory.Directory:
+    return directory.Directory(str(tmp_path / "directory.sqlite"))
+
+
+@pytest.fixture()
+def url(directory_: directory.Directory) -> Iterator[str]:
+    with server.serving(directory_, token=TOKEN) as http_server:
+        yield f"http://127.0.0.1:{http_server.server_address[1]}/directory"
+
+
+def _request(
+    url: str, method: str = "GET", body: Any = None, headers: Optional[dict[str, str]] = None
+) -> tuple[int, dict[str, str], bytes]:
+    data = None if body is None else json.dumps(body).encode()
+    request = urllib.request.Request(url, data=data, method=method, headers=headers or {})
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, dict(response.headers), response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, dict(e.headers), e.read()
+
+
+AUTHORIZED = {"Authorization": f"Bearer {TOKEN}"}
+
+
+class TestServer:
+    def test_put_and_get(self, url: str) -> None:
+        status, _, body = _request(
+            f"{url}/110", "PUT", {"address": "sip:110@fetap.net"}, AUTHORIZED
+        )
+        assert (status, json.loads(body)) == (200, {"revision": 1})
+
+        status, headers, body = _request(url)
+
+        assert status == 200
+        assert headers["ETag"] == '"1"'
+        assert json.loads(body) == {
+            "revision": 1,
+            "changes": [{"number": "110", "address": "sip:110@fetap.net"}],
+        }
+
+    def test_delete(self, url: str, directory_: directory.Directory) -> None:
+        directory_.put("110", "sip:110@fetap.net")
+
+        assert _request(f"{url}/110", "DELETE", headers=AUTHORIZED)[0] == 200
+        assert _request(f"{url}/110", "DELETE", headers=AUTHORIZED)[0] == 404
+
+        _, _, body = _request(f"{url}?since=1")
+        assert json.loads(body)["changes"] == [{"number": "110", "address": None}]
+
+    def test_needs_token(self, url: str) -> None:
+        status, _, _ = _request(f"{url}/110", "PUT", {"address": "sip:110@fetap.net"})
+
+        assert status == 401
+
+    @pytest.mark.parametrize("method", ["PUT", "DELETE"])
+    def test_read_only_without_token(
+        self, directory_: directory.Directory, method: str
+    ) -> None:
+        directory_.put("110", "sip:110@fetap.net")
+        with server.serving(directory_) as http_server:
+            url = f"http://127.0.0.1:{http_server.server_address[1]}/directory"
+            status, _, _ = _request(f"{url}/110", method, {"address": "sip:112@fetap.net"})
+
+            assert status == 403
+            assert _request(url)[0] == 200
+        assert directory_.revision() == 1
+
+    def test_insecure(self, directory_: directory.Directory) -> None:
+        with server.serving(directory_, insecure=True) as http_server:
+            url = f"http://127.0.0.1:{http_server.server_address[1]}/directory"
+            status, _, _ = _request(f"{url}/110", "PUT", {"address": "sip:110@fetap.net"})
+
+        assert status == 200
+
+    def test_conflict(self, url: str, directory_: directory.Directory) -> None:
+        directory_.put("110", "sip:110@fetap.net")
+
+        status, _, _ = _request(f"{url}/112", "PUT", {"address": "sip:110@fetap.net"}, AUTHORIZED)
+
+        assert status == 409
+
+    def test_not_modified(self, url: str, directory_: directory.Directory) -> None:
+        directory_.put("110", "sip:110@fetap.net")
+        _, headers, _ = _request(url)
+
+        status, _, body = _request(f"{url}?since=1", headers={"If-None-Match": headers["ETag"]})
+        assert (status, body) == (304, b"")
+
+        directory_.put("112", "sip:112@fetap.net")
+
+        status, _, _ = _request(f"{url}?since=1", headers={"If-None-Match": headers["ETag"]})
+        assert status == 200
+
+    def test_gzip(self, url: str, directory_: directory.Directory) -> None:
+        for i in range(100):
+            directory_.put(f"{i:03}", f"sip:{i:03}@fetap.net")
+
+        _, headers, body = _request(url, headers={"Accept-Encoding": "gzip"})
+
+        assert headers["Content-Encoding"] == "gzip"
+        assert len(json.loads(gzip.decompress(body))["changes"]) == 100
+
+    def test_bad_since(self, url: str) -> None:
+        assert _request(f"{url}?since=latest")[0] == 400